@@ -0,0 +1,240 @@
+"""
+Recompute stored citation/brand metrics for completed prompts.
+
+update_prompt_result() is the only path that writes appeared_links_unique,
+my_citations, competitor_citations and the three counts, so a change to
+build_metrics or _clean_link leaves every older row stale. This command
+streams completed rows through a server-side cursor in id order, recomputes
+build_metrics(response_text, appeared_links, website, competitor_websites) in
+a process pool, and writes back only the rows whose metrics changed, as one
+multi-row UPDATE ... FROM (VALUES ...) per batch.
+
+Progress is checkpointed (last written id + counters) after every batch, so an
+interrupted run resumes where it stopped. The checkpoint records a hash of the
+metrics modules; editing one of them starts the next run from the beginning.
+
+    python backfill_metrics.py
+    python backfill_metrics.py --workers 8 --batch-size 500 --engine chatgpt
+    python backfill_metrics.py --dry-run                 # count changes only
+    python backfill_metrics.py --restart                 # ignore the checkpoint
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+import db_pool
+from metrics import build_metrics
+
+DEFAULT_CHECKPOINT = "screenshots/backfill_metrics.checkpoint.json"
+
+# Modules whose source defines the stored metrics; editing any of them
+# invalidates the checkpoint.
+METRICS_MODULES = ("metrics.py", "brand_match.py", "domain_index.py")
+
+# (column, SQL cast) written back, in build_metrics key order.
+COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("appeared_links_unique", "jsonb"),
+    ("my_citations", "jsonb"),
+    ("competitor_citations", "jsonb"),
+    ("total_citations_count", "integer"),
+    ("my_domain_citations_count", "integer"),
+    ("my_brand_mentions_count", "integer"),
+)
+
+Row = Tuple[Any, ...]
+
+
+def metrics_version() -> str:
+    h = hashlib.blake2b(digest_size=8)
+    here = Path(__file__).resolve().parent
+    for name in METRICS_MODULES:
+        try:
+            h.update((here / name).read_bytes())
+        except OSError:
+            h.update(name.encode())
+    return h.hexdigest()
+
+
+# ------------------------------------------------------------------- workers
+
+
+def _recompute(rows: Sequence[Row]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Worker: (id, new metrics) for every row whose stored metrics differ."""
+    changed = []
+    for row in rows:
+        prompt_id, response_text, appeared_links, website, competitors = row[:5]
+        stored = dict(zip((name for name, _ in COLUMNS), row[5:]))
+        fresh = build_metrics(
+            response_text=response_text,
+            source_links=appeared_links or [],
+            website=website,
+            competitor_websites=competitors,
+        )
+        new = {name: fresh[name] for name, _ in COLUMNS}
+        if new != stored:
+            changed.append((str(prompt_id), new))
+    return changed
+
+
+# ---------------------------------------------------------------- checkpoint
+
+
+def _load_checkpoint(path: Path, version: str) -> Dict[str, Any]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    if data.get("metrics_version") != version:
+        print("[BACKFILL] Metrics code changed since the checkpoint; starting from the beginning.")
+        return {}
+    return data
+
+
+def _save_checkpoint(path: Path, state: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+# ---------------------------------------------------------------------- db
+
+
+def _select_sql(engine: Optional[str], after_id: Optional[str]) -> Tuple[str, List[Any]]:
+    clauses = ["status = 'completed'"]
+    params: List[Any] = []
+    if engine:
+        clauses.append("engine = %s")
+        params.append(engine)
+    if after_id is not None:
+        clauses.append(f"id > %s::{db_pool.column_type('public.prompts', 'id')}")
+        params.append(after_id)
+    sql = f"""
+        SELECT id, response_text, appeared_links, website, competitor_websites,
+               {", ".join(name for name, _ in COLUMNS)}
+        FROM public.prompts
+        WHERE {" AND ".join(clauses)}
+        ORDER BY id
+    """
+    return sql, params
+
+
+def _write(changed: List[Tuple[str, Dict[str, Any]]]) -> int:
+    if not changed:
+        return 0
+    id_type = db_pool.column_type("public.prompts", "id")
+    row_sql = "(" + ", ".join([f"%s::{id_type}"] + [f"%s::{cast}" for _, cast in COLUMNS]) + ")"
+    params: List[Any] = []
+    for prompt_id, new in changed:
+        params.append(prompt_id)
+        for name, cast in COLUMNS:
+            params.append(json.dumps(new[name]) if cast == "jsonb" else new[name])
+    names = ", ".join(["id"] + [name for name, _ in COLUMNS])
+    assignments = ",\n            ".join(f"{name} = v.{name}" for name, _ in COLUMNS)
+    sql = f"""
+        UPDATE public.prompts AS p
+        SET {assignments}
+        FROM (VALUES {", ".join([row_sql] * len(changed))}) AS v({names})
+        WHERE p.id = v.id AND p.status = 'completed'
+        RETURNING p.id;
+    """
+    return len(db_pool.execute(sql, params, fetch="all", label="backfill"))
+
+
+# ---------------------------------------------------------------------- main
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Recompute stored citation/brand metrics for completed prompts")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per worker task and per UPDATE")
+    parser.add_argument("--engine", default=None, help="only rows for this engine (default: all)")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many rows (0 = all)")
+    parser.add_argument("--checkpoint", default=os.getenv("BACKFILL_CHECKPOINT", DEFAULT_CHECKPOINT))
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first row")
+    parser.add_argument("--dry-run", action="store_true", help="recompute and count changes without writing")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    batch_size = max(1, args.batch_size)
+    workers = max(1, args.workers)
+    checkpoint_path = Path(args.checkpoint)
+    version = metrics_version()
+    state = {} if args.restart else _load_checkpoint(checkpoint_path, version)
+    after_id = state.get("last_id")
+    scanned = int(state.get("scanned") or 0)
+    updated = int(state.get("updated") or 0)
+    if after_id is not None:
+        print(f"[BACKFILL] Resuming after id {after_id} ({scanned} scanned, {updated} updated so far)")
+
+    sql, params = _select_sql(args.engine, after_id)
+    run_scanned = 0
+    run_updated = 0
+    start = time.perf_counter()
+    last_report = start
+    # (last id in the batch, rows in the batch, pending recompute); written in order.
+    in_flight: Deque[Tuple[str, int, Future]] = deque()
+
+    def drain(keep: int) -> None:
+        nonlocal scanned, updated, run_scanned, run_updated, last_report
+        while len(in_flight) > keep:
+            last_id, count, future = in_flight.popleft()
+            changed = future.result()
+            written = len(changed) if args.dry_run else _write(changed)
+            scanned += count
+            updated += written
+            run_scanned += count
+            run_updated += written
+            if not args.dry_run:
+                _save_checkpoint(
+                    checkpoint_path,
+                    {"metrics_version": version, "last_id": last_id, "scanned": scanned, "updated": updated},
+                )
+            now = time.perf_counter()
+            if now - last_report >= args.report_every:
+                last_report = now
+                rate = run_scanned / max(now - start, 1e-9)
+                print(f"[BACKFILL] {scanned} scanned, {updated} updated, {rate:.0f} rows/s, last id {last_id}")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Server-side cursor: rows stream in batch_size pages instead of one fetchall().
+        with db_pool.connection() as conn:
+            with conn.cursor(name="backfill_metrics") as cur:
+                cur.itersize = batch_size
+                cur.execute(sql, tuple(params))
+                while True:
+                    want = batch_size
+                    if args.limit:
+                        want = min(want, args.limit - run_scanned - sum(n for _, n, _ in in_flight))
+                        if want <= 0:
+                            break
+                    rows = cur.fetchmany(want)
+                    if not rows:
+                        break
+                    in_flight.append((str(rows[-1][0]), len(rows), pool.submit(_recompute, rows)))
+                    # Keep every worker busy without reading the whole table ahead.
+                    drain(keep=workers * 2)
+                drain(keep=0)
+
+    elapsed = time.perf_counter() - start
+    rate = run_scanned / max(elapsed, 1e-9)
+    verb = "would update" if args.dry_run else "updated"
+    print(
+        f"[BACKFILL] Done: {run_scanned} rows scanned, {run_updated} {verb} in {elapsed:.1f}s "
+        f"({rate:.0f} rows/s); total {scanned} scanned, {updated} updated"
+    )
+    db_pool.report(log_path="")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+"""
+Benchmark for brand-mention counting in build_metrics.
+
+Compares the old per-call path (parse the website JSON for brand tokens, one
+`(?i)\\b<token>\\b` regex per variant, one scan per variant) with
+each brand_match.BrandMatcher backend (precompiled regexes, pure-Python
+Aho-Corasick, pyahocorasick if installed) on long synthetic answers and
+growing token counts, and checks they all give the same count.
+
+    python bench_brand_match.py
+    python bench_brand_match.py --answer-kb 20 200 --tokens 2 20 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import re
+import time
+from typing import Any, Callable, List
+
+import brand_match
+from brand_match import BrandMatcher, brand_tokens_from_website, matcher_for
+
+WORDS = (
+    "the best tools for teams include pricing reviews alternatives compare features "
+    "support integrations security analytics dashboard workflow customers platform"
+).split()
+
+
+def count_regex(domain: str, website: Any, text: str) -> int:
+    """main._count_brand_mentions before brand_match (reference implementation)."""
+    text = str(text or "")
+    if not text.strip():
+        return 0
+    brand = domain.split(".")[0] if domain else ""
+    variants = [brand] if brand else []
+    variants += brand_tokens_from_website(website)
+
+    seen = set()
+    count = 0
+    for variant in variants:
+        token = " ".join(str(variant or "").split()).strip()
+        if not token:
+            continue
+        key = token.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        pattern = re.compile(rf"(?i)\b{re.escape(token)}\b")
+        count += len(pattern.findall(text))
+    return count
+
+
+def make_tokens(n: int, rng: random.Random) -> List[str]:
+    tokens = ["Acme", "Acme Corp", "acme.io"]
+    while len(tokens) < n:
+        tokens.append(f"Brand{len(tokens)} {rng.choice(WORDS).title()}")
+    return tokens[:n]
+
+
+def make_answer(size_chars: int, tokens: List[str], rng: random.Random) -> str:
+    out: List[str] = []
+    length = 0
+    while length < size_chars:
+        word = rng.choice(tokens) if rng.random() < 0.03 else rng.choice(WORDS)
+        out.append(word)
+        length += len(word) + 1
+    return " ".join(out)
+
+
+def _best(run: Callable[[], int], repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark brand-mention counting")
+    parser.add_argument("--answer-kb", nargs="*", type=float, default=[8.0, 64.0])
+    parser.add_argument("--tokens", nargs="*", type=int, default=[3, 30, 300])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    backends = ["regex", "python"] + (["ahocorasick"] if brand_match.ahocorasick is not None else [])
+    print(f"[BENCH] backends: {', '.join(backends)}")
+    mismatches = 0
+    for n_tokens in args.tokens:
+        tokens = make_tokens(n_tokens, rng)
+        website = json.dumps({"url": "https://acme.io", "brand_tokens": tokens[1:]})
+        for kb in args.answer_kb:
+            text = make_answer(int(kb * 1024), tokens, rng)
+            expected = count_regex("acme.io", website, text)
+            old = _best(lambda: count_regex("acme.io", website, text), args.repeat)
+            row = f"  tokens={n_tokens:<4} answer={kb:>6g}KB  regex/variant {old * 1e3:8.2f}ms"
+            for backend in backends:
+                matcher = BrandMatcher(["acme"] + brand_tokens_from_website(website), backend=backend)
+                got = matcher.count(text)
+                if got != expected:
+                    mismatches += 1
+                elapsed = _best(lambda: matcher.count(text), args.repeat)
+                flag = "" if got == expected else f" MISMATCH {got}!={expected}"
+                row += f"  {backend} {elapsed * 1e3:8.2f}ms ({old / max(elapsed, 1e-9):4.1f}x){flag}"
+            print(row)
+
+    # Cache hit cost: what build_metrics pays per prompt for the same tenant.
+    website = {"url": "https://acme.io", "brand_tokens": make_tokens(30, rng)}
+    matcher_for("acme.io", website)
+    start = time.perf_counter()
+    for _ in range(1000):
+        matcher_for("acme.io", website)
+    print(f"[BENCH] matcher_for cache hit: {(time.perf_counter() - start) * 1e3:.3f}us/call")
+    if mismatches:
+        print(f"[BENCH] FAIL: {mismatches} count mismatch(es) against the regex reference")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,190 @@
+"""
+Latency and DOM drift over a session, with and without a new chat per prompt.
+
+Reads what test6 already logs:
+- TRACE_LOG: first_byte / stream_end per prompt, plus new_chat spans
+- MEMORY_LOG: dom_nodes / js_heap_used_mb after each prompt
+- POLICY_LOG: the session_start row, which records the NEW_CHAT_PER_PROMPT
+  mode ("off", "route", "shortcut", "reload"), and the refreshes
+
+Rows are joined on session and prompt id. Prompts are numbered within their
+browser session and grouped into buckets of --bucket prompts, one table per
+mode. Each table shows how latency and DOM size move as the session ages.
+
+The summary line per mode gives:
+- the least-squares slope of stream_end, in seconds per 100 prompts
+- drift: median stream_end of the last bucket / the first bucket
+- the DOM node slope per prompt
+- the median cost of a reset and the refreshes it needed
+
+A flat mode has a slope near 0 and a drift near 1.0.
+
+    NEW_CHAT_PER_PROMPT=0 SESSION_POLICY=fixed python test6.py   # old behaviour
+    NEW_CHAT_PER_PROMPT=1 python test6.py                        # route reset
+    NEW_CHAT_PER_PROMPT=1 NEW_CHAT_METHOD=reload python test6.py # full reload per prompt
+    python bench_chat_reset.py
+    python bench_chat_reset.py --dir 'workers/*/screenshots' --bucket 50
+
+Set MAX_PROMPTS_PER_SESSION high enough (e.g. 300) for the drift to show.
+Exits non-zero when --max-drift is given and a per-prompt mode exceeds it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import statistics
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_DIR = "screenshots"
+
+
+def _rows(pattern: str) -> Iterator[Dict[str, Any]]:
+    for path in sorted(glob.glob(pattern)):
+        try:
+            f = open(path, encoding="utf-8")
+        except OSError as e:
+            print(f"[BENCH] {path}: {e}")
+            continue
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def _slope(xs: List[float], ys: List[float]) -> Optional[float]:
+    """Least-squares slope of ys over xs; None with fewer than 2 distinct xs."""
+    if len(xs) < 2:
+        return None
+    mx, my = statistics.fmean(xs), statistics.fmean(ys)
+    var = sum((x - mx) ** 2 for x in xs)
+    if not var:
+        return None
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var
+
+
+def load(dirs: List[str]) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Dict[str, Any]]]:
+    """(prompts per mode, per-mode reset stats); each prompt row has index, stream_s, first_byte_s, dom_nodes, heap_mb."""
+    modes: Dict[str, str] = {}
+    refreshes: Dict[str, int] = defaultdict(int)
+    for d in dirs:
+        for row in _rows(os.path.join(d, "session_policy.jsonl")):
+            if row.get("action") == "session_start":
+                modes[row.get("session")] = row.get("new_chat") or "off"
+            elif row.get("action") in ("refresh", "fresh_chat"):
+                refreshes[row.get("session")] += 1
+
+    memory: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for d in dirs:
+        for row in _rows(os.path.join(d, "memory.jsonl")):
+            if row.get("prompt_id") is not None:
+                memory[(row.get("session"), row.get("prompt_id"))] = row
+
+    prompts: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    resets: Dict[str, List[float]] = defaultdict(list)
+    for d in dirs:
+        for row in _rows(os.path.join(d, "trace.jsonl")):
+            session, prompt_id, phase = row.get("session"), row.get("prompt_id"), row.get("phase")
+            if phase == "new_chat":
+                resets[modes.get(session, "off")].append(float(row.get("dur_ms") or 0.0) / 1000.0)
+            if prompt_id is None or phase not in ("first_byte", "stream_end"):
+                continue
+            p = prompts.setdefault((session, prompt_id), {"session": session, "ts": row.get("ts") or 0.0})
+            p["stream_s" if phase == "stream_end" else "first_byte_s"] = float(row.get("dur_ms") or 0.0) / 1000.0
+
+    by_session: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for (session, prompt_id), p in prompts.items():
+        mem = memory.get((session, prompt_id), {})
+        p["dom_nodes"] = mem.get("dom_nodes")
+        p["heap_mb"] = mem.get("js_heap_used_mb")
+        by_session[session].append(p)
+
+    out: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    stats: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"sessions": 0, "refreshes": 0})
+    for session, rows in by_session.items():
+        mode = modes.get(session, "off")
+        rows.sort(key=lambda r: r["ts"])
+        for i, p in enumerate(rows, 1):
+            p["index"] = i
+            out[mode].append(p)
+        stats[mode]["sessions"] += 1
+        stats[mode]["refreshes"] += refreshes.get(session, 0)
+    for mode, values in resets.items():
+        stats[mode]["reset_p50_s"] = statistics.median(values)
+    return out, stats
+
+
+def _median(values: List[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def _fmt(value: Optional[float], spec: str) -> str:
+    return format(value, spec) if value is not None else "-"
+
+
+def report(prompts: Dict[str, List[Dict[str, Any]]], stats: Dict[str, Dict[str, Any]], bucket: int) -> Dict[str, Optional[float]]:
+    """Print the per-mode tables; returns drift (last / first bucket median stream_end) per mode."""
+    drifts: Dict[str, Optional[float]] = {}
+    for mode in sorted(prompts):
+        rows = prompts[mode]
+        buckets: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for p in rows:
+            buckets[(p["index"] - 1) // bucket].append(p)
+        print(f"\nmode {mode}: {len(rows)} prompts in {stats[mode]['sessions']} session(s)")
+        print(f"{'prompts':<11} {'n':>5} {'first_byte':>11} {'stream_end':>11} {'dom_nodes':>10} {'heap_mb':>8}")
+        medians = []
+        for b in sorted(buckets):
+            group = buckets[b]
+            stream = _median([p.get("stream_s") for p in group])
+            medians.append(stream)
+            print(
+                f"{f'{b * bucket + 1}-{(b + 1) * bucket}':<11} {len(group):>5} "
+                f"{_fmt(_median([p.get('first_byte_s') for p in group]), '.2f'):>10}s "
+                f"{_fmt(stream, '.2f'):>10}s "
+                f"{_fmt(_median([p.get('dom_nodes') for p in group]), '.0f'):>10} "
+                f"{_fmt(_median([p.get('heap_mb') for p in group]), '.1f'):>8}"
+            )
+        timed = [p for p in rows if p.get("stream_s") is not None]
+        slope = _slope([p["index"] for p in timed], [p["stream_s"] for p in timed])
+        sized = [p for p in rows if p.get("dom_nodes") is not None]
+        dom_slope = _slope([p["index"] for p in sized], [p["dom_nodes"] for p in sized])
+        medians = [m for m in medians if m is not None]
+        drift = medians[-1] / medians[0] if len(medians) >= 2 and medians[0] else None
+        drifts[mode] = drift
+        print(
+            f"slope {_fmt(slope * 100 if slope is not None else None, '+.2f')}s/100 prompts, "
+            f"drift x{_fmt(drift, '.2f')}, DOM {_fmt(dom_slope, '+.1f')} nodes/prompt, "
+            f"reset p50 {_fmt(stats[mode].get('reset_p50_s'), '.2f')}s, refreshes {stats[mode]['refreshes']}"
+        )
+    return drifts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Latency / DOM drift per NEW_CHAT_PER_PROMPT mode from test6 logs")
+    parser.add_argument("--dir", nargs="*", default=[DEFAULT_DIR], help="log directories or globs (default: screenshots)")
+    parser.add_argument("--bucket", type=int, default=25, help="prompts per row")
+    parser.add_argument("--max-drift", type=float, default=None, help="fail when a per-prompt mode drifts more than this")
+    args = parser.parse_args()
+
+    dirs = sorted({d for pattern in args.dir for d in (glob.glob(pattern) or [pattern])})
+    prompts, stats = load(dirs)
+    if not prompts:
+        print("[BENCH] No timed prompts found")
+        return 1
+    drifts = report(prompts, stats, max(1, args.bucket))
+    if args.max_drift is not None:
+        over = {m: d for m, d in drifts.items() if m != "off" and d is not None and d > args.max_drift}
+        if over:
+            print(f"\n[BENCH] FAILED: drift over x{args.max_drift:g}: {over}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
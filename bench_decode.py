@@ -0,0 +1,132 @@
+"""
+Benchmark the stream payload decoders on the bundled sample streams.
+
+For every available backend (msgspec, orjson, json) this reports decode time,
+speedup over the stdlib dict + .get() baseline, and tracemalloc allocation
+counts, then the end-to-end DeltaStreamParser time with that backend.
+
+    python bench_decode.py
+    python bench_decode.py --repeat 50 --files sample_response.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from typing import Callable, List
+
+import sse_decode
+from delta_encoding import DeltaStreamParser
+from sse_stream import SSEStreamParser
+
+DEFAULT_FILES = ["301042.409.stream.txt", "sample_eventStream.jsonl", "sample_response.jsonl"]
+
+
+class _PayloadCollector(SSEStreamParser):
+    """Reuses the stream framing to pull out raw JSON payload strings."""
+
+    def __init__(self):
+        super().__init__()
+        self.payloads: List[str] = []
+
+    def _handle_payload(self, payload):
+        payload = (payload or "").strip()
+        if payload and payload != "[DONE]":
+            self.payloads.append(payload)
+
+
+def _payloads(raw: str) -> List[str]:
+    collector = _PayloadCollector()
+    collector.feed(raw)
+    collector.close()
+    return collector.payloads
+
+
+def _baseline(payload):
+    # What the old parsers did: a dict, then .get() per field.
+    obj = json.loads(payload)
+    if isinstance(obj, dict):
+        return (obj.get("p"), obj.get("o"), obj.get("v"), obj.get("c"), obj.get("type"))
+    return obj
+
+
+def _time_decode(fn: Callable, payloads: List[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            fn(payload)
+    return time.perf_counter() - start
+
+
+def _allocations(fn: Callable, payloads: List[str]):
+    """(blocks, bytes) still held by the decoded events, plus peak bytes."""
+    tracemalloc.start()
+    base = tracemalloc.take_snapshot()
+    held = [fn(payload) for payload in payloads]
+    snap = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = snap.compare_to(base, "filename")
+    blocks = sum(s.count_diff for s in stats)
+    size = sum(s.size_diff for s in stats)
+    del held
+    return blocks, size, peak
+
+
+def _time_parse(raw: bytes, decoder: Callable, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parser = DeltaStreamParser()
+        parser._decode = decoder
+        parser.feed(raw)
+        parser.close()
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark SSE payload decode backends")
+    parser.add_argument("--files", nargs="*", default=DEFAULT_FILES)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    backends = sse_decode.available_backends()
+    print(f"[BENCH] default backend: {sse_decode.BACKEND}  available: {', '.join(backends)}")
+
+    for path in args.files:
+        if not os.path.exists(path):
+            print(f"[BENCH] skip missing {path}")
+            continue
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            raw = f.read()
+        payloads = _payloads(raw)
+        size_mb = sum(len(p) for p in payloads) / 1e6
+        print(f"\n[BENCH] {path}: {len(payloads)} payloads, {size_mb:.2f} MB of JSON")
+
+        base_time = _time_decode(_baseline, payloads, args.repeat)
+        blocks, size, peak = _allocations(_baseline, payloads)
+        print(
+            f"  {'json+get (baseline)':<20} {base_time * 1000 / args.repeat:8.2f} ms/pass  "
+            f"x1.00  blocks={blocks:<7} held={size / 1024:8.1f} KiB  peak={peak / 1024:8.1f} KiB"
+        )
+        for backend in backends:
+            decoder = sse_decode.make_decoder(backend)
+            elapsed = _time_decode(decoder, payloads, args.repeat)
+            blocks, size, peak = _allocations(decoder, payloads)
+            speedup = base_time / elapsed if elapsed else 0.0
+            print(
+                f"  {backend + ' -> DeltaEvent':<20} {elapsed * 1000 / args.repeat:8.2f} ms/pass  "
+                f"x{speedup:4.2f}  blocks={blocks:<7} held={size / 1024:8.1f} KiB  peak={peak / 1024:8.1f} KiB"
+            )
+
+        raw_bytes = raw.encode("utf-8")
+        for backend in backends:
+            elapsed = _time_parse(raw_bytes, sse_decode.make_decoder(backend), args.repeat)
+            print(f"  {'parse[' + backend + ']':<20} {elapsed * 1000 / args.repeat:8.2f} ms/stream")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
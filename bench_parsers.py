@@ -0,0 +1,355 @@
+"""
+Throughput / memory benchmark for every stream parser in the tree.
+
+Runs each implementation on the recorded fixtures and on synthetic
+multi-megabyte streams grown from them, and reports events/sec, MB/sec,
+tracemalloc peak memory and whether outputs agree with the reference
+(delta_encoding.DeltaStreamParser).
+
+A framing section compares the per-prompt cost of test6's old path
+(body.decode() + master._split_sse_events + json.loads) with the parser fed a
+decoded str and fed the raw bytes.
+
+Exits non-zero when a parser scales super-linearly: the time exponent
+between the smallest and largest synthetic stream (t ~ size^k) must stay
+under --max-exponent. It also exits non-zero when master or
+capture_conversation_simple cannot be imported (e.g. seleniumbase missing),
+unless --allow-skip is given.
+
+    python bench_parsers.py
+    python bench_parsers.py --sizes-mb 1 4 16 --max-exponent 1.25
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from delta_encoding import parse_delta_text
+import sse_decode
+from sse_decode import loads
+from sse_stream import SSEStreamParser
+
+DEFAULT_FILES = ["301042.409.stream.txt", "sample_eventStream.jsonl", "sample_response.jsonl"]
+SYNTHETIC_SOURCE = "sample_response.jsonl"
+
+# Parsers the benchmark exists to compare; the run fails without them unless
+# --allow-skip is given (helper is optional).
+REQUIRED_MODULES = ("master", "capture_conversation_simple")
+
+
+class _PayloadCollector(SSEStreamParser):
+    """Stream framing only: collects the raw data payloads."""
+
+    def __init__(self):
+        super().__init__()
+        self.payloads: List[str] = []
+
+    def _handle_payload(self, payload):
+        self.event_count += 1
+        payload = (payload or "").strip()
+        if payload:
+            self.payloads.append(payload)
+
+
+def _payloads(raw: str) -> List[str]:
+    collector = _PayloadCollector()
+    collector.feed(raw)
+    collector.close()
+    return collector.payloads
+
+
+def _to_sse(payloads: List[str]) -> str:
+    out = []
+    for payload in payloads:
+        out.append(f"event: delta\ndata: {payload}\n\n")
+    return "".join(out)
+
+
+def build_synthetic(raw: str, target_bytes: int) -> str:
+    """
+    Grow one conversation to ~target_bytes by repeating the ops that stream
+    into the final message document (answer appends, content_references and
+    search_result_groups patches), so a single document keeps getting larger.
+    """
+    payloads = _payloads(raw)
+    last_doc = 0
+    tail_start = len(payloads)
+    for i, payload in enumerate(payloads):
+        try:
+            obj = loads(payload)
+        except Exception:
+            continue
+        if isinstance(obj, dict):
+            if obj.get("p") == "" and obj.get("o") == "add":
+                last_doc = i
+            elif obj.get("type") == "message_stream_complete" and tail_start == len(payloads):
+                tail_start = i
+    head = payloads[: last_doc + 1]
+    body = payloads[last_doc + 1 : tail_start] or payloads[last_doc + 1 :]
+    tail = payloads[tail_start:]
+    body_text = _to_sse(body)
+    base = len(_to_sse(head)) + len(_to_sse(tail))
+    reps = max(1, (target_bytes - base) // max(1, len(body_text)))
+    return _to_sse(head) + body_text * reps + _to_sse(tail)
+
+
+# ------------------------------------------------------------ implementations
+
+
+class Impl:
+    """One parser under test; run(prepared) -> (answer, citations) or event count."""
+
+    def __init__(self, name: str, run: Callable[[Any], Any], prepare: Callable[[str], Any] = None, kind: str = "answer"):
+        self.name = name
+        self.run = run
+        self.prepare = prepare or (lambda raw: raw)
+        self.kind = kind
+
+
+def _load_impls(workdir: Path) -> Tuple[List[Impl], Dict[str, str]]:
+    """(parsers that imported, module -> import error for the ones that did not)."""
+    impls = [Impl("delta_encoding.DeltaStreamParser", parse_delta_text)]
+    skipped: Dict[str, str] = {}
+
+    try:
+        import master
+
+        impls.append(Impl("master._extract_answer_and_citations_from_sse", master._extract_answer_and_citations_from_sse))
+        impls.append(Impl("master._extract_answer_and_citations_from_json", master._extract_answer_and_citations_from_json))
+    except Exception as e:
+        skipped["master"] = str(e)
+
+    try:
+        import capture_conversation_simple as ccs
+
+        # _build_summary reads the capture dirs and writes SUMMARY_FILE; point
+        # them at a scratch dir for the run.
+        ccs.CONVERSATION_BODY_DIR = workdir
+        ccs.CONVERSATION_STREAM_DIR = workdir
+        ccs.CONVERSATION_REQUEST_DIR = workdir
+        ccs.SUMMARY_FILE = workdir / "summary.json"
+
+        def prepare_summary(raw):
+            request_id = f"bench{len(raw)}"
+            (workdir / f"{request_id}.stream.txt").write_text(raw, encoding="utf-8")
+            return request_id
+
+        def run_summary(request_id):
+            with contextlib.redirect_stdout(io.StringIO()):
+                summary = ccs._build_summary(request_id, "")
+            return summary["answer_text"], [c["url"] for c in summary["citations"]]
+
+        impls.append(Impl("capture_conversation_simple._build_summary", run_summary, prepare_summary))
+    except Exception as e:
+        skipped["capture_conversation_simple"] = str(e)
+
+    try:
+        import helper
+
+        impls.append(Impl("helper.extract_raw_response", lambda raw: len(helper.extract_raw_response(raw)), kind="events"))
+    except Exception as e:
+        skipped["helper"] = str(e)
+
+    return impls, skipped
+
+
+# ------------------------------------------------------------------ measuring
+
+
+def _time(impl: Impl, prepared, repeat: int) -> Tuple[float, Any]:
+    best = math.inf
+    out = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = impl.run(prepared)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def _peak(impl: Impl, prepared) -> int:
+    tracemalloc.start()
+    try:
+        impl.run(prepared)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def _equality(impl: Impl, out, reference, dict_events: int) -> str:
+    if impl.kind == "events":
+        return "same" if out == dict_events else f"events {out}!={dict_events}"
+    answer, citations = out
+    ref_answer, ref_citations = reference
+    same_answer = (answer or "").strip() == (ref_answer or "").strip()
+    cited = set(ref_citations)
+    covered = len(cited & set(citations))
+    answer_note = "answer=same" if same_answer else f"answer={len(answer or '')}c vs {len(ref_answer)}c"
+    return f"{answer_note} citations={covered}/{len(cited)}"
+
+
+def _dict_events(raw: str) -> int:
+    count = 0
+    for payload in _payloads(raw):
+        if not payload.startswith("{"):
+            continue
+        try:
+            if isinstance(loads(payload), dict):
+                count += 1
+        except Exception:
+            pass
+    return count
+
+
+def _report(label: str, raw: str, impls: List[Impl], repeat: int, with_memory: bool) -> Dict[str, float]:
+    size_mb = len(raw.encode("utf-8")) / 1e6
+    events = len(_payloads(raw))
+    reference = parse_delta_text(raw)
+    dict_events = _dict_events(raw)
+    print(f"\n[BENCH] {label}: {size_mb:.2f} MB, {events} events")
+    timings = {}
+    for impl in impls:
+        prepared = impl.prepare(raw)
+        elapsed, out = _time(impl, prepared, repeat)
+        timings[impl.name] = elapsed
+        peak = f"{_peak(impl, prepared) / 1e6:8.2f} MB" if with_memory else "       -   "
+        rate = events / elapsed if elapsed else 0.0
+        mbps = size_mb / elapsed if elapsed else 0.0
+        print(
+            f"  {impl.name:<48} {elapsed * 1000:9.2f} ms  {rate:11.0f} ev/s  {mbps:8.2f} MB/s  "
+            f"peak {peak}  {_equality(impl, out, reference, dict_events)}"
+        )
+    return timings
+
+
+class _FramingOnly(SSEStreamParser):
+    """Framing + JSON decode, no answer/citation work (for the framing section)."""
+
+    def _handle_decoded(self, obj):
+        pass
+
+
+def _framing_impls() -> List[Tuple[str, Callable[[bytes], Any]]]:
+    impls = []
+    try:
+        import master
+
+        def legacy(body):
+            for event in master._split_sse_events(body.decode("utf-8", errors="replace")):
+                data = event.get("data", "").strip()
+                if data and data != "[DONE]":
+                    try:
+                        json.loads(data)
+                    except Exception:
+                        pass
+
+        impls.append(("decode + _split_sse_events", legacy))
+    except Exception:
+        pass
+
+    def framer(data, decoder):
+        parser = _FramingOnly()
+        parser._decode = decoder
+        parser.feed(data)
+        parser.close()
+
+    std = sse_decode.make_loads("json")
+    impls.append(("framer(str), json", lambda body: framer(body.decode("utf-8", errors="replace"), std)))
+    impls.append(("framer(bytes), json", lambda body: framer(body, std)))
+    impls.append((f"framer(bytes), {sse_decode.BACKEND}", lambda body: framer(body, sse_decode.loads)))
+    return impls
+
+
+def _report_framing(label: str, body: bytes, repeat: int) -> None:
+    print(f"\n[BENCH] framing {label}: {len(body) / 1e6:.2f} MB")
+    base = None
+    for name, fn in _framing_impls():
+        best = math.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(body)
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            fn(body)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        if base is None:
+            base = (best, peak)
+        print(
+            f"  {name:<32} {best * 1000:9.2f} ms  x{base[0] / best if best else 0:4.2f}  "
+            f"peak {peak / 1e6:8.2f} MB  ({peak / base[1] * 100 if base[1] else 0:5.1f}% of first)"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the SSE/answer parsers in this repo")
+    parser.add_argument("--files", nargs="*", default=DEFAULT_FILES)
+    parser.add_argument("--sizes-mb", nargs="*", type=float, default=[1.0, 4.0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-exponent", type=float, default=1.3, help="fail if time grows faster than size^k")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc runs on synthetic streams")
+    parser.add_argument("--allow-skip", action="store_true", help="run even if master / capture_conversation_simple fail to import")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_parsers_") as tmp:
+        impls, skipped = _load_impls(Path(tmp))
+        for module, error in skipped.items():
+            print(f"[BENCH] skipped {module}: {error}")
+        missing = [m for m in REQUIRED_MODULES if m in skipped]
+        if missing and not args.allow_skip:
+            print(f"[BENCH] FAIL: could not load {', '.join(missing)} (install requirements.txt or pass --allow-skip)")
+            return 1
+
+        for path in args.files:
+            if not os.path.exists(path):
+                print(f"[BENCH] skip missing {path}")
+                continue
+            with open(path, "rb") as f:
+                body = f.read()
+            _report(path, body.decode("utf-8", errors="replace"), impls, args.repeat, with_memory=True)
+            _report_framing(path, body, args.repeat)
+
+        sizes = sorted(args.sizes_mb)
+        if len(sizes) < 2 or not os.path.exists(SYNTHETIC_SOURCE):
+            return 0
+        with open(SYNTHETIC_SOURCE, "r", encoding="utf-8", errors="replace") as f:
+            source = f.read()
+
+        scaling: Dict[str, List[Tuple[float, float]]] = {}
+        for size in sizes:
+            raw = build_synthetic(source, int(size * 1e6))
+            actual_mb = len(raw.encode("utf-8")) / 1e6
+            timings = _report(f"synthetic {size:g} MB", raw, impls, 1, with_memory=not args.no_memory)
+            for name, elapsed in timings.items():
+                scaling.setdefault(name, []).append((actual_mb, elapsed))
+            _report_framing(f"synthetic {size:g} MB", raw.encode("utf-8"), args.repeat)
+
+        print(f"\n[BENCH] scaling exponent (t ~ size^k), limit k <= {args.max_exponent}")
+        failed = []
+        for name, points in scaling.items():
+            (s0, t0), (s1, t1) = points[0], points[-1]
+            exponent = math.log(max(t1, 1e-9) / max(t0, 1e-9)) / math.log(s1 / s0) if s1 > s0 else 0.0
+            flag = "OK" if exponent <= args.max_exponent else "SUPER-LINEAR"
+            print(f"  {name:<48} k={exponent:5.2f}  {flag}")
+            if exponent > args.max_exponent:
+                failed.append(name)
+    if failed:
+        print(f"[BENCH] FAIL: super-linear parsers: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
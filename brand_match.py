@@ -0,0 +1,229 @@
+"""
+Single-pass brand-mention matcher for build_metrics.
+
+main._count_brand_mentions used to re-parse the website JSON for brand tokens
+and compile one `(?i)\\b<token>\\b` regex per variant on every call, scanning the
+answer once per variant. BrandMatcher compiles every variant into one
+Aho-Corasick automaton and counts them all in one pass over the text, with the
+same results as the per-variant regexes:
+
+- case-insensitive, variants whitespace-normalised and de-duplicated
+- `\\b` semantics at both ends of a variant (word chars are alnum or `_`)
+- each variant counts its own non-overlapping matches, left to right, so
+  "Acme" and "Acme Corp" both count on "Acme Corp" as before
+
+matcher_for(domain, website) caches one matcher per distinct website
+definition. If pyahocorasick is installed its C automaton does the scan.
+With only a few variants (<= REGEX_MAX_VARIANTS) precompiled per-variant
+regexes beat a pure-Python scan, so those stay on `re`. BRAND_MATCHER=
+python|ahocorasick|regex forces a backend.
+
+    python bench_brand_match.py
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from contextlib import suppress
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import ahocorasick  # type: ignore
+except Exception:
+    ahocorasick = None
+
+REGEX_MAX_VARIANTS = 4
+
+
+def _read_brand_tokens(value):
+    if isinstance(value, str):
+        token = value.strip()
+        return [token] if token else []
+    if isinstance(value, list):
+        out = []
+        for item in value:
+            if isinstance(item, str):
+                token = item.strip()
+                if token:
+                    out.append(token)
+        return out
+    return []
+
+
+def brand_tokens_from_website(value):
+    if value is None:
+        return []
+    if isinstance(value, bytes):
+        with suppress(Exception):
+            return brand_tokens_from_website(json.loads(value.decode("utf-8")))
+        return []
+    if isinstance(value, str):
+        with suppress(Exception):
+            return brand_tokens_from_website(json.loads(value))
+        return []
+    if isinstance(value, dict):
+        return _read_brand_tokens(value.get("brand_tokens")) + _read_brand_tokens(
+            value.get("brand_token")
+        )
+    if isinstance(value, list):
+        out = []
+        for item in value:
+            out += brand_tokens_from_website(item)
+        return out
+    return []
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _fold(text: str) -> str:
+    # Lower-case without changing length so match offsets stay valid in text
+    # (a few characters, e.g. U+0130, lower-case to two code points).
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+class BrandMatcher:
+    """Counts whole-word, case-insensitive occurrences of every variant in one pass."""
+
+    def __init__(self, variants: Sequence[Any], backend: Optional[str] = None):
+        self.variants: List[str] = []
+        seen = set()
+        for variant in variants:
+            token = " ".join(str(variant or "").split()).strip()
+            key = _fold(token)
+            if not token or key in seen:
+                continue
+            seen.add(key)
+            self.variants.append(token)
+        self._patterns = [_fold(token) for token in self.variants]
+        # Boundary checks only depend on whether each end is a word character.
+        self._edges = [(_is_word(p[0]), _is_word(p[-1]), len(p)) for p in self._patterns]
+
+        if backend is None:
+            backend = (os.getenv("BRAND_MATCHER") or "").strip().lower()
+        if not backend:
+            if ahocorasick is not None:
+                backend = "ahocorasick"
+            elif len(self._patterns) <= REGEX_MAX_VARIANTS:
+                backend = "regex"
+            else:
+                backend = "python"
+        if backend == "ahocorasick" and ahocorasick is None:
+            backend = "python"
+        self.backend = backend
+        if not self._patterns:
+            return
+        if backend == "regex":
+            self._regexes = [re.compile(rf"(?i)\b{re.escape(token)}\b") for token in self.variants]
+        elif backend == "ahocorasick":
+            self._automaton = ahocorasick.Automaton()
+            for index, pattern in enumerate(self._patterns):
+                self._automaton.add_word(pattern, index)
+            self._automaton.make_automaton()
+        else:
+            self._build()
+
+    def _build(self) -> None:
+        """Trie + failure links, completed into a DFA over the patterns' alphabet."""
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Tuple[int, ...]] = [()]
+        for index, pattern in enumerate(self._patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] = out[state] + (index,)
+
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            out[state] = out[state] + out[fail[state]]
+            # Characters with no own edge follow the failure state's transitions.
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0) if state else 0
+                queue.append(nxt)
+        # Root drops back to itself on unknown characters.
+        self._delta = [{ch: s for ch, s in row.items() if s} for row in delta]
+        self._out = out
+
+    def _ends(self, folded: str):
+        """(end index exclusive, variant index) for every raw occurrence, in end order."""
+        if self.backend == "ahocorasick":
+            for end, index in self._automaton.iter(folded):
+                yield end + 1, index
+            return
+        delta = self._delta
+        out = self._out
+        state = 0
+        for i, ch in enumerate(folded):
+            state = delta[state].get(ch, 0)
+            if out[state]:
+                for index in out[state]:
+                    yield i + 1, index
+
+    def count(self, text: Any) -> int:
+        text = str(text or "")
+        if not self._patterns or not text.strip():
+            return 0
+        if self.backend == "regex":
+            return sum(len(regex.findall(text)) for regex in self._regexes)
+        folded = _fold(text)
+        size = len(folded)
+        edges = self._edges
+        last_end = [0] * len(self._patterns)
+        total = 0
+        for end, index in self._ends(folded):
+            first_word, last_word, length = edges[index]
+            start = end - length
+            if start < last_end[index]:
+                continue
+            before = start > 0 and _is_word(folded[start - 1])
+            if before == first_word:
+                continue
+            after = end < size and _is_word(folded[end])
+            if after == last_word:
+                continue
+            last_end[index] = end
+            total += 1
+        return total
+
+
+def definition_key(website: Any) -> str:
+    """Hashable cache key for a website / competitor_websites value (JSON text, bytes, dict or list)."""
+    if isinstance(website, bytes):
+        return website.decode("utf-8", errors="replace")
+    if isinstance(website, str):
+        return website
+    try:
+        return json.dumps(website, sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        return str(website)
+
+
+@lru_cache(maxsize=1024)
+def _cached_matcher(domain: str, website_key: str) -> BrandMatcher:
+    brand = domain.split(".")[0] if domain else ""
+    variants = [brand] if brand else []
+    return BrandMatcher(variants + brand_tokens_from_website(website_key))
+
+
+def matcher_for(domain: str, website: Any) -> BrandMatcher:
+    """The matcher for this domain + website definition, built once and cached."""
+    return _cached_matcher(domain or "", definition_key(website))
@@ -0,0 +1,138 @@
+"""
+Empty temporary chat before each prompt, without reloading the page.
+
+Without it, every prompt in a browser session goes into the same temporary
+chat until the policy refreshes the page. The conversation DOM grows by one
+answer per prompt, and each request carries the whole thread.
+
+With NEW_CHAT_PER_PROMPT=1, test6 and ChatTabs call ChatReset.reset(page)
+before typing. reset() leaves the current conversation inside the app:
+
+- "route" (default NEW_CHAT_METHOD): pushState to NEW_CHAT_PATH plus a
+  popstate event, so the app's client-side router mounts an empty temporary
+  chat. The document, the FetchTee wrapper and the CDP sessions are kept,
+  and nothing is downloaded.
+- "shortcut": the app's own new-chat shortcut (Ctrl+Shift+O). If that leaves
+  temporary mode, "route" runs after it.
+- "reload": page.goto(CHAT_URL). This is a full load, the same as the old
+  refresh.
+
+The reset counts once the textarea is back, no conversation turn is left, and
+the URL is a temporary chat. A method that does not get there within
+NEW_CHAT_TIMEOUT_S (default 8) falls through to the next one, ending with
+"reload". NEW_CHAT_PATH carries hints=search, which preselects search. When
+the search pill is not in the composer afterwards, /search is typed again
+(chat_tabs.activate_search).
+
+A page with no turns yet (right after setup or a refresh) is left alone.
+Each reset is a "new_chat" span in TRACE_LOG, tagged with the method used.
+bench_chat_reset.py compares latency and DOM drift with and without it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+from chat_tabs import CHAT_URL, TEXTAREA, activate_search
+from stream_capture import _env_float
+from tracing import tracer
+
+NEW_CHAT_PATH = "/?temporary-chat=true&hints=search"
+CONVERSATION_TURN = '[data-testid^="conversation-turn-"]'
+NEW_CHAT_SHORTCUT = "Control+Shift+O"
+
+METHODS: Dict[str, Tuple[str, ...]] = {
+    "route": ("route", "reload"),
+    "shortcut": ("shortcut", "route", "reload"),
+    "reload": ("reload",),
+}
+
+_EMPTY_JS = """
+() => !!document.querySelector(%(textarea)s)
+  && !document.querySelector(%(turn)s)
+  && new URLSearchParams(location.search).get("temporary-chat") === "true"
+""" % {"textarea": json.dumps(TEXTAREA), "turn": json.dumps(CONVERSATION_TURN)}
+
+_HAS_TURNS_JS = "() => !!document.querySelector(%s)" % json.dumps(CONVERSATION_TURN)
+
+# History entry shaped like the router's own ({usr, key, idx}) so back/forward
+# bookkeeping stays consistent.
+_ROUTE_JS = """
+(path) => {
+  const idx = ((window.history.state && window.history.state.idx) || 0) + 1;
+  const state = { usr: null, key: Math.random().toString(36).slice(2, 10), idx };
+  window.history.pushState(state, "", path);
+  window.dispatchEvent(new PopStateEvent("popstate", { state }));
+}
+"""
+
+# Search picked via /search or hints=search shows as a pill button in the composer.
+_SEARCH_ACTIVE_JS = """
+() => {
+  const box = document.querySelector(%s);
+  const form = box && box.closest("form");
+  if (!form) return false;
+  return Array.from(form.querySelectorAll("button, [role='button']")).some((b) => {
+    const label = (b.getAttribute("aria-label") || b.innerText || "").trim().toLowerCase();
+    return (label === "search" || label === "web search") && b.getAttribute("aria-pressed") !== "false";
+  });
+}
+""" % json.dumps(TEXTAREA)
+
+
+def per_prompt_enabled() -> bool:
+    return (os.getenv("NEW_CHAT_PER_PROMPT", "0") or "0").strip().lower() in ("1", "true", "on", "yes")
+
+
+class ChatReset:
+    """reset(page) before a prompt -> the method that emptied the chat ("empty" when nothing to do)."""
+
+    def __init__(self, method: Optional[str] = None, timeout_s: Optional[float] = None):
+        method = (method or os.getenv("NEW_CHAT_METHOD", "route") or "route").strip().lower()
+        self.method = method if method in METHODS else "route"
+        self.timeout_ms = int(1000 * (timeout_s if timeout_s is not None else _env_float("NEW_CHAT_TIMEOUT_S", 8.0)))
+        self.counts: Dict[str, int] = {}
+        self.search_retyped = 0
+
+    def _go(self, page, method: str) -> None:
+        if method == "shortcut":
+            page.keyboard.press(NEW_CHAT_SHORTCUT)
+            # The shortcut may open a regular chat; route back into temporary mode.
+            page.wait_for_function(f"() => !({_HAS_TURNS_JS})()", timeout=self.timeout_ms)
+            if "temporary-chat=true" not in page.url:
+                page.evaluate(_ROUTE_JS, NEW_CHAT_PATH)
+        elif method == "route":
+            page.evaluate(_ROUTE_JS, NEW_CHAT_PATH)
+        else:
+            page.goto(CHAT_URL, wait_until="domcontentloaded")
+        page.wait_for_function(_EMPTY_JS, timeout=self.timeout_ms if method != "reload" else 60_000)
+
+    def reset(self, page, prompt_id=None, **attrs) -> str:
+        """Empty temporary chat with search on; raises only if even a reload fails."""
+        if not page.evaluate(_HAS_TURNS_JS):
+            return "empty"
+        with tracer.span("new_chat", prompt_id=prompt_id, **attrs) as span:
+            error = None
+            for method in METHODS[self.method]:
+                try:
+                    self._go(page, method)
+                except Exception as e:
+                    error = e
+                    print(f"[NEW CHAT] {method} did not give an empty chat: {type(e).__name__}: {e}")
+                    continue
+                break
+            else:
+                raise RuntimeError(f"no empty temporary chat after {'/'.join(METHODS[self.method])}") from error
+            span["method"] = method
+            if not page.evaluate(_SEARCH_ACTIVE_JS):
+                activate_search(page)
+                self.search_retyped += 1
+                span["search_retyped"] = True
+        self.counts[method] = self.counts.get(method, 0) + 1
+        return method
+
+    def summary(self) -> str:
+        counts = " ".join(f"{k}={v}" for k, v in sorted(self.counts.items())) or "none"
+        return f"method={self.method} resets {counts} search_retyped={self.search_retyped}"
@@ -0,0 +1,440 @@
+"""
+Several temporary-chat tabs driven by one browser.
+
+An answer streams for 30-120 s, and with one tab the browser does nothing else
+during that time. With CHAT_TABS=K > 1, test6 opens K-1 more temporary-chat
+pages in the same context as the CDP-mode tab. Each tab gets its own stream
+tap (FetchTee by default; SSE_CAPTURE_MODE=early uses ConversationStreamTap)
+and holds one prompt at a time, so K answers stream at once. The tabs share
+one Chrome: one browser process, one GPU process and one network stack.
+
+Playwright's sync API is single-threaded, so nothing runs in parallel on the
+Python side. ChatTabs.submit() types a prompt into a free tab and returns as
+soon as it is sent. ChatTabs.poll() pumps events for every page together
+(any Playwright call dispatches them all) and returns the tabs whose stream
+reached a terminal marker.
+
+Chrome throttles timers in background tabs and can freeze their renderers,
+which slows the streams there. To prevent that:
+- Each tab keeps a CDP session with focus emulation on, so document.hasFocus()
+  stays true and no blur or visibility change fires.
+- Each tab is also held in the "active" web lifecycle state.
+- BACKGROUND_FLAGS, added to the Chrome launch args, turn off timer
+  throttling and backgrounding for hidden or occluded windows across the
+  whole process.
+
+    python chat_tabs.py --selftest   # the test6 tab loop's calls against fake pages
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from stream_capture import ConversationStreamTap, FetchTee, StreamRecord, _env_float
+from tracing import tracer
+
+CHAT_URL = "https://chatgpt.com/?temporary-chat=true"
+TEXTAREA = "#prompt-textarea"
+SEND_BUTTON = 'button[data-testid="send-button"]'
+
+# Playwright selectors for test6.LIST_OF_POPUPS (jQuery :contains is CDP-mode only).
+POPUP_SELECTORS = (
+    'a:has-text("Stay logged out")',
+    'button:has-text("Stay logged out")',
+)
+
+BACKGROUND_FLAGS = (
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+)
+
+# Per tab: the random dwell a prompt occupies it (send -> next send), matching
+# PromptCompletion's floor. Across tabs: the gap between two sends.
+TAB_STAGGER_MIN_S = 3.0
+TAB_STAGGER_MAX_S = 8.0
+
+# Reload a tab (and re-enable search) after this many prompts, like the
+# single-tab loop's every-50 refresh.
+TAB_REFRESH_EVERY = 50
+
+Prompt = Dict[str, Any]
+
+
+def tab_count() -> int:
+    try:
+        return max(1, int(os.getenv("CHAT_TABS", "1") or 1))
+    except ValueError:
+        return 1
+
+
+def chromium_args(base: str) -> str:
+    """SeleniumBase chromium_arg string with the anti-throttling flags added in tab mode."""
+    if tab_count() <= 1:
+        return base
+    return ",".join([base, *BACKGROUND_FLAGS]) if base else ",".join(BACKGROUND_FLAGS)
+
+
+def activate_search(page) -> None:
+    """activate_search_mode() for a Playwright page: type /search, Enter, space."""
+    page.click(TEXTAREA)
+    page.wait_for_timeout(random.randint(1000, 2000))
+    page.keyboard.type("/search", delay=random.randint(150, 300))
+    page.wait_for_timeout(1000)
+    page.keyboard.press("Enter")
+    page.wait_for_timeout(2000)
+    page.keyboard.type(" ")
+    page.wait_for_timeout(1000)
+
+
+class ChatTab:
+    """One page, its stream tap, and the prompt currently in flight on it."""
+
+    def __init__(self, index: int, page, tap, owned: bool):
+        self.index = index
+        self.page = page
+        self.tap = tap
+        self.owned = owned
+        self.session = None
+        self.prompt: Optional[Prompt] = None
+        self.sent_at: Optional[float] = None
+        self.ready_at = 0.0
+        self.prompts = 0
+
+    @property
+    def busy(self) -> bool:
+        return self.prompt is not None
+
+    def keep_active(self) -> None:
+        """Focus emulation + active lifecycle; the session stays attached or the override is dropped."""
+        try:
+            self.session = self.page.context.new_cdp_session(self.page)
+            self.session.send("Emulation.setFocusEmulationEnabled", {"enabled": True})
+        except Exception as e:
+            print(f"[TABS] Tab {self.index}: focus emulation unavailable: {e}")
+            return
+        try:
+            self.session.send("Page.setWebLifecycleState", {"state": "active"})
+        except Exception as e:
+            print(f"[TABS] Tab {self.index}: lifecycle override unavailable: {e}")
+
+    def close_popups(self) -> None:
+        for sel in POPUP_SELECTORS:
+            try:
+                loc = self.page.locator(sel).first
+                if loc.is_visible():
+                    loc.click()
+                    print(f"::warning::[POP UP] Tab {self.index}: closed popup using selector: {sel}")
+                    self.page.wait_for_timeout(random.randint(2000, 4000))
+                    return
+            except Exception:
+                continue
+
+    def close(self) -> None:
+        self.tap.stop()
+        if self.session is not None:
+            try:
+                self.session.detach()
+            except Exception:
+                pass
+            self.session = None
+        if self.owned:
+            try:
+                self.page.close()
+            except Exception:
+                pass
+
+
+class ChatTabs:
+    """
+    K chat tabs with one prompt slot each.
+
+    free_tab() -> a tab ready for submit(), honoring the per-tab dwell and the
+    cross-tab stagger; poll(timeout_s) -> [(tab, prompt, record, error)] for
+    prompts that finished (record is None when nothing usable was captured).
+    """
+
+    def __init__(
+        self,
+        context,
+        page,
+        tap=None,
+        capture_mode: str = "fetch",
+        prompt_timeout_s: float = 240.0,
+        refresh_every: int = TAB_REFRESH_EVERY,
+        new_chat=None,
+    ):
+        self.context = context
+        self.capture_mode = capture_mode
+        self.prompt_timeout_s = prompt_timeout_s
+        self.refresh_every = max(0, int(refresh_every))
+        # chat_reset.ChatReset: an empty temporary chat before every prompt.
+        self.new_chat = new_chat
+        self.min_dwell_s = _env_float("PROMPT_DWELL_MIN_S", 11.0)
+        self.max_dwell_s = max(self.min_dwell_s, _env_float("PROMPT_DWELL_MAX_S", 14.0))
+        self.stagger_min_s = _env_float("CHAT_TAB_STAGGER_MIN_S", TAB_STAGGER_MIN_S)
+        self.stagger_max_s = max(self.stagger_min_s, _env_float("CHAT_TAB_STAGGER_MAX_S", TAB_STAGGER_MAX_S))
+        self.next_send_at = 0.0
+        first = ChatTab(0, page, tap if tap is not None else self._make_tap(page), owned=False)
+        first.keep_active()
+        self.tabs: List[ChatTab] = [first]
+
+    def _make_tap(self, page):
+        tap_cls = ConversationStreamTap if self.capture_mode == "early" else FetchTee
+        return tap_cls(page).start()
+
+    def open(self, count: int) -> "ChatTabs":
+        """Open tabs up to `count`; a tab that fails to load is dropped, not fatal."""
+        while len(self.tabs) < count:
+            index = len(self.tabs)
+            page = None
+            try:
+                page = self.context.new_page()
+                # Tap before navigation: FetchTee's init script must precede the app's fetches.
+                tab = ChatTab(index, page, self._make_tap(page), owned=True)
+                tab.keep_active()
+                page.goto(CHAT_URL, wait_until="domcontentloaded")
+                page.wait_for_selector(TEXTAREA, timeout=60_000)
+                tab.close_popups()
+                activate_search(page)
+            except Exception as e:
+                print(f"[TABS] Could not open tab {index}: {type(e).__name__}: {e}")
+                if page is not None:
+                    try:
+                        page.close()
+                    except Exception:
+                        pass
+                break
+            self.tabs.append(tab)
+            print(f"[TABS] Tab {index} ready")
+        print(f"[TABS] {len(self.tabs)} chat tab(s) in this browser")
+        return self
+
+    # ------------------------------------------------------------- sending
+
+    def busy(self) -> int:
+        return sum(1 for tab in self.tabs if tab.busy)
+
+    def free_tab(self) -> Optional[ChatTab]:
+        now = time.time()
+        if now < self.next_send_at:
+            return None
+        for tab in self.tabs:
+            if not tab.busy and now >= tab.ready_at:
+                return tab
+        return None
+
+    def submit(self, tab: ChatTab, prompt: Prompt) -> None:
+        """Type and send `prompt` in `tab`; returns once it is sent, not answered."""
+        page = tab.page
+        if self.refresh_every and tab.prompts and tab.prompts % self.refresh_every == 0:
+            page.reload(wait_until="domcontentloaded")
+            page.wait_for_selector(TEXTAREA, timeout=60_000)
+            activate_search(page)
+            print(f"[TABS] Tab {tab.index} refreshed")
+        # Typing needs keyboard focus; the other tabs keep streaming (keep_active).
+        page.bring_to_front()
+        tab.close_popups()
+        if self.new_chat is not None:
+            self.new_chat.reset(page, prompt_id=prompt["id"], tab=tab.index)
+        page.wait_for_timeout(random.randint(2000, 5000))
+        page.click(TEXTAREA)
+        with tracer.span("typing", prompt_id=prompt["id"], tab=tab.index):
+            page.keyboard.type(str(prompt["prompt_text"]))
+        with tracer.span("submit", prompt_id=prompt["id"], tab=tab.index):
+            page.click(SEND_BUTTON)
+        now = time.time()
+        print(f"*** Input for ChatGPT (tab {tab.index}): ***\n{prompt['prompt_text']}")
+        tab.prompt = prompt
+        tab.sent_at = now
+        tab.prompts += 1
+        tab.ready_at = now + random.uniform(self.min_dwell_s, self.max_dwell_s)
+        self.next_send_at = now + random.uniform(self.stagger_min_s, self.stagger_max_s)
+
+    def fresh_chat(self, tab: ChatTab) -> None:
+        """Reopen the temporary chat in a free tab (drops the old conversation's DOM and heap)."""
+        tab.page.goto(CHAT_URL, wait_until="domcontentloaded")
+        tab.page.wait_for_selector(TEXTAREA, timeout=60_000)
+        tab.close_popups()
+        activate_search(tab.page)
+        print(f"[TABS] Tab {tab.index}: fresh temporary chat")
+
+    # ------------------------------------------------------------- waiting
+
+    def _finished(self) -> List[Tuple[ChatTab, Prompt, Optional[StreamRecord], Optional[str]]]:
+        done = []
+        now = time.time()
+        for tab in self.tabs:
+            if not tab.busy:
+                continue
+            # Same clock-skew margin as PromptCompletion.
+            since = tab.sent_at - 1.0
+            record = tab.tap.latest(since)
+            error = None
+            if record is not None and not record.streaming:
+                record, error = None, "conversation response was not streamable"
+            elif record is not None and (record.done or record.closed_at is not None):
+                # Already terminal: releases it and writes the timing row without waiting.
+                record = tab.tap.wait_for_terminal(since, 0, submitted_at=now)
+            elif now - tab.sent_at >= self.prompt_timeout_s:
+                if record is not None:
+                    print(f"[TABS] Tab {tab.index}: no terminal marker within {self.prompt_timeout_s:.0f}s")
+                record, error = None, f"no answer within {self.prompt_timeout_s:.0f}s"
+            else:
+                continue
+            done.append((tab, tab.prompt, record, error))
+            tab.prompt = None
+        return done
+
+    def poll(self, timeout_s: float, poll_ms: int = 100):
+        """Pump events until at least one prompt finished or `timeout_s` passed."""
+        deadline = time.time() + max(0.0, timeout_s)
+        pump = self.tabs[0].page
+        while True:
+            done = self._finished()
+            if done or time.time() >= deadline:
+                return done
+            pump.wait_for_timeout(poll_ms)
+
+    def close(self) -> None:
+        for tab in self.tabs:
+            tab.close()
+
+
+# -------------------------------------------------------------------- main
+
+
+class _FakePage:
+    """Just enough of a Playwright page for ChatTabs; a send starts a finished stream on its tap."""
+
+    def __init__(self, context):
+        self.context = context
+        self.tap = None
+        self.typed = ""
+        self.keyboard = self
+        self.url = CHAT_URL
+
+    def type(self, text, delay=None):
+        self.typed += text
+
+    def press(self, key):
+        # Enter picks the /search tool; the composer is empty again.
+        self.typed = ""
+
+    def click(self, selector):
+        if selector == SEND_BUTTON:
+            self.tap.sent(self.typed.strip())
+            self.typed = ""
+
+    def locator(self, selector):
+        return self
+
+    @property
+    def first(self):
+        return self
+
+    def is_visible(self):
+        return False
+
+    def goto(self, url, wait_until=None):
+        pass
+
+    def reload(self, wait_until=None):
+        pass
+
+    def wait_for_selector(self, selector, timeout=None):
+        pass
+
+    def wait_for_timeout(self, ms):
+        time.sleep(min(ms, 5) / 1000.0)
+
+    def bring_to_front(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _FakeContext:
+    def new_page(self):
+        return _FakePage(self)
+
+    def new_cdp_session(self, page):
+        return self
+
+    def send(self, method, params=None):
+        return {}
+
+    def detach(self):
+        pass
+
+
+class _FakeTap:
+    def __init__(self, page):
+        self.record = None
+        page.tap = self
+
+    def sent(self, prompt_text):
+        class _Parser:
+            answer = f"answer to {prompt_text}"
+            citations = ["https://example.com/"]
+
+        class _Record:
+            streaming = done = True
+            closed_at = time.time()
+            parser = _Parser()
+
+        self.record = _Record()
+
+    def latest(self, since=0.0):
+        return self.record
+
+    def wait_for_terminal(self, since, timeout_s, submitted_at=None):
+        record, self.record = self.record, None
+        return record
+
+    def stop(self):
+        pass
+
+
+def _selftest(count: int = 3, prompts: int = 7) -> int:
+    """Drive the test6 tab loop's calls (free_tab -> submit(tab, prompt) -> poll) against fake pages."""
+    context = _FakeContext()
+    first = _FakePage(context)
+    tabs = ChatTabs(context, first, tap=_FakeTap(first), refresh_every=2)
+    tabs._make_tap = _FakeTap
+    tabs.min_dwell_s = tabs.max_dwell_s = tabs.stagger_min_s = tabs.stagger_max_s = 0.0
+    tabs.open(count)
+    queue = [{"id": i, "prompt_text": f"prompt {i}"} for i in range(prompts)]
+    answers = {}
+    deadline = time.time() + 30
+    while (queue or tabs.busy()) and time.time() < deadline:
+        tab = tabs.free_tab() if queue else None
+        if tab is not None:
+            tabs.submit(tab, queue.pop(0))
+            continue
+        for tab, prompt, record, error in tabs.poll(1.0):
+            answers[prompt["id"]] = record.parser.answer if record is not None else error
+    tabs.close()
+    expected = {i: f"answer to prompt {i}" for i in range(prompts)}
+    if len(tabs.tabs) != count or answers != expected:
+        print(f"[TABS] selftest FAILED: {len(tabs.tabs)} tab(s), answers {answers}")
+        return 1
+    print(f"[TABS] selftest ok: {prompts} prompts over {count} tabs")
+    return 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Self-test the multi-tab loop against fake pages")
+    parser.add_argument("--selftest", action="store_true")
+    parser.add_argument("--tabs", type=int, default=3)
+    args = parser.parse_args()
+    if not args.selftest:
+        parser.print_help()
+        raise SystemExit(2)
+    raise SystemExit(_selftest(args.tabs))
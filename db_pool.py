@@ -0,0 +1,361 @@
+"""
+Process-wide PostgreSQL connection pool and DB call latency histograms.
+
+pick_prompt() and update_prompt_result() used to open a fresh
+psycopg.connect(DATABASE_URL) per call, paying TCP + TLS setup to RDS at
+least twice per prompt. execute() runs a statement on a pooled connection
+instead:
+
+- one psycopg_pool.ConnectionPool per process, opened lazily and closed at exit
+- connections are checked before being handed out (broken ones are replaced)
+  and use TCP keepalives so idle sockets survive NAT/RDS idle timeouts
+- a statement that fails on a connection-level error (OperationalError,
+  PoolTimeout) is retried once on a new connection
+
+Every labelled call is timed into a latency histogram keyed by label and mode
+("pool" or "connect"), so the same log holds before/after numbers. Set
+DB_POOL=0 to go back to one connection per call.
+
+    python db_pool.py --calls 50     # SELECT 1 round trips, fresh vs pooled
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+CONNECT_TIMEOUT_S = 8
+
+KEEPALIVE_KWARGS = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_fallback_warned = False
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+
+def _database_url() -> str:
+    database_url = os.getenv("DATABASE_URL", "").strip()
+    if not database_url:
+        raise RuntimeError("Missing DATABASE_URL in environment/.env")
+    return database_url
+
+
+def pool_enabled() -> bool:
+    global _fallback_warned
+    if (os.getenv("DB_POOL", "1") or "1").strip().lower() in {"0", "false", "no", "off"}:
+        return False
+    try:
+        import psycopg_pool  # type: ignore  # noqa: F401
+    except ImportError:
+        if not _fallback_warned:
+            _fallback_warned = True
+            print(
+                "[DB] WARNING: psycopg_pool is not installed; opening a connection per call. "
+                "Install psycopg[pool] (requirements.txt) or set DB_POOL=0 to silence this."
+            )
+        return False
+    return True
+
+
+def get_pool():
+    """The process-wide pool, opened on first use."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    with _pool_lock:
+        if _pool is None:
+            from psycopg_pool import ConnectionPool  # type: ignore
+
+            min_size = max(0, _env_int("DB_POOL_MIN", 1))
+            _pool = ConnectionPool(
+                _database_url(),
+                min_size=min_size,
+                max_size=max(1, min_size, _env_int("DB_POOL_MAX", 4)),
+                kwargs={"connect_timeout": CONNECT_TIMEOUT_S, **KEEPALIVE_KWARGS},
+                check=ConnectionPool.check_connection,
+                max_idle=float(_env_int("DB_POOL_MAX_IDLE_S", 300)),
+                reconnect_timeout=float(_env_int("DB_POOL_RECONNECT_TIMEOUT_S", 300)),
+                timeout=float(CONNECT_TIMEOUT_S),
+                name="prompts",
+                open=True,
+            )
+            atexit.register(close_pool)
+            print(f"[DB] Connection pool opened (min={_pool.min_size}, max={_pool.max_size})")
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        try:
+            pool.close()
+        except Exception as e:
+            print(f"[DB] Pool close failed: {e}")
+
+
+@contextmanager
+def connection() -> Iterator[Any]:
+    """A psycopg connection: borrowed from the pool, or a fresh one with DB_POOL=0."""
+    if pool_enabled():
+        with get_pool().connection() as conn:
+            yield conn
+        return
+    import psycopg  # type: ignore
+
+    with psycopg.connect(_database_url(), connect_timeout=CONNECT_TIMEOUT_S, **KEEPALIVE_KWARGS) as conn:
+        yield conn
+
+
+def dedicated_connection(autocommit: bool = True, database_url: Optional[str] = None):
+    """
+    A connection outside the pool, for session state the pool must not hand
+    on (LISTEN, CREATE INDEX CONCURRENTLY). The caller closes it.
+    """
+    import psycopg  # type: ignore
+
+    return psycopg.connect(
+        database_url or _database_url(),
+        autocommit=autocommit,
+        connect_timeout=CONNECT_TIMEOUT_S,
+        **KEEPALIVE_KWARGS,
+    )
+
+
+def execute(
+    sql: str,
+    params: Sequence[Any] = (),
+    fetch: str = "all",
+    label: Optional[str] = None,
+    retries: int = 1,
+) -> Any:
+    """
+    Run one statement and commit. fetch="all" returns fetchall(), "one"
+    fetchone(), anything else None. Connection-level failures are retried
+    `retries` times; the failed transaction was rolled back, so only a commit
+    whose acknowledgement was lost can run twice.
+    """
+    import psycopg  # type: ignore
+
+    attempt = 0
+    while True:
+        start = time.perf_counter()
+        try:
+            with connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql, tuple(params))
+                    if fetch == "all":
+                        result = cur.fetchall()
+                    elif fetch == "one":
+                        result = cur.fetchone()
+                    else:
+                        result = None
+                conn.commit()
+        except psycopg.OperationalError as e:
+            if attempt >= retries:
+                raise
+            attempt += 1
+            print(f"[DB] Connection error ({type(e).__name__}: {e}); retrying {attempt}/{retries}")
+            continue
+        if label:
+            histogram(label).observe(time.perf_counter() - start)
+        return result
+
+
+_column_types: Dict[str, str] = {}
+
+
+def column_type(table: str, column: str) -> str:
+    """
+    SQL type of table.column (e.g. "uuid"), cached. VALUES lists default to
+    text, so multi-row UPDATE ... FROM (VALUES ...) casts join keys to this to
+    keep the primary key index usable.
+    """
+    key = f"{table}.{column}"
+    if key not in _column_types:
+        row = execute(
+            """
+            SELECT format_type(atttypid, atttypmod)
+            FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attname = %s
+            """,
+            (table, column),
+            fetch="one",
+        )
+        _column_types[key] = row[0] if row else "text"
+    return _column_types[key]
+
+
+# ---------------------------------------------------------------- histograms
+
+
+class LatencyHistogram:
+    """Fixed log-spaced buckets in milliseconds; percentiles are bucket upper bounds."""
+
+    BOUNDS_MS = (5, 10, 20, 50, 100, 200, 350, 500, 750, 1000, 2000, 5000, 10000)
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000.0
+        index = len(self.BOUNDS_MS)
+        for i, bound in enumerate(self.BOUNDS_MS):
+            if ms <= bound:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_s += seconds
+            self.max_s = max(self.max_s, seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound (ms) of the bucket holding the q-th percentile."""
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return float(self.BOUNDS_MS[i]) if i < len(self.BOUNDS_MS) else round(self.max_s * 1000.0, 1)
+        return round(self.max_s * 1000.0, 1)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "count": self.count,
+            "mean_ms": round(self.total_s * 1000.0 / self.count, 1) if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_s * 1000.0, 1),
+            "buckets_ms": {
+                (f"<={b}" if i < len(self.BOUNDS_MS) else f">{self.BOUNDS_MS[-1]}"): n
+                for i, (b, n) in enumerate(zip(self.BOUNDS_MS + (None,), self.counts))
+                if n
+            },
+        }
+
+    def format(self) -> str:
+        s = self.summary()
+        if not s["count"]:
+            return f"{self.name}: no calls"
+        return (
+            f"{self.name}: n={s['count']} mean={s['mean_ms']}ms p50<={s['p50_ms']}ms "
+            f"p90<={s['p90_ms']}ms p99<={s['p99_ms']}ms max={s['max_ms']}ms"
+        )
+
+
+HISTOGRAMS: Dict[str, LatencyHistogram] = {}
+_histogram_lock = threading.Lock()
+
+
+def mode() -> str:
+    return "pool" if pool_enabled() else "connect"
+
+
+def histogram(label: str) -> LatencyHistogram:
+    """Histogram for `label` under the current connection mode, e.g. claim[pool]."""
+    name = f"{label}[{mode()}]"
+    with _histogram_lock:
+        hist = HISTOGRAMS.get(name)
+        if hist is None:
+            hist = HISTOGRAMS[name] = LatencyHistogram(name)
+    return hist
+
+
+def report(log_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Print every histogram and append one JSON row each to DB_LATENCY_LOG."""
+    rows = [h.summary() for h in HISTOGRAMS.values() if h.count]
+    for hist in HISTOGRAMS.values():
+        if hist.count:
+            print(f"[DB] latency {hist.format()}")
+    log = log_path if log_path is not None else os.getenv("DB_LATENCY_LOG", "screenshots/db_latency.jsonl")
+    if rows and log:
+        try:
+            path = Path(log)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps({"ts": time.time(), "pid": os.getpid(), **row}) + "\n")
+        except Exception as e:
+            print(f"[DB] Could not write latency log: {e}")
+    return rows
+
+
+# ---------------------------------------------------------------------- main
+
+
+def _round_trips(calls: int, run: Callable[[], None], label: str) -> LatencyHistogram:
+    hist = LatencyHistogram(label)
+    for _ in range(calls):
+        start = time.perf_counter()
+        run()
+        hist.observe(time.perf_counter() - start)
+    return hist
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare per-call connects with the pool (SELECT 1)")
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        _database_url()
+    except RuntimeError as e:
+        print(f"[DB] {e}")
+        return 2
+
+    def fresh():
+        os.environ["DB_POOL"] = "0"
+        execute("SELECT 1", fetch="one")
+
+    def pooled():
+        os.environ["DB_POOL"] = "1"
+        execute("SELECT 1", fetch="one")
+
+    previous = os.environ.get("DB_POOL")
+    try:
+        before = _round_trips(args.calls, fresh, "select1[connect]")
+        pooled()  # open the pool outside the measurement
+        after = _round_trips(args.calls, pooled, "select1[pool]")
+    finally:
+        if previous is None:
+            os.environ.pop("DB_POOL", None)
+        else:
+            os.environ["DB_POOL"] = previous
+        close_pool()
+    print(f"[DB] {before.format()}")
+    print(f"[DB] {after.format()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,422 @@
+"""
+Reconstructor for ChatGPT's `delta_encoding: "v1"` conversation stream.
+
+Each delta event is an op against a JSON pointer inside the current message
+document:
+
+    {"p": "", "o": "add", "v": {"message": {...}}, "c": 5}     new document
+    {"p": "/message/content/parts/0", "o": "append", "v": "Hel"}
+    {"v": "lo"}                                                 inherits p and o
+    {"p": "", "o": "patch", "v": [{"p": ..., "o": ..., "v": ...}, ...]}
+
+Ops are applied in place through a dispatch table keyed on path prefix, so the
+cost of an event depends on the op, never on how much metadata has piled up.
+Answer parts are kept as lists of pieces and only joined when read.
+
+    doc = DeltaV1Reconstructor()
+    for event in decoded_events:
+        doc.apply_event(event)
+    doc.answer, doc.content_references, doc.search_result_groups, doc.citations
+
+DeltaStreamParser plugs the reconstructor into SSEStreamParser's chunk framing.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional
+
+from sse_decode import DeltaEvent, decode_event
+from sse_stream import TERMINAL_EVENT_TYPES, SSEStreamParser
+
+PARTS_PATH = "/message/content/parts"
+TEXT_CONTENT_TYPES = {"text", "multimodal_text"}
+
+_ANSWER_CHANNELS = {None, "", "final"}
+_PARTS_ANCESTORS = {"/message", "/message/content", PARTS_PATH}
+_TURN_PATHS = {"/message", "/message/end_turn", "/message/status"}
+
+
+def _split_pointer(path: str) -> List[str]:
+    if not path:
+        return []
+    tokens = path.split("/")[1:] if path.startswith("/") else path.split("/")
+    return [t.replace("~1", "/").replace("~0", "~") for t in tokens]
+
+
+def _child(container, token: str, next_token: Optional[str]):
+    """Return container[token], creating it when a partial capture skipped it."""
+    if isinstance(container, list):
+        idx = int(token)
+        while len(container) <= idx:
+            container.append(None)
+        if container[idx] is None:
+            container[idx] = [] if (next_token or "").isdigit() else {}
+        return container[idx]
+    value = container.get(token)
+    if value is None:
+        value = [] if (next_token or "").isdigit() else {}
+        container[token] = value
+    return value
+
+
+def _apply_op(container, key: str, op: str, value) -> None:
+    """Apply one op to container[key]; container is a dict or list."""
+    if isinstance(container, list):
+        idx = len(container) if key == "-" else int(key)
+        if op == "remove":
+            if idx < len(container):
+                del container[idx]
+            return
+        while len(container) < idx:
+            container.append(None)
+        if op == "add" and idx < len(container) and key != "-":
+            container.insert(idx, value)
+            return
+        if idx == len(container):
+            container.append(None)
+        current = container[idx]
+        container[idx] = _merge(current, op, value)
+        return
+
+    if op == "remove":
+        container.pop(key, None)
+        return
+    container[key] = _merge(container.get(key), op, value)
+
+
+def _merge(current, op: str, value):
+    if op == "append" and current is not None:
+        if isinstance(current, str) and isinstance(value, str):
+            return current + value
+        if isinstance(current, list):
+            if isinstance(value, list):
+                current.extend(value)
+            else:
+                current.append(value)
+            return current
+        if isinstance(current, dict) and isinstance(value, dict):
+            current.update(value)
+            return current
+    if op == "truncate" and isinstance(value, int) and isinstance(current, (str, list)):
+        return current[:value]
+    return value
+
+
+class DeltaV1Reconstructor:
+    """In-memory message documents rebuilt from delta_encoding v1 ops."""
+
+    def __init__(self, on_text: Optional[Callable[[dict, str], None]] = None):
+        # on_text(message, text) fires for every piece of text added to a
+        # message's content parts (streamed answer deltas).
+        self.on_text = on_text
+        self.encoding: Optional[str] = None
+        self.documents: List[Dict[str, Any]] = []
+        self.op_count = 0
+        # Set once an assistant answer message reports end_turn and a
+        # finished status (the turn is over even if the socket stays open).
+        self.turn_complete = False
+
+        self._doc: Optional[Dict[str, Any]] = None
+        self._ropes: Dict[int, Dict[int, List[str]]] = {}
+        self._path = ""
+        self._op: Optional[str] = None
+        self._handlers: Dict[str, Callable[[dict, str, List[str], str, Any], None]] = {
+            "": self._apply_root,
+            "/message": self._apply_message,
+            PARTS_PATH: self._apply_parts,
+        }
+        self._resolved: Dict[str, tuple] = {}
+
+    # ---------------------------------------------------------------- input
+
+    def apply_event(self, event: Any) -> None:
+        """Apply one decoded stream payload; non-delta events are ignored."""
+        if isinstance(event, DeltaEvent):
+            if event.type is not None or (event.v is None and event.o is None):
+                return
+            self.apply_delta(event.p, event.o, event.v)
+        elif isinstance(event, dict):
+            if "type" in event or ("v" not in event and "o" not in event):
+                return
+            self.apply_delta(event.get("p"), event.get("o"), event.get("v"))
+        elif isinstance(event, str):
+            self.encoding = event
+
+    def apply_delta(self, path: Optional[str], op: Optional[str], value: Any) -> None:
+        """Apply one top-level op; a missing path/op is inherited from the last."""
+        if path is None:
+            path = self._path
+        if op is None:
+            op = self._op if self._op is not None else self._infer_op(path, value)
+        self._path = path
+        self._op = op
+        self.apply_op(path, op, value)
+
+    def apply_op(self, path: str, op: str, value: Any = None) -> None:
+        self.op_count += 1
+        if op == "patch":
+            if isinstance(value, list):
+                for sub in value:
+                    if isinstance(sub, dict):
+                        self.apply_op(sub.get("p") or "", sub.get("o") or "add", sub.get("v"))
+            return
+        handler, tokens = self._resolve(path)
+        handler(self._current(), path, tokens, op, value)
+
+    def _infer_op(self, path: str, value: Any) -> str:
+        # A capture that starts mid-stream has no op to inherit yet.
+        if not path and isinstance(value, list) and value and isinstance(value[0], dict) and "p" in value[0]:
+            return "patch"
+        if not path and isinstance(value, dict):
+            return "add"
+        return "append"
+
+    def _resolve(self, path: str):
+        hit = self._resolved.get(path)
+        if hit is None:
+            prefix = path
+            handler = None
+            while True:
+                handler = self._handlers.get(prefix)
+                if handler is not None or not prefix:
+                    break
+                prefix = prefix.rsplit("/", 1)[0]
+            hit = (handler or self._apply_pointer, _split_pointer(path))
+            self._resolved[path] = hit
+        return hit
+
+    def _current(self) -> Dict[str, Any]:
+        if self._doc is None:
+            self._new_document({})
+        return self._doc
+
+    def _new_document(self, doc: Dict[str, Any]) -> None:
+        self._doc = doc
+        self.documents.append(doc)
+        self._check_turn(doc)
+        message = doc.get("message")
+        content = message.get("content") if isinstance(message, dict) else None
+        parts = content.get("parts") if isinstance(content, dict) else None
+        if isinstance(parts, list):
+            rope = self._ropes.setdefault(id(doc), {})
+            for idx, part in enumerate(parts):
+                if isinstance(part, str):
+                    rope[idx] = [part]
+                    if part:
+                        self._emit(doc, part)
+
+    # ------------------------------------------------------------- handlers
+
+    def _apply_root(self, doc, path, tokens, op, value):
+        if path:
+            # Unregistered path that happens to resolve to the root handler.
+            self._apply_pointer(doc, path, tokens, op, value)
+            return
+        if op == "add" and isinstance(value, dict):
+            self._new_document(value)
+        elif op == "replace" and isinstance(value, dict):
+            if self.documents and self.documents[-1] is doc:
+                self.documents.pop()
+            self._ropes.pop(id(doc), None)
+            self._new_document(value)
+
+    def _apply_message(self, doc, path, tokens, op, value):
+        self._apply_pointer(doc, path, tokens, op, value)
+        if path in _PARTS_ANCESTORS:
+            # The whole message/content was swapped; rebuild the parts rope.
+            self._sync_parts_rope(doc)
+        if path in _TURN_PATHS:
+            self._check_turn(doc)
+
+    def _check_turn(self, doc):
+        message = doc.get("message")
+        if not isinstance(message, dict) or message.get("end_turn") is not True:
+            return
+        role = ((message.get("author") or {}).get("role") or "").lower()
+        if role == "assistant" and str(message.get("status") or "").startswith("finished") and self.is_answer_message(message):
+            self.turn_complete = True
+
+    def _apply_parts(self, doc, path, tokens, op, value):
+        if len(tokens) != 4 or not tokens[3].isdigit():
+            self._apply_pointer(doc, path, tokens, op, value)
+            self._ropes.pop(id(doc), None)
+            self._sync_parts_rope(doc)
+            return
+        idx = int(tokens[3])
+        rope = self._ropes.setdefault(id(doc), {})
+        pieces = rope.get(idx)
+        if op == "append" and pieces is not None and isinstance(value, str):
+            pieces.append(value)
+        elif op in {"add", "replace", "append"} and isinstance(value, str):
+            rope[idx] = [value]
+        elif op == "remove":
+            rope.pop(idx, None)
+            self._apply_pointer(doc, path, tokens, op, value)
+            return
+        else:
+            self._apply_pointer(doc, path, tokens, op, value)
+            rope.pop(idx, None)
+            return
+        if value:
+            self._emit(doc, value)
+
+    def _apply_pointer(self, doc, path, tokens, op, value):
+        if not tokens:
+            return
+        container = doc
+        for i, token in enumerate(tokens[:-1]):
+            container = _child(container, token, tokens[i + 1])
+            if not isinstance(container, (dict, list)):
+                return
+        _apply_op(container, tokens[-1], op, value)
+
+    # ---------------------------------------------------------------- text
+
+    def _emit(self, doc, text):
+        if self.on_text is not None:
+            self.on_text(doc.get("message") or {}, text)
+
+    def _sync_parts_rope(self, doc):
+        message = doc.get("message") or {}
+        parts = (message.get("content") or {}).get("parts")
+        if isinstance(parts, list):
+            self._ropes[id(doc)] = {i: [p] for i, p in enumerate(parts) if isinstance(p, str)}
+
+    def _parts_text(self, doc) -> str:
+        rope = self._ropes.get(id(doc))
+        if not rope:
+            return ""
+        return "".join("".join(rope[i]) for i in sorted(rope))
+
+    # --------------------------------------------------------------- output
+
+    def message(self, index: int = -1) -> Dict[str, Any]:
+        """Message dict with the rope joined back into content.parts."""
+        doc = self.documents[index]
+        rope = self._ropes.get(id(doc))
+        if rope:
+            message = _child(doc, "message", "content")
+            content = _child(message, "content", "parts")
+            parts = _child(content, "parts", "0")
+            for idx in sorted(rope):
+                while len(parts) <= idx:
+                    parts.append("")
+                parts[idx] = "".join(rope[idx])
+                rope[idx] = [parts[idx]]
+        return doc.get("message") or {}
+
+    @staticmethod
+    def is_answer_message(message: Dict[str, Any]) -> bool:
+        # Partial captures can leave author/recipient unset; treat unknown as
+        # eligible so the tail of a mid-stream export still yields an answer.
+        role = ((message.get("author") or {}).get("role") or "").lower()
+        if role and role != "assistant":
+            return False
+        recipient = str(message.get("recipient") or "").lower()
+        if recipient not in {"", "all"}:
+            return False
+        content = message.get("content") or {}
+        content_type = str(content.get("content_type") or "").lower() if isinstance(content, dict) else ""
+        if content_type and content_type not in TEXT_CONTENT_TYPES:
+            return False
+        return message.get("channel") in _ANSWER_CHANNELS
+
+    def _answer_doc(self) -> Optional[Dict[str, Any]]:
+        for doc in reversed(self.documents):
+            message = doc.get("message") or {}
+            if self.is_answer_message(message) and self._parts_text(doc):
+                return doc
+        return None
+
+    @property
+    def answer(self) -> str:
+        doc = self._answer_doc()
+        return self._parts_text(doc) if doc is not None else ""
+
+    @property
+    def content_references(self) -> List[Dict[str, Any]]:
+        doc = self._answer_doc()
+        if doc is None:
+            return []
+        refs = ((doc.get("message") or {}).get("metadata") or {}).get("content_references")
+        return [r for r in refs if isinstance(r, dict)] if isinstance(refs, list) else []
+
+    @property
+    def search_result_groups(self) -> List[Dict[str, Any]]:
+        groups: List[Dict[str, Any]] = []
+        for doc in self.documents:
+            found = ((doc.get("message") or {}).get("metadata") or {}).get("search_result_groups")
+            if isinstance(found, list):
+                groups.extend(g for g in found if isinstance(g, dict))
+        return groups
+
+    @property
+    def citations(self) -> List[str]:
+        """Cited URLs (content_references) first, then every search result URL."""
+        out: List[str] = []
+        seen = set()
+
+        def add(url):
+            if isinstance(url, str) and url.startswith("http") and url not in seen:
+                seen.add(url)
+                out.append(url)
+
+        for ref in self.content_references:
+            add(ref.get("url"))
+            for item in ref.get("items") or []:
+                if not isinstance(item, dict):
+                    continue
+                add(item.get("url"))
+                for site in item.get("supporting_websites") or []:
+                    if isinstance(site, dict):
+                        add(site.get("url"))
+        for group in self.search_result_groups:
+            for entry in group.get("entries") or []:
+                if isinstance(entry, dict):
+                    add(entry.get("url"))
+        return out
+
+
+class DeltaStreamParser(SSEStreamParser):
+    """
+    SSEStreamParser framing with v1 reconstruction instead of URL scanning.
+
+    feed()/close() return answer deltas as before; answer/citations come from
+    the reconstructed documents.
+    """
+
+    _decode = staticmethod(decode_event)
+
+    def __init__(self):
+        super().__init__()
+        self.document = DeltaV1Reconstructor(on_text=self._on_text)
+
+    def _on_text(self, message, text):
+        if DeltaV1Reconstructor.is_answer_message(message):
+            self._deltas.append(text)
+
+    def _handle_decoded(self, obj):
+        if isinstance(obj, DeltaEvent):
+            if obj.type in TERMINAL_EVENT_TYPES:
+                self.done = True
+        elif isinstance(obj, dict) and obj.get("type") in TERMINAL_EVENT_TYPES:
+            self.done = True
+        self.document.apply_event(obj)
+        if self.document.turn_complete:
+            self.done = True
+
+    @property
+    def answer(self) -> str:
+        return self.document.answer.strip()
+
+    @property
+    def citations(self) -> List[str]:
+        return self.document.citations
+
+
+def parse_delta_text(raw_text):
+    """Whole-body convenience wrapper: returns (answer, citations)."""
+    parser = DeltaStreamParser()
+    parser.feed(raw_text or "")
+    parser.close()
+    return parser.answer, parser.citations
@@ -0,0 +1,81 @@
+"""
+Reverse-label suffix index for classifying citation domains.
+
+build_metrics used to test every citation link against every competitor
+domain with _domain_matches (`domain == target or domain.endswith("." +
+target)`), i.e. O(links x competitors) string compares per row. DomainClassifier
+stores the tenant's own domain and its competitors in a trie keyed by reversed
+labels (com -> acme -> docs), so one walk over a link's labels finds every
+configured domain it is equal to or a subdomain of:
+
+- the tenant's own domain wins over competitors, as before
+- among matching competitors the first one in competitor_websites order wins,
+  as the old loop's `break` did
+
+Classifiers are immutable, so build_metrics caches one per distinct
+website/competitor definition and reuses it across prompts.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MINE = "mine"
+COMPETITOR = "competitor"
+OTHER = "other"
+
+# Rank of the tenant's own domain: below every competitor index.
+_MINE_RANK = -1
+
+
+class _Node:
+    __slots__ = ("children", "rank")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.rank: Optional[int] = None
+
+
+class DomainClassifier:
+    """classify(domain) -> (MINE | COMPETITOR | OTHER, matched configured domain or None)."""
+
+    def __init__(self, my_domain: str = "", competitor_domains: Iterable[str] = ()):
+        self.my_domain = (my_domain or "").lower()
+        self.competitor_domains: List[str] = []
+        self._root = _Node()
+        if self.my_domain:
+            self._insert(self.my_domain, _MINE_RANK)
+        for domain in competitor_domains:
+            domain = (domain or "").lower()
+            if domain and domain not in self.competitor_domains:
+                self._insert(domain, len(self.competitor_domains))
+                self.competitor_domains.append(domain)
+
+    def _insert(self, domain: str, rank: int) -> None:
+        node = self._root
+        for label in reversed(domain.split(".")):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = _Node()
+            node = child
+        if node.rank is None or rank < node.rank:
+            node.rank = rank
+
+    def classify(self, domain: str) -> Tuple[str, Optional[str]]:
+        if not domain:
+            return OTHER, None
+        best: Optional[int] = None
+        node = self._root
+        for label in reversed(domain.lower().split(".")):
+            node = node.children.get(label)
+            if node is None:
+                break
+            if node.rank is not None and (best is None or node.rank < best):
+                best = node.rank
+                if best == _MINE_RANK:
+                    break
+        if best is None:
+            return OTHER, None
+        if best == _MINE_RANK:
+            return MINE, self.my_domain
+        return COMPETITOR, self.competitor_domains[best]
@@ -1,3 +1,12 @@
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page
+
+
 def extract_raw_response(input_string: str) -> List[Dict[str, Any]]:
     """Parse ChatGPT's Server-Sent Events stream."""
     json_objects = []
@@ -0,0 +1,310 @@
+"""
+Live Prometheus metrics for a browser worker.
+
+With METRICS_PORT set, test6 serves GET /metrics in the Prometheus text format
+(version 0.0.4) from a daemon thread. It binds METRICS_HOST, default
+127.0.0.1. supervisor.py --metrics-port N gives worker i the port N + i.
+
+Exposed series (prefix scraper_):
+- prompts_total{status}
+- prompts_per_minute{status}: sliding 60 s window
+- prompt_failures_total{reason}: zero_citations, no_answer_captured,
+  exception, ...
+- browser_restarts_total{reason}
+- histograms:
+  - claim_seconds, db_write_seconds
+  - first_byte_seconds, stream_seconds: send click to first chunk, and to
+    the terminal marker
+  - answer_chars, citations
+- uptime_seconds
+
+The latency histograms are fed from tracing.Tracer.record, so they fill even
+with TRACE_LOG=0. The prompt counters and size histograms come from
+prompt_finished(), which test6 calls next to heartbeat.add.
+
+Recording a value costs one lock, one bisect and an add. Text is only built
+when something scrapes the endpoint, so it can stay on for whole sessions.
+
+    METRICS_PORT=9100 python test6.py
+    python live_metrics.py --scrape http://127.0.0.1:9100/metrics
+    python live_metrics.py --selftest          # serve sample data, scrape it, check it
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Optional, Tuple
+
+PREFIX = "scraper_"
+RATE_WINDOW_S = 60.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STREAM_BUCKETS = (1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 180.0, 240.0)
+
+# name -> (help, bucket upper bounds)
+HISTOGRAMS: Dict[str, Tuple[str, Tuple[float, ...]]] = {
+    "claim_seconds": ("Wait for the next claimed prompt", LATENCY_BUCKETS),
+    "db_write_seconds": ("Batch UPDATE time per written result", LATENCY_BUCKETS),
+    "first_byte_seconds": ("Send click to first conversation stream chunk", STREAM_BUCKETS),
+    "stream_seconds": ("Send click to stream terminal marker / end of body", STREAM_BUCKETS),
+    "answer_chars": ("Answer length of finished prompts", (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)),
+    "citations": ("Citations per finished prompt", (0, 1, 2, 5, 10, 20, 40, 80)),
+}
+
+COUNTERS: Dict[str, str] = {
+    "prompts_total": "Prompts finished, by status",
+    "prompt_failures_total": "Failed prompts, by restart reason",
+    "browser_restarts_total": "Browser restarts, by reason",
+}
+
+# tracing phase -> histogram
+PHASE_HISTOGRAMS = {
+    "claim": "claim_seconds",
+    "db_write": "db_write_seconds",
+    "first_byte": "first_byte_seconds",
+    "stream_end": "stream_seconds",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if value != int(value) else f"{int(value)}"
+
+
+def _label_text(labels: Labels) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+
+class Registry:
+    """Counters and histograms keyed by label set; render() builds the exposition text."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {name: {} for name in COUNTERS}
+        self._histograms: Dict[str, _Histogram] = {name: _Histogram(b) for name, (_, b) in HISTOGRAMS.items()}
+        self._recent: Deque[Tuple[float, str]] = deque()
+
+    def inc(self, name: str, n: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + n
+
+    def observe(self, name: str, value: Optional[float]) -> None:
+        if value is None:
+            return
+        with self._lock:
+            self._histograms[name].observe(float(value))
+
+    def prompt_finished(
+        self,
+        status: str,
+        reason: Optional[str] = None,
+        answer_chars: Optional[int] = None,
+        citations: Optional[int] = None,
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            self._recent.append((now, status))
+            self._trim(now)
+        self.inc("prompts_total", status=status)
+        if status != "completed":
+            self.inc("prompt_failures_total", reason=reason or "unknown")
+        if answer_chars is not None:
+            self.observe("answer_chars", answer_chars)
+        if citations is not None:
+            self.observe("citations", citations)
+
+    def _trim(self, now: float) -> None:
+        # Caller holds self._lock.
+        while self._recent and self._recent[0][0] < now - RATE_WINDOW_S:
+            self._recent.popleft()
+
+    def render(self) -> str:
+        now = time.time()
+        out = []
+        with self._lock:
+            self._trim(now)
+            per_minute: Dict[str, int] = {"completed": 0, "failed": 0}
+            for _, status in self._recent:
+                per_minute[status] = per_minute.get(status, 0) + 1
+            for name, help_text in COUNTERS.items():
+                out.append(f"# HELP {PREFIX}{name} {help_text}")
+                out.append(f"# TYPE {PREFIX}{name} counter")
+                for labels, value in sorted(self._counters[name].items()):
+                    out.append(f"{PREFIX}{name}{_label_text(labels)} {_fmt(value)}")
+            out.append(f"# HELP {PREFIX}prompts_per_minute Prompts finished in the last {RATE_WINDOW_S:.0f}s, by status")
+            out.append(f"# TYPE {PREFIX}prompts_per_minute gauge")
+            for status, n in sorted(per_minute.items()):
+                out.append(f'{PREFIX}prompts_per_minute{{status="{status}"}} {n}')
+            for name, (help_text, bounds) in HISTOGRAMS.items():
+                hist = self._histograms[name]
+                out.append(f"# HELP {PREFIX}{name} {help_text}")
+                out.append(f"# TYPE {PREFIX}{name} histogram")
+                cumulative = 0
+                for bound, n in zip(bounds, hist.counts):
+                    cumulative += n
+                    out.append(f'{PREFIX}{name}_bucket{{le="{_fmt(bound)}"}} {cumulative}')
+                out.append(f'{PREFIX}{name}_bucket{{le="+Inf"}} {hist.count}')
+                out.append(f"{PREFIX}{name}_sum {_fmt(hist.sum)}")
+                out.append(f"{PREFIX}{name}_count {hist.count}")
+        out.append(f"# HELP {PREFIX}uptime_seconds Seconds since this worker process started")
+        out.append(f"# TYPE {PREFIX}uptime_seconds gauge")
+        out.append(f"{PREFIX}uptime_seconds {_fmt(round(now - self.started_at, 1))}")
+        return "\n".join(out) + "\n"
+
+
+registry = Registry()
+
+
+# -------------------------------------------------------------- recording
+
+
+def observe_phase(phase: str, duration_s: Optional[float]) -> None:
+    name = PHASE_HISTOGRAMS.get(phase)
+    if name is not None and duration_s is not None:
+        registry.observe(name, max(0.0, duration_s))
+
+
+def prompt_finished(status: str, reason: Optional[str] = None, answer: Optional[str] = None, citations=None) -> None:
+    """One finished prompt; `reason` is the restart_reason key (e.g. zero_citations) for failures."""
+    registry.prompt_finished(
+        status,
+        reason=reason,
+        answer_chars=len(answer) if answer is not None else None,
+        citations=len(citations) if citations is not None else None,
+    )
+
+
+def browser_restart(reason: Optional[str]) -> None:
+    # restart_reason is "<key> prompt_id=..." / "<key> err=..."; label by the key.
+    registry.inc("browser_restarts_total", reason=(reason or "unknown").split()[0])
+
+
+# ----------------------------------------------------------------- serving
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start(port: Optional[int] = None, host: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on METRICS_PORT (no-op when unset/0); idempotent."""
+    global _server
+    if _server is not None:
+        return _server
+    if port is None:
+        try:
+            port = int(os.getenv("METRICS_PORT", "0") or 0)
+        except ValueError:
+            port = 0
+    if not port:
+        return None
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    try:
+        _server = _serve(host, port)
+    except OSError as e:
+        print(f"[METRICS] Could not serve on {host}:{port}: {e}")
+        return None
+    print(f"[METRICS] Serving http://{host}:{_server.server_address[1]}/metrics")
+    return _server
+
+
+def _serve(host: str, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="live-metrics", daemon=True).start()
+    return server
+
+
+# -------------------------------------------------------------------- main
+
+
+def _scrape(url: str) -> str:
+    from urllib.request import urlopen
+
+    with urlopen(url, timeout=5) as resp:
+        return resp.read().decode("utf-8")
+
+
+def _selftest() -> int:
+    # Port 0: any free port (start() reads 0 as "off").
+    server = _serve("127.0.0.1", 0)
+    prompt_finished("completed", answer="x" * 1200, citations=["a", "b", "c"])
+    prompt_finished("failed", reason="zero_citations", answer="y" * 300, citations=[])
+    browser_restart("zero_citations prompt_id=1")
+    observe_phase("claim", 0.003)
+    observe_phase("stream_end", 42.0)
+    text = _scrape(f"http://127.0.0.1:{server.server_address[1]}/metrics")
+    server.shutdown()
+    expected = (
+        'scraper_prompts_total{status="completed"} 1',
+        'scraper_prompt_failures_total{reason="zero_citations"} 1',
+        'scraper_browser_restarts_total{reason="zero_citations"} 1',
+        'scraper_prompts_per_minute{status="failed"} 1',
+        'scraper_claim_seconds_bucket{le="0.005"} 1',
+        'scraper_stream_seconds_bucket{le="45"} 1',
+        'scraper_answer_chars_count 2',
+        'scraper_citations_bucket{le="0"} 1',
+    )
+    missing = [line for line in expected if line not in text.splitlines()]
+    print(text)
+    if missing:
+        print(f"[METRICS] selftest FAILED, missing: {missing}")
+        return 1
+    print("[METRICS] selftest ok")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Scrape or self-test the worker metrics endpoint")
+    parser.add_argument("--scrape", metavar="URL", help="fetch and print a /metrics page")
+    parser.add_argument("--selftest", action="store_true", help="serve sample data on a free port and check the scrape")
+    args = parser.parse_args()
+    if args.scrape:
+        print(_scrape(args.scrape), end="")
+        return 0
+    if args.selftest:
+        return _selftest()
+    parser.print_help()
+    return 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,7 +3,6 @@ import json
 import os
 import re
 import time
-from urllib.parse import urlsplit, urlunsplit
 from seleniumbase import SB
 from utils import sleep_dbg
 from utils import save_ss
@@ -13,6 +12,9 @@ from is_pages.is_chat_ui import *
 from boomlify_codes import *
 from activate_search_mode import *
 from birthday_helpers import fill_birthday
+import db_pool
+from metrics import build_metrics
+from tracing import tracer
 
 
 t0 = time.perf_counter()
@@ -52,183 +54,6 @@ last_names = [
 
 # --------------------------------------------------------------------
 
-def _clean_link(raw):
-    raw = str(raw or "").strip()
-    if not raw:
-        return ""
-    if "://" not in raw:
-        raw = "https://" + raw
-    try:
-        parts = urlsplit(raw)
-    except Exception:
-        return ""
-    if not parts.hostname:
-        return ""
-    # Keep path/query, strip fragments for stable link matching.
-    return urlunsplit((parts.scheme, parts.netloc, parts.path, parts.query, ""))
-
-
-def _get_domain(raw_url):
-    if not raw_url:
-        return ""
-    try:
-        host = (urlsplit(raw_url).hostname or "").lower()
-    except Exception:
-        return ""
-    if host.startswith("www."):
-        host = host[4:]
-    return host
-
-
-def _domain_matches(domain, target):
-    if not domain or not target:
-        return False
-    return domain == target or domain.endswith("." + target)
-
-
-def _clean_list(items):
-    out = []
-    for item in items:
-        if isinstance(item, str):
-            url = _clean_link(item)
-            if url:
-                out.append(url)
-        elif isinstance(item, dict):
-            for key in ("url", "link", "href"):
-                raw = item.get(key)
-                if isinstance(raw, str):
-                    url = _clean_link(raw)
-                    if url:
-                        out.append(url)
-                    break
-    return out
-
-
-def _normalize_urls(value):
-    if value is None:
-        return []
-    if isinstance(value, bytes):
-        with suppress(Exception):
-            return _normalize_urls(json.loads(value.decode("utf-8")))
-        return []
-    if isinstance(value, str):
-        with suppress(Exception):
-            return _normalize_urls(json.loads(value))
-        return _clean_list([value])
-    if isinstance(value, dict):
-        return _clean_list([value])
-    if isinstance(value, list):
-        return _clean_list(value)
-    return []
-
-
-def _unique_links(items):
-    seen = set()
-    out = []
-    for item in items:
-        key = item.strip().lower()
-        if not key or key in seen:
-            continue
-        seen.add(key)
-        out.append(item)
-    return out
-
-
-def _read_brand_tokens(value):
-    if isinstance(value, str):
-        token = value.strip()
-        return [token] if token else []
-    if isinstance(value, list):
-        out = []
-        for item in value:
-            if isinstance(item, str):
-                token = item.strip()
-                if token:
-                    out.append(token)
-        return out
-    return []
-
-
-def _brand_tokens_from_website(value):
-    if value is None:
-        return []
-    if isinstance(value, bytes):
-        with suppress(Exception):
-            return _brand_tokens_from_website(json.loads(value.decode("utf-8")))
-        return []
-    if isinstance(value, str):
-        with suppress(Exception):
-            return _brand_tokens_from_website(json.loads(value))
-        return []
-    if isinstance(value, dict):
-        return _read_brand_tokens(value.get("brand_tokens")) + _read_brand_tokens(
-            value.get("brand_token")
-        )
-    if isinstance(value, list):
-        out = []
-        for item in value:
-            out += _brand_tokens_from_website(item)
-        return out
-    return []
-
-
-def _count_brand_mentions(domain, website, text):
-    text = str(text or "")
-    if not text.strip():
-        return 0
-    brand = domain.split(".")[0] if domain else ""
-    variants = [brand] if brand else []
-    variants += _brand_tokens_from_website(website)
-
-    seen = set()
-    count = 0
-    for variant in variants:
-        token = " ".join(str(variant or "").split()).strip()
-        if not token:
-            continue
-        key = token.lower()
-        if key in seen:
-            continue
-        seen.add(key)
-        pattern = re.compile(rf"(?i)\b{re.escape(token)}\b")
-        count += len(pattern.findall(text))
-    return count
-
-
-def build_metrics(response_text, source_links, website, competitor_websites):
-    website_urls = _normalize_urls(website)
-    my_domain = _get_domain(website_urls[0]) if website_urls else ""
-
-    competitor_domains = []
-    for url in _normalize_urls(competitor_websites):
-        domain = _get_domain(url)
-        if domain and domain not in competitor_domains:
-            competitor_domains.append(domain)
-
-    unique_links = _unique_links(_clean_list(source_links or []))
-
-    my_citations = []
-    competitor_citations = []
-    for link in unique_links:
-        domain = _get_domain(link)
-        if _domain_matches(domain, my_domain):
-            my_citations.append(link)
-            continue
-        for comp_domain in competitor_domains:
-            if _domain_matches(domain, comp_domain):
-                competitor_citations.append(link)
-                break
-
-    return {
-        "my_citations": my_citations,
-        "competitor_citations": competitor_citations,
-        "total_citations_count": len(unique_links),
-        "my_domain_citations_count": len(my_citations),
-        "my_brand_mentions_count": _count_brand_mentions(my_domain, website, response_text),
-        "appeared_links_unique": unique_links,
-    }
-
-
 def _to_jsonb(value):
     if value is None:
         return None
@@ -600,12 +425,27 @@ def create_chatgpt_account(sb):
 
 # --------------------------------------------------------------------
 
-def enter_prompt(sb, query):
+def enter_prompt(sb, query, wait_for_completion=None):
+    """
+    Type and send a prompt, then wait for the answer.
+
+    wait_for_completion(sent_at, timeout_s) replaces the fixed sleeps and the
+    stop-button poll with a network-driven wait (see
+    stream_capture.PromptCompletion); without it the legacy timing is kept.
+    Returns the send-click timestamp.
+    """
     sleep_dbg(sb, 2, 5)
-    sb.press_keys("#prompt-textarea", query)
+    with tracer.span("typing", chars=len(query)):
+        sb.press_keys("#prompt-textarea", query)
     save_ss(sb)
-    sb.click('button[data-testid="send-button"]')
+    with tracer.span("submit"):
+        sb.click('button[data-testid="send-button"]')
+    sent_at = time.time()
     print("*** Input for ChatGPT: ***\n%s" % query)
+    if wait_for_completion is not None:
+        wait_for_completion(sent_at, 120)
+        save_ss(sb)
+        return sent_at
     sb.sleep(3)
 
     with suppress(Exception):
@@ -615,6 +455,7 @@ def enter_prompt(sb, query):
         )
     sb.sleep(3)
     save_ss(sb)
+    return sent_at
 
 # --------------------------------------------------------------------
 
@@ -717,17 +558,11 @@ def pick_prompt(website_filter=None):
     query_attempted = False
 
     with suppress(ImportError):
-        import psycopg  # type: ignore
+        import psycopg  # type: ignore  # noqa: F401
 
         query_attempted = True
-        with psycopg.connect(database_url, connect_timeout=8) as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    claim_sql,
-                    tuple(query_params),
-                )
-                rows = cur.fetchall()
-            conn.commit()
+        # Pooled connection (db_pool): no TCP/TLS handshake per claim.
+        rows = db_pool.execute(claim_sql, query_params, fetch="all", label="claim")
 
     if not query_attempted:
         with suppress(ImportError):
@@ -927,30 +762,27 @@ def update_prompt_result(
         RETURNING id, status;
     """
 
-    import psycopg
-    with psycopg.connect(database_url, connect_timeout=8) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                sql,
-                (
-                    status,
-                    engine_account,
-                    prompt_text,
-                    response_text,
-                    error_text,
-                    _to_jsonb(source_links if status == "completed" else None),
-                    _to_jsonb(metrics["appeared_links_unique"]) if metrics else None,
-                    _to_jsonb(metrics["my_citations"]) if metrics else None,
-                    _to_jsonb(metrics["competitor_citations"]) if metrics else None,
-                    metrics["total_citations_count"] if metrics else None,
-                    metrics["my_domain_citations_count"] if metrics else None,
-                    metrics["my_brand_mentions_count"] if metrics else None,
-                    status,
-                    prompt_id,
-                ),
-            )
-            row = cur.fetchone()
-        conn.commit()
+    row = db_pool.execute(
+        sql,
+        (
+            status,
+            engine_account,
+            prompt_text,
+            response_text,
+            error_text,
+            _to_jsonb(source_links if status == "completed" else None),
+            _to_jsonb(metrics["appeared_links_unique"]) if metrics else None,
+            _to_jsonb(metrics["my_citations"]) if metrics else None,
+            _to_jsonb(metrics["competitor_citations"]) if metrics else None,
+            metrics["total_citations_count"] if metrics else None,
+            metrics["my_domain_citations_count"] if metrics else None,
+            metrics["my_brand_mentions_count"] if metrics else None,
+            status,
+            prompt_id,
+        ),
+        fetch="one",
+        label="update",
+    )
 
     if not row:
         if skip_if_missing:
@@ -22,6 +22,7 @@ from boomlify_codes import *
 from activate_search_mode import *
 from birthday_helpers import fill_birthday
 import mycdp.network as cdp_network
+from sse_stream import parse_json_text, parse_sse_text
 
 NETWORK_LOG = Path("screenshots/network_events.jsonl")
 CONVERSATION_EVENT_LOG = Path("screenshots/conversation_events.jsonl")
@@ -346,253 +347,15 @@ def _split_sse_events(raw_text):
     return events
 
 
-_devtools_ts_re = re.compile(r"^\d{2}:\d{2}:\d{2}\.\d{3}$")
-
-
-def _split_devtools_eventstream_events(raw_text):
-    """
-    DevTools "EventStream" tab can show lines like:
-      delta <json> 05:59:33.776
-    or (tab-separated):
-      delta\t<json>\t05:59:33.776
-    We normalize that into [{"event": "...", "data": "..."}] similar to SSE.
-    """
-    events = []
-    for line in (raw_text or "").splitlines():
-        if not line.strip():
-            continue
-
-        pieces = None
-        if "\t" in line:
-            parts = [p for p in line.split("\t") if p]
-            if len(parts) >= 2:
-                pieces = (parts[0].strip(), parts[1].strip())
-        else:
-            s = line.strip()
-            if " " in s:
-                head, rest = s.split(" ", 1)
-                head = head.strip()
-                rest = rest.strip()
-                # Strip trailing timestamp if present.
-                maybe = rest.rsplit(" ", 1)
-                if len(maybe) == 2 and _devtools_ts_re.match(maybe[1].strip()):
-                    rest = maybe[0].strip()
-                pieces = (head, rest)
-
-        if not pieces:
-            continue
-        event_name, data = pieces
-        if not event_name or data is None:
-            continue
-        events.append({"event": event_name, "data": str(data)})
-    return events
-
-
-def _split_stream_events(raw_text):
-    events = _split_sse_events(raw_text)
-    if events:
-        return events
-    return _split_devtools_eventstream_events(raw_text)
-
-
-def _safe_json_loads(text):
-    try:
-        return json.loads(text)
-    except Exception:
-        return None
-
-
-def _iter_json_nodes(node):
-    if isinstance(node, dict):
-        yield node
-        for value in node.values():
-            yield from _iter_json_nodes(value)
-    elif isinstance(node, list):
-        for item in node:
-            yield from _iter_json_nodes(item)
-
-
-def _collect_urls(value, out_list):
-    url_re = re.compile(r"https?://[^\s\"'<>]+")
-    if isinstance(value, str):
-        out_list.extend(url_re.findall(value))
-        return
-    if isinstance(value, dict):
-        for v in value.values():
-            _collect_urls(v, out_list)
-        return
-    if isinstance(value, list):
-        for item in value:
-            _collect_urls(item, out_list)
-
-
-def _collect_search_result_urls(value, out_list):
-    if isinstance(value, dict):
-        if value.get("type") == "search_result" and isinstance(value.get("url"), str):
-            out_list.append(value["url"])
-        for v in value.values():
-            _collect_search_result_urls(v, out_list)
-    elif isinstance(value, list):
-        for item in value:
-            _collect_search_result_urls(item, out_list)
-
-
-def _dedupe_urls(urls):
-    result = []
-    seen = set()
-    for url in urls:
-        clean = str(url).strip().rstrip(".,);]")
-        low = clean.lower()
-        if "chatgpt.com/backend" in low or "persistent.oaistatic.com" in low:
-            continue
-        if not clean or clean in seen:
-            continue
-        seen.add(clean)
-        result.append(clean)
-    return result
-
-
 def _extract_answer_and_citations_from_sse(raw_text):
-    events = _split_stream_events(raw_text)
-    assistant_started = False
-    assistant_response_started = False
-    answer_parts = []
-    citation_urls = []
-
-    for event in events:
-        payload = (event.get("data") or "").strip()
-        if not payload or payload == "[DONE]":
-            continue
-        obj = _safe_json_loads(payload)
-        if not isinstance(obj, dict):
-            continue
-
-        # Capture URLs opportunistically. Citations often arrive late as patch ops
-        # under "v": [{"p": "...content_references...", "o": "...", "v": ...}].
-        _collect_urls(obj, citation_urls)
-        _collect_search_result_urls(obj, citation_urls)
-
-        event_type = obj.get("type")
-        if event_type in {
-            "server_ste_metadata",
-            "message_metadata",
-            "output_message",
-            "message",
-        }:
-            _collect_urls(obj.get("metadata"), citation_urls)
-            _collect_urls(obj, citation_urls)
-
-        path_hint = str(obj.get("p") or "")
-        if "search_result_groups" in path_hint:
-            _collect_urls(obj.get("v"), citation_urls)
-            _collect_search_result_urls(obj.get("v"), citation_urls)
-
-        if isinstance(obj.get("v"), list):
-            # Patch-op list: collect URLs from each op's value.
-            for op in obj["v"]:
-                if not isinstance(op, dict):
-                    continue
-                _collect_urls(op.get("v"), citation_urls)
-                _collect_search_result_urls(op.get("v"), citation_urls)
-
-                op_path = str(op.get("p") or "")
-                op_action = str(op.get("o") or "")
-                op_value = op.get("v")
-                if (
-                    op_path == "/message/content/parts/0"
-                    and op_action in {"append", "replace"}
-                    and isinstance(op_value, str)
-                    and op_value
-                ):
-                    assistant_started = True
-                    assistant_response_started = True
-                    answer_parts.append(op_value)
-
-        message_obj = None
-        if isinstance(obj.get("v"), dict) and isinstance(obj["v"].get("message"), dict):
-            message_obj = obj["v"]["message"]
-        elif isinstance(obj.get("message"), dict):
-            message_obj = obj["message"]
-        if message_obj:
-            role = (((message_obj.get("author") or {}).get("role")) or "").lower()
-            if role == "assistant":
-                assistant_started = True
-                recipient = str(message_obj.get("recipient") or "").lower()
-                content = message_obj.get("content") or {}
-                content_type = str(content.get("content_type") or "").lower() if isinstance(content, dict) else ""
-                if recipient in {"", "all"} and content_type != "code":
-                    assistant_response_started = True
-                parts = content.get("parts") if isinstance(content, dict) else None
-                if isinstance(parts, list):
-                    for part in parts:
-                        if isinstance(part, str) and part:
-                            answer_parts.append(part)
-                if isinstance(content, dict):
-                    text_field = content.get("text")
-                    if (
-                        isinstance(text_field, str)
-                        and text_field.strip()
-                        and content_type != "code"
-                    ):
-                        answer_parts.append(text_field.strip())
-                _collect_urls(message_obj.get("metadata"), citation_urls)
-                _collect_search_result_urls(message_obj.get("metadata"), citation_urls)
-
-        # Streaming text chunks can arrive as direct patch ops or as {"v": "..."}.
-        if obj.get("p") == "/message/content/parts/0" and obj.get("o") in {"append", "replace"}:
-            if isinstance(obj.get("v"), str) and obj["v"]:
-                assistant_started = True
-                assistant_response_started = True
-                answer_parts.append(obj["v"])
-        elif assistant_started and obj.get("o") in {None, "append"} and isinstance(obj.get("v"), str):
-            # Streaming text chunks usually arrive as {"v": "..."}.
-            if obj["v"]:
-                answer_parts.append(obj["v"])
-                assistant_response_started = True
-
-        if obj.get("o") == "patch" and isinstance(obj.get("v"), list):
-            for patch_op in obj["v"]:
-                if not isinstance(patch_op, dict):
-                    continue
-                patch_path = patch_op.get("p")
-                patch_action = patch_op.get("o")
-                patch_value = patch_op.get("v")
-                if (
-                    assistant_started
-                    and patch_path == "/message/content/parts/0"
-                    and patch_action == "append"
-                    and isinstance(patch_value, str)
-                ):
-                    answer_parts.append(patch_value)
-                    assistant_response_started = True
-                if isinstance(patch_path, str) and patch_path.startswith("/message/metadata"):
-                    _collect_urls(patch_value, citation_urls)
-                    _collect_search_result_urls(patch_value, citation_urls)
-
-    answer = "".join(answer_parts).strip() if assistant_response_started else ""
-    _collect_urls(answer, citation_urls)
-    return answer, _dedupe_urls(citation_urls)
+    # Whole-body entry point kept for existing callers. The chunk-fed parser in
+    # sse_stream does the work, so live captures and saved files share one path.
+    return parse_sse_text(raw_text)
 
 
 def _extract_answer_and_citations_from_json(raw_text):
-    obj = _safe_json_loads((raw_text or "").strip())
-    if not obj:
-        return "", []
-    text_candidates = []
-    citation_urls = []
-
-    for item in _iter_json_nodes(obj):
-        for key, value in item.items():
-            key_l = str(key).lower()
-            if isinstance(value, str):
-                cleaned = value.strip()
-                if cleaned and key_l in {"text", "output_text", "answer", "final", "completion"}:
-                    text_candidates.append(cleaned)
-            if any(t in key_l for t in ("citation", "source", "url", "reference", "link")):
-                _collect_urls(value, citation_urls)
-
-    answer = max(text_candidates, key=len) if text_candidates else ""
-    return answer, _dedupe_urls(citation_urls)
+    # Shared with reparse_captures through sse_stream.
+    return parse_json_text(raw_text)
 
 
 def _extract_answer_and_citations(raw_text):
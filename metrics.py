@@ -0,0 +1,137 @@
+"""
+Citation and brand metrics stored on public.prompts.
+
+build_metrics() and the URL helpers it uses, kept free of the browser stack so
+the result writer and the metrics backfill (backfill_metrics.py) can import
+them without seleniumbase. main re-exports build_metrics.
+"""
+
+from contextlib import suppress
+from functools import lru_cache
+import json
+from urllib.parse import urlsplit, urlunsplit
+
+from brand_match import definition_key, matcher_for
+from domain_index import COMPETITOR, MINE, DomainClassifier
+
+
+def _clean_link(raw):
+    raw = str(raw or "").strip()
+    if not raw:
+        return ""
+    if "://" not in raw:
+        raw = "https://" + raw
+    try:
+        parts = urlsplit(raw)
+    except Exception:
+        return ""
+    if not parts.hostname:
+        return ""
+    # Keep path/query, strip fragments for stable link matching.
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, parts.query, ""))
+
+
+def _get_domain(raw_url):
+    if not raw_url:
+        return ""
+    try:
+        host = (urlsplit(raw_url).hostname or "").lower()
+    except Exception:
+        return ""
+    if host.startswith("www."):
+        host = host[4:]
+    return host
+
+
+def _domain_matches(domain, target):
+    if not domain or not target:
+        return False
+    return domain == target or domain.endswith("." + target)
+
+
+def _clean_list(items):
+    out = []
+    for item in items:
+        if isinstance(item, str):
+            url = _clean_link(item)
+            if url:
+                out.append(url)
+        elif isinstance(item, dict):
+            for key in ("url", "link", "href"):
+                raw = item.get(key)
+                if isinstance(raw, str):
+                    url = _clean_link(raw)
+                    if url:
+                        out.append(url)
+                    break
+    return out
+
+
+def _normalize_urls(value):
+    if value is None:
+        return []
+    if isinstance(value, bytes):
+        with suppress(Exception):
+            return _normalize_urls(json.loads(value.decode("utf-8")))
+        return []
+    if isinstance(value, str):
+        with suppress(Exception):
+            return _normalize_urls(json.loads(value))
+        return _clean_list([value])
+    if isinstance(value, dict):
+        return _clean_list([value])
+    if isinstance(value, list):
+        return _clean_list(value)
+    return []
+
+
+def _unique_links(items):
+    seen = set()
+    out = []
+    for item in items:
+        key = item.strip().lower()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        out.append(item)
+    return out
+
+
+def _count_brand_mentions(domain, website, text):
+    # One cached multi-pattern matcher per website definition (brand_match).
+    return matcher_for(domain, website).count(text)
+
+
+@lru_cache(maxsize=1024)
+def _domain_classifier(website_key, competitors_key):
+    # Keys are definition_key() strings; _normalize_urls parses them like the raw values.
+    website_urls = _normalize_urls(website_key)
+    my_domain = _get_domain(website_urls[0]) if website_urls else ""
+    competitor_domains = [_get_domain(url) for url in _normalize_urls(competitors_key)]
+    return DomainClassifier(my_domain, [d for d in competitor_domains if d])
+
+
+def build_metrics(response_text, source_links, website, competitor_websites):
+    # Cached per website/competitor definition: no JSON re-parse per row.
+    classifier = _domain_classifier(definition_key(website), definition_key(competitor_websites))
+    my_domain = classifier.my_domain
+
+    unique_links = _unique_links(_clean_list(source_links or []))
+
+    my_citations = []
+    competitor_citations = []
+    for link in unique_links:
+        kind, _ = classifier.classify(_get_domain(link))
+        if kind == MINE:
+            my_citations.append(link)
+        elif kind == COMPETITOR:
+            competitor_citations.append(link)
+
+    return {
+        "my_citations": my_citations,
+        "competitor_citations": competitor_citations,
+        "total_citations_count": len(unique_links),
+        "my_domain_citations_count": len(my_citations),
+        "my_brand_mentions_count": _count_brand_mentions(my_domain, website, response_text),
+        "appeared_links_unique": unique_links,
+    }
@@ -0,0 +1,464 @@
+"""
+The prompt claim statement, the indexes it needs, and a plan check.
+
+pick_prompt's claim filters on `status IN (pending, failed)` or a
+`processing` row whose claim is older than PROMPT_PROCESSING_STALE_S (a
+worker that died mid-prompt), `engine`, an optional `website @> jsonb`, an optional created_at today-window
+and non-empty prompt_text, then orders by a CASE on status, created_at and
+prompt_id under FOR UPDATE SKIP LOCKED. Without matching indexes that is a
+sequential scan of the whole table on every claim.
+
+- INDEXES: a partial btree on (engine, status, created_at, prompt_id) limited
+  to claimable rows with prompt text, and a partial GIN (jsonb_path_ops) on
+  website for the WEBSITE_FILTER containment test. Both predicates use the
+  PROMPT_*_STATUS values, so they match what build_claim_query binds.
+- check_claim_plan(): EXPLAIN (no ANALYZE, so nothing is locked or changed) of
+  the real claim statement; warns when public.prompts is read by a Seq Scan
+  or a recommended index is missing. test6 runs it once per process
+  (PROMPT_PLAN_CHECK=0 disables).
+- bench: seeds a scratch schema on a *local* Postgres with millions of rows
+  and times the claim before and after the indexes.
+
+    python prompt_claim.py migrate                 # CREATE INDEX CONCURRENTLY
+    python prompt_claim.py check [--website-filter '{"url": ...}']
+    python prompt_claim.py bench --database-url postgresql://localhost/bench --rows 2000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import db_pool
+
+TABLE = "public.prompts"
+
+# Small tables are read sequentially whatever indexes exist.
+SMALL_TABLE_ROWS = 10_000
+
+
+def _statuses() -> Tuple[str, str, str]:
+    return (
+        os.getenv("PROMPT_PENDING_STATUS", "pending").strip() or "pending",
+        os.getenv("PROMPT_FAILED_STATUS", "failed").strip() or "failed",
+        os.getenv("PROMPT_PROCESSING_STATUS", "processing").strip() or "processing",
+    )
+
+
+def processing_stale_s() -> float:
+    """Seconds a `processing` claim is leased to its worker before others may re-claim it."""
+    try:
+        return max(60.0, float(os.getenv("PROMPT_PROCESSING_STALE_S", "1800")))
+    except ValueError:
+        return 1800.0
+
+
+def build_claim_query(website_filter=None, batch_size=None):
+    """
+    The FOR UPDATE SKIP LOCKED claim statement used by test6.pick_prompt.
+    Returns (sql, params, only_today, (pending, failed, processing)).
+    """
+    if batch_size is None:
+        try:
+            batch_size = int(os.getenv("PROMPT_BATCH_SIZE", "1"))
+        except ValueError:
+            batch_size = 1
+    else:
+        try:
+            batch_size = int(batch_size)
+        except (TypeError, ValueError):
+            batch_size = 1
+    batch_size = max(1, batch_size)
+
+    prompt_engine = os.getenv("PROMPT_ENGINE", "chatgpt").strip() or "chatgpt"
+    engine_account = (
+        os.getenv("PROMPT_ENGINE_ACCOUNT", "github actions").strip()
+        or "github actions"
+    )
+    pending_status = os.getenv("PROMPT_PENDING_STATUS", "pending").strip() or "pending"
+    failed_status = os.getenv("PROMPT_FAILED_STATUS", "failed").strip() or "failed"
+    processing_status = os.getenv("PROMPT_PROCESSING_STATUS", "processing").strip() or "processing"
+
+    only_today_raw = os.getenv("PROMPT_ONLY_TODAY")
+    # Default: only process prompts created "today" (CURRENT_DATE in DB timezone).
+    # Set PROMPT_ONLY_TODAY=0/false/no to disable this filter.
+    if only_today_raw is None or not only_today_raw.strip():
+        only_today = True
+    else:
+        only_today = only_today_raw.strip().lower() in {"1", "true", "yes", "y"}
+    today_clause = ""
+    if only_today:
+        # Uses the DB session timezone for CURRENT_DATE.
+        today_clause = "AND created_at >= CURRENT_DATE AND created_at < (CURRENT_DATE + INTERVAL '1 day')"
+
+    website_filter_json = None
+    if website_filter is not None:
+        if isinstance(website_filter, (dict, list)):
+            website_filter_json = json.dumps(website_filter)
+        elif isinstance(website_filter, str):
+            text = website_filter.strip()
+            if not text or text.lower() in {"none", "null"}:
+                website_filter_json = None
+            elif text:
+                # Validate JSON text before sending it to Postgres jsonb operator.
+                try:
+                    json.loads(text)
+                    website_filter_json = text
+                except Exception:
+                    print(f"[WARN] Invalid WEBSITE_FILTER JSON, ignoring: {text}")
+                    website_filter_json = None
+        else:
+            raise ValueError("website_filter must be dict/list/JSON-string/None")
+
+    website_filter_clause = ""
+    if website_filter_json is not None:
+        website_filter_clause = "AND website @> %s::jsonb"
+
+    claim_sql = f"""
+        WITH picked AS (
+            SELECT id, status AS claimed_from
+            FROM public.prompts
+            WHERE (
+                    status IN (%s, %s)
+                    -- Prefetched rows wait in a worker's queue in processing: only
+                    -- re-claim them once that worker's lease has run out.
+                    OR (status = %s AND (started_at IS NULL OR started_at < NOW() - make_interval(secs => %s)))
+                )
+              AND engine = %s
+              {website_filter_clause}
+              {today_clause}
+              AND prompt_text IS NOT NULL
+              AND BTRIM(prompt_text) <> ''
+            ORDER BY
+                CASE status
+                    WHEN %s THEN 1
+                    WHEN %s THEN 2
+                    WHEN %s THEN 3
+                    ELSE 99
+                END,
+                created_at ASC,
+                prompt_id ASC
+            FOR UPDATE SKIP LOCKED
+            LIMIT %s
+        )
+        UPDATE public.prompts AS p
+        SET status = %s,
+            engine_account = %s,
+            -- The latest claim, which starts the lease checked above.
+            started_at = NOW(),
+            attempts = COALESCE(p.attempts, 0) + 1
+        FROM picked
+        WHERE p.id = picked.id
+        RETURNING
+            p.id,
+            p.prompt_id,
+            p.prompt_text,
+            p.status,
+            p.created_at,
+            p.website,
+            p.competitor_websites,
+            -- release_prompts restores this status, and only while the
+            -- claim (started_at) is still this one.
+            picked.claimed_from,
+            p.started_at;
+    """
+
+    query_params = [
+        pending_status,
+        failed_status,
+        processing_status,
+        processing_stale_s(),
+        prompt_engine,
+    ]
+    if website_filter_json is not None:
+        query_params.append(website_filter_json)
+    query_params.extend(
+        [
+            pending_status,
+            failed_status,
+            processing_status,
+            batch_size,
+            processing_status,
+            engine_account,
+        ]
+    )
+    statuses = (pending_status, failed_status, processing_status)
+    return claim_sql, query_params, only_today, statuses
+
+
+# ------------------------------------------------------------------- indexes
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def index_ddl(table: str = TABLE, concurrently: bool = True) -> List[Tuple[str, str]]:
+    """(index name, CREATE INDEX statement) for every index the claim needs."""
+    statuses = ", ".join(_quote_literal(s) for s in _statuses())
+    claimable = f"status IN ({statuses})"
+    how = "CONCURRENTLY IF NOT EXISTS" if concurrently else "IF NOT EXISTS"
+    return [
+        (
+            "prompts_claim_idx",
+            f"CREATE INDEX {how} prompts_claim_idx ON {table} "
+            f"(engine, status, created_at, prompt_id) "
+            f"WHERE {claimable} AND prompt_text IS NOT NULL AND BTRIM(prompt_text) <> ''",
+        ),
+        (
+            "prompts_claim_website_gin_idx",
+            f"CREATE INDEX {how} prompts_claim_website_gin_idx ON {table} "
+            f"USING gin (website jsonb_path_ops) WHERE {claimable}",
+        ),
+    ]
+
+
+def migrate(database_url: Optional[str] = None) -> List[str]:
+    """Create any missing claim index without blocking writers; returns the names created."""
+    created = []
+    existing = set(_index_names())
+    conn = db_pool.dedicated_connection(autocommit=True, database_url=database_url)
+    try:
+        for name, ddl in index_ddl():
+            if name in existing:
+                print(f"[DB][INDEX] {name} already exists")
+                continue
+            start = time.perf_counter()
+            # CONCURRENTLY cannot run inside a transaction block: autocommit.
+            conn.execute(ddl)
+            created.append(name)
+            print(f"[DB][INDEX] Created {name} in {time.perf_counter() - start:.1f}s")
+        conn.execute(f"ANALYZE {TABLE}")
+    finally:
+        conn.close()
+    return created
+
+
+def _index_names(table: str = TABLE) -> List[str]:
+    schema, _, name = table.rpartition(".")
+    rows = db_pool.execute(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = %s AND tablename = %s",
+        (schema or "public", name),
+        fetch="all",
+    )
+    return [row[0] for row in rows]
+
+
+# ---------------------------------------------------------------- plan check
+
+
+def _plan_nodes(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for child in node.get("Plans") or []:
+        yield from _plan_nodes(child)
+
+
+def _explain_json(explain_output: Any) -> Dict[str, Any]:
+    # psycopg returns json columns decoded; psycopg2 / text casts give a string.
+    if isinstance(explain_output, str):
+        explain_output = json.loads(explain_output)
+    return explain_output[0]
+
+
+def summarize_plan(plan: Dict[str, Any], relation: str = "prompts") -> Dict[str, Any]:
+    """How the plan reads `relation`: seq scans, indexes used, and the planner's cost."""
+    seq_scans = []
+    indexes = []
+    for node in _plan_nodes(plan["Plan"]):
+        if node.get("Relation Name") == relation and node.get("Node Type") == "Seq Scan":
+            seq_scans.append(node.get("Filter") or "")
+        if node.get("Index Name") and node.get("Relation Name", relation) == relation:
+            indexes.append(node["Index Name"])
+    return {
+        "index_driven": not seq_scans and bool(indexes),
+        "seq_scans": seq_scans,
+        "indexes": sorted(set(indexes)),
+        "total_cost": plan["Plan"].get("Total Cost"),
+        "execution_ms": plan.get("Execution Time"),
+    }
+
+
+def check_claim_plan(sql: str, params: Sequence[Any]) -> Dict[str, Any]:
+    """EXPLAIN the claim statement and warn when it is not index-driven."""
+    row = db_pool.execute("EXPLAIN (FORMAT JSON) " + sql, params, fetch="one", label="explain")
+    result = summarize_plan(_explain_json(row[0]))
+    names = set(_index_names())
+    result["missing_indexes"] = [name for name, _ in index_ddl() if name not in names]
+    estimate = db_pool.execute(
+        "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", (TABLE,), fetch="one"
+    )
+    result["estimated_rows"] = int(estimate[0]) if estimate and estimate[0] is not None else None
+
+    if result["missing_indexes"]:
+        print(
+            f"[DB][PLAN] Missing claim index(es): {', '.join(result['missing_indexes'])}. "
+            "Run `python prompt_claim.py migrate`."
+        )
+    if result["index_driven"]:
+        print(f"[DB][PLAN] Claim query is index-driven ({', '.join(result['indexes'])})")
+    elif (result["estimated_rows"] or 0) < SMALL_TABLE_ROWS:
+        print(f"[DB][PLAN] Claim query uses a seq scan; fine at ~{result['estimated_rows']} rows")
+    else:
+        print(
+            f"[DB][PLAN] WARNING: claim query is not index-driven on ~{result['estimated_rows']} rows "
+            f"(seq scan filter: {result['seq_scans'][0] if result['seq_scans'] else '-'}; "
+            f"cost {result['total_cost']})"
+        )
+    return result
+
+
+# --------------------------------------------------------------------- bench
+
+BENCH_SCHEMA = "claim_bench"
+
+BENCH_TABLE_SQL = """
+CREATE TABLE {table} (
+    id bigserial PRIMARY KEY,
+    prompt_id bigint NOT NULL,
+    prompt_text text,
+    status text NOT NULL,
+    engine text NOT NULL,
+    engine_account text,
+    website jsonb,
+    competitor_websites jsonb,
+    created_at timestamptz NOT NULL,
+    started_at timestamptz,
+    attempts integer
+)
+"""
+
+# ~90% completed history, a thin claimable tail spread over 60 days, 200 sites.
+BENCH_SEED_SQL = """
+INSERT INTO {table} (prompt_id, prompt_text, status, engine, website, created_at, attempts)
+SELECT g,
+       CASE WHEN g %% 97 = 0 THEN '' ELSE 'benchmark prompt ' || g END,
+       CASE WHEN r < 0.90 THEN 'completed'
+            WHEN r < 0.95 THEN %(pending)s
+            WHEN r < 0.98 THEN %(failed)s
+            ELSE %(processing)s END,
+       (ARRAY['chatgpt', 'perplexity', 'gemini'])[1 + g %% 3],
+       jsonb_build_object('url', 'https://site' || (g %% 200) || '.com'),
+       NOW() - (random() * INTERVAL '60 days'),
+       0
+FROM (SELECT g, random() AS r FROM generate_series(%(start)s, %(stop)s) AS g) AS s
+"""
+
+
+def _bench_cases() -> List[Tuple[str, Optional[str], str]]:
+    # (label, WEBSITE_FILTER, PROMPT_ONLY_TODAY)
+    return [
+        ("engine only", None, "0"),
+        ("engine + today", None, "1"),
+        ("engine + website", json.dumps({"url": "https://site7.com"}), "0"),
+    ]
+
+
+def _time_claim(conn, sql: str, params: Sequence[Any], repeat: int) -> Dict[str, Any]:
+    timings = []
+    summary: Dict[str, Any] = {}
+    for _ in range(repeat):
+        # EXPLAIN ANALYZE really claims rows: roll every run back.
+        with conn.transaction(force_rollback=True):
+            row = conn.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params).fetchone()
+        summary = summarize_plan(_explain_json(row[0]))
+        timings.append(summary["execution_ms"])
+    summary["median_ms"] = statistics.median(timings)
+    return summary
+
+
+def bench(database_url: str, rows: int, repeat: int, batch_size: int) -> int:
+    import psycopg  # type: ignore
+
+    table = f"{BENCH_SCHEMA}.prompts"
+    pending, failed, processing = _statuses()
+    with psycopg.connect(database_url, autocommit=True) as conn:
+        conn.execute(f"CREATE SCHEMA IF NOT EXISTS {BENCH_SCHEMA}")
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(BENCH_TABLE_SQL.format(table=table))
+        start = time.perf_counter()
+        step = 500_000
+        for first in range(1, rows + 1, step):
+            conn.execute(
+                BENCH_SEED_SQL.format(table=table),
+                {
+                    "pending": pending,
+                    "failed": failed,
+                    "processing": processing,
+                    "start": first,
+                    "stop": min(rows, first + step - 1),
+                },
+            )
+        conn.execute(f"ANALYZE {table}")
+        print(f"[BENCH] Seeded {rows} rows into {table} in {time.perf_counter() - start:.1f}s")
+
+        results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for phase in ("no indexes", "claim indexes"):
+            if phase == "claim indexes":
+                for name, ddl in index_ddl(table, concurrently=False):
+                    start = time.perf_counter()
+                    conn.execute(ddl)
+                    print(f"[BENCH] Built {name} in {time.perf_counter() - start:.1f}s")
+                conn.execute(f"ANALYZE {table}")
+            for label, website_filter, only_today in _bench_cases():
+                previous = os.environ.get("PROMPT_ONLY_TODAY")
+                os.environ["PROMPT_ONLY_TODAY"] = only_today
+                try:
+                    sql, params, _, _ = build_claim_query(website_filter, batch_size)
+                finally:
+                    if previous is None:
+                        os.environ.pop("PROMPT_ONLY_TODAY", None)
+                    else:
+                        os.environ["PROMPT_ONLY_TODAY"] = previous
+                sql = sql.replace(TABLE, table)
+                results.setdefault(label, {})[phase] = _time_claim(conn, sql, params, repeat)
+
+        print(f"\n[BENCH] claim of {batch_size} row(s), median of {repeat} EXPLAIN ANALYZE runs")
+        for label, phases in results.items():
+            before, after = phases["no indexes"], phases["claim indexes"]
+            speedup = before["median_ms"] / max(after["median_ms"], 1e-6)
+            print(
+                f"  {label:<18} {before['median_ms']:9.2f}ms -> {after['median_ms']:8.2f}ms "
+                f"({speedup:6.1f}x)  plan: {', '.join(after['indexes']) or 'seq scan'}"
+            )
+        conn.execute(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE")
+    return 0
+
+
+# ---------------------------------------------------------------------- main
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Claim-query indexes, plan check and benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="create the claim indexes (CONCURRENTLY) on DATABASE_URL")
+    check = sub.add_parser("check", help="EXPLAIN the claim query on DATABASE_URL")
+    check.add_argument("--website-filter", default=os.getenv("WEBSITE_FILTER"))
+    bench_parser = sub.add_parser("bench", help="seed a local Postgres and time the claim")
+    bench_parser.add_argument("--database-url", required=True, help="scratch database; a claim_bench schema is created and dropped")
+    bench_parser.add_argument("--rows", type=int, default=2_000_000)
+    bench_parser.add_argument("--repeat", type=int, default=5)
+    bench_parser.add_argument("--batch-size", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        return bench(args.database_url, max(1, args.rows), max(1, args.repeat), max(1, args.batch_size))
+    try:
+        db_pool._database_url()
+    except RuntimeError as e:
+        print(f"[DB] {e}")
+        return 2
+    if args.command == "migrate":
+        migrate()
+        return 0
+    sql, params, _, _ = build_claim_query(args.website_filter, 1)
+    result = check_claim_plan(sql, params)
+    print(json.dumps(result, indent=2, default=str))
+    return 0 if result["index_driven"] or not result["missing_indexes"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,158 @@
+"""
+LISTEN/NOTIFY wake-ups for idle browser workers.
+
+When the prompts table runs dry, test6 used to tear the browser down and the
+next batch paid a full cold start. With PROMPT_IDLE_TTL_S > 0 the prefetcher
+instead keeps the browser warm and blocks in PromptNotifier.wait(), which
+returns as soon as a NOTIFY arrives on PROMPT_NOTIFY_CHANNEL (default
+`prompts_pending`), or after the poll interval so a missing trigger only costs
+latency. The worker shuts down once it has been idle for the TTL.
+
+The channel is fed by a trigger on public.prompts that fires when a row
+becomes pending (insert, or a status change such as release_prompts putting
+claimed rows back). Postgres folds identical notifications within one
+transaction, so a bulk insert wakes listeners once.
+
+LISTEN needs a session-level connection, so the notifier keeps its own
+autocommit connection outside db_pool. Any connection error drops back to
+plain polling until the next wait() reconnects.
+
+    python prompt_notify.py --install-trigger    # create/replace the trigger
+    python prompt_notify.py --listen             # print notifications
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import Any, Optional
+
+import db_pool
+
+DEFAULT_CHANNEL = "prompts_pending"
+
+# One statement each: db_pool.execute uses the extended protocol, which takes a
+# single command per call.
+TRIGGER_SQL = (
+    """
+CREATE OR REPLACE FUNCTION public.notify_prompts_pending() RETURNS trigger AS $$
+BEGIN
+    IF NEW.status = %(pending)s
+       AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM NEW.status) THEN
+        PERFORM pg_notify(%(channel)s, COALESCE(NEW.engine::text, ''));
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""",
+    "DROP TRIGGER IF EXISTS prompts_pending_notify ON public.prompts",
+    """
+CREATE TRIGGER prompts_pending_notify
+    AFTER INSERT OR UPDATE OF status ON public.prompts
+    FOR EACH ROW EXECUTE FUNCTION public.notify_prompts_pending()
+""",
+)
+
+
+def channel_name() -> str:
+    return (os.getenv("PROMPT_NOTIFY_CHANNEL") or DEFAULT_CHANNEL).strip() or DEFAULT_CHANNEL
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+class PromptNotifier:
+    """wait(timeout_s) -> True when a prompt notification arrived, False on timeout."""
+
+    def __init__(self, channel: Optional[str] = None):
+        self.channel = channel or channel_name()
+        self.notifications = 0
+        self._conn: Any = None
+        self._disabled = False
+        self._warned = False
+
+    def _connect(self):
+        if self._conn is not None or self._disabled:
+            return self._conn
+        try:
+            import psycopg  # type: ignore  # noqa: F401
+        except ImportError:
+            self._disabled = True
+            return None
+        try:
+            conn = db_pool.dedicated_connection(autocommit=True)
+            conn.execute(f'LISTEN "{self.channel}"')
+        except Exception as e:
+            if not self._warned:
+                self._warned = True
+                print(f"[NOTIFY] LISTEN {self.channel} unavailable ({type(e).__name__}: {e}); polling instead")
+            return None
+        print(f"[NOTIFY] Listening on {self.channel}")
+        self._conn = conn
+        return conn
+
+    def wait(self, timeout_s: float) -> bool:
+        timeout_s = max(0.0, float(timeout_s))
+        conn = self._connect()
+        if conn is None:
+            time.sleep(timeout_s)
+            return False
+        try:
+            for note in conn.notifies(timeout=timeout_s, stop_after=1):
+                self.notifications += 1
+                print(f"[NOTIFY] {note.channel}: {note.payload or '-'}")
+                return True
+        except Exception as e:
+            print(f"[NOTIFY] Listener connection lost ({type(e).__name__}: {e}); reconnecting on next wait")
+            self.close()
+        return False
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def install_trigger(channel: Optional[str] = None) -> None:
+    pending_status = os.getenv("PROMPT_PENDING_STATUS", "pending").strip() or "pending"
+    # DDL: plpgsql bodies cannot take bind parameters, so inline the literals.
+    literals = {"pending": _quote_literal(pending_status), "channel": _quote_literal(channel or channel_name())}
+    for statement in TRIGGER_SQL:
+        db_pool.execute(statement % literals, fetch=None)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Prompt LISTEN/NOTIFY helper")
+    parser.add_argument("--install-trigger", action="store_true", help="create/replace the notify trigger on public.prompts")
+    parser.add_argument("--listen", action="store_true", help="print notifications until interrupted")
+    parser.add_argument("--channel", default=None)
+    args = parser.parse_args()
+
+    try:
+        db_pool._database_url()
+    except RuntimeError as e:
+        print(f"[NOTIFY] {e}")
+        return 2
+    channel = args.channel or channel_name()
+    if args.install_trigger:
+        install_trigger(channel)
+        print(f"[NOTIFY] Trigger prompts_pending_notify installed (channel {channel})")
+    if args.listen:
+        notifier = PromptNotifier(channel)
+        try:
+            while True:
+                notifier.wait(60.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            notifier.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,238 @@
+"""
+Prefetching prompt claimer for the browser loop.
+
+The loop used to call pick_prompt(batch_size=1) before every prompt, so each
+one paid a FOR UPDATE SKIP LOCKED claim round trip between answers.
+PromptPrefetcher claims `batch_size` prompts per statement on a background
+thread and hands them out from a local queue, claiming again as soon as the
+queue drops below `low_water`.
+
+close() returns prompts that were claimed but never handed out through the
+`release` callback (test6.release_prompts restores the status each was
+claimed from), so a restart or clean exit does not leave them in
+`processing`, where they would only be re-picked at the lowest priority.
+close() is also registered with atexit as a backstop.
+
+Claimed rows sit in `processing` while they wait here, and the claim query
+leaves them alone for PROMPT_PROCESSING_STALE_S after the claim. With
+`max_hold_s` set below that lease, a prompt held longer than it is not handed
+out (there may not be enough lease left to answer it) and is released right
+away instead, while the lease still keeps other workers off it.
+
+With `idle_ttl_s` > 0 an empty claim does not end the queue: the claimer
+blocks in `wait_for_work` (prompt_notify.PromptNotifier.wait: a NOTIFY, or the
+`poll_s` interval) and claims again, so the browser stays warm. next() only
+returns None after `idle_ttl_s` without a single claimed prompt.
+"""
+
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+Prompt = Dict[str, Any]
+
+
+class PromptPrefetcher:
+    """Background batch claimer; next() returns a prompt, or None once the DB has none left."""
+
+    def __init__(
+        self,
+        claim: Callable[[int], List[Prompt]],
+        release: Optional[Callable[[List[Prompt]], int]] = None,
+        batch_size: int = 5,
+        low_water: int = 2,
+        limit: int = 0,
+        wait_for_work: Optional[Callable[[float], bool]] = None,
+        idle_ttl_s: float = 0.0,
+        poll_s: float = 60.0,
+        max_hold_s: float = 0.0,
+    ):
+        self.claim = claim
+        self.release = release
+        self.batch_size = max(1, int(batch_size))
+        # Refill at least when the queue is empty.
+        self.low_water = min(max(1, int(low_water)), self.batch_size)
+        self.limit = max(0, int(limit))
+        self.wait_for_work = wait_for_work
+        self.idle_ttl_s = max(0.0, float(idle_ttl_s))
+        self.poll_s = max(1.0, float(poll_s))
+        self.max_hold_s = max(0.0, float(max_hold_s))
+        self.expired = 0
+        self.claimed = 0
+        self.handed_out = 0
+        self.idle_s = 0.0
+        self._idle_since: Optional[float] = None
+        # (claimed at, prompt), oldest first.
+        self._queue: Deque[Tuple[float, Prompt]] = deque()
+        self._cond = threading.Condition()
+        self._exhausted = False
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "PromptPrefetcher":
+        self._thread = threading.Thread(target=self._run, name="prompt-prefetch", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    # --------------------------------------------------------------- claiming
+
+    def _limit_reached(self) -> bool:
+        return bool(self.limit) and self.claimed >= self.limit
+
+    def _want(self) -> int:
+        # Caller holds self._cond.
+        if self._closed or self._exhausted or self._error is not None or self._limit_reached():
+            return 0
+        if len(self._queue) >= self.low_water:
+            return 0
+        if self.limit:
+            return min(self.batch_size, self.limit - self.claimed)
+        return self.batch_size
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                want = self._want()
+                while not want:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    want = self._want()
+            # The lease starts when the claim statement runs (started_at = NOW()).
+            claimed_at = time.monotonic()
+            try:
+                rows = self.claim(want) or []
+                error = None
+            except Exception as e:
+                rows, error = [], e
+            idle_left = 0.0
+            with self._cond:
+                if error is not None:
+                    print(f"[PROMPTS] Prefetch claim failed: {type(error).__name__}: {error}")
+                    self._error = error
+                elif not rows:
+                    idle_left = self._idle_left()
+                    if idle_left <= 0:
+                        self._exhausted = True
+                else:
+                    if self._idle_since is not None:
+                        self.idle_s += time.monotonic() - self._idle_since
+                        self._idle_since = None
+                    self.claimed += len(rows)
+                    self._queue.extend((claimed_at, row) for row in rows)
+                    print(f"[PROMPTS] Prefetched {len(rows)} prompt(s), {len(self._queue)} queued")
+                self._cond.notify_all()
+            if idle_left > 0:
+                self._idle_wait(min(idle_left, self.poll_s))
+
+    # ------------------------------------------------------------------ idling
+
+    def _idle_left(self) -> float:
+        # Caller holds self._cond. Seconds of idle time left before giving up.
+        if self.wait_for_work is None or not self.idle_ttl_s:
+            return 0.0
+        now = time.monotonic()
+        if self._idle_since is None:
+            self._idle_since = now
+            print(f"[PROMPTS] No prompts; keeping the browser warm for up to {self.idle_ttl_s:.0f}s")
+        return self.idle_ttl_s - (now - self._idle_since)
+
+    def _idle_wait(self, timeout_s: float) -> None:
+        """Block until a notification, `timeout_s`, or close(), in short slices."""
+        deadline = time.monotonic() + timeout_s
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self.wait_for_work(min(remaining, 5.0)):
+                return
+
+    # -------------------------------------------------------------- consuming
+
+    def _drop_expired(self, dropped: List[Prompt]) -> None:
+        # Caller holds self._cond; the caller releases `dropped` once it lets go.
+        if not self.max_hold_s:
+            return
+        cutoff = time.monotonic() - self.max_hold_s
+        while self._queue and self._queue[0][0] < cutoff:
+            _, prompt = self._queue.popleft()
+            self.expired += 1
+            dropped.append(prompt)
+            print(f"[PROMPTS] Skipping prompt {prompt['id']}: held over {self.max_hold_s:g}s")
+            # Refill if this emptied the queue.
+            self._cond.notify_all()
+
+    def _release(self, prompts: List[Prompt], what: str) -> int:
+        if not prompts:
+            return 0
+        ids = [str(p["id"]) for p in prompts]
+        if self.release is None:
+            print(f"[PROMPTS] {len(ids)} {what} prompt(s) left in processing: {', '.join(ids)}")
+            return 0
+        try:
+            released = self.release(prompts)
+        except Exception as e:
+            print(f"[PROMPTS] Could not release {len(ids)} {what} prompt(s): {type(e).__name__}: {e}")
+            return 0
+        print(f"[PROMPTS] Released {released}/{len(ids)} {what} prompt(s) to their pre-claim status")
+        return released
+
+    def ready(self) -> bool:
+        """True when next() would return (or raise) without blocking on a claim."""
+        dropped: List[Prompt] = []
+        with self._cond:
+            self._drop_expired(dropped)
+            ready = bool(
+                self._queue or self._error is not None or self._closed or self._exhausted or self._limit_reached()
+            )
+        self._release(dropped, "expired")
+        return ready
+
+    def next(self) -> Optional[Prompt]:
+        """
+        The next claimed prompt, blocking while a claim is in flight. Returns
+        None when the DB has no more prompts (or `limit` was reached); a failed
+        claim is raised here once the queue is empty.
+        """
+        dropped: List[Prompt] = []
+        try:
+            with self._cond:
+                self._drop_expired(dropped)
+                while not self._queue:
+                    if self._error is not None:
+                        error, self._error = self._error, None
+                        raise error
+                    if self._closed or self._exhausted or self._limit_reached():
+                        return None
+                    self._cond.wait()
+                    self._drop_expired(dropped)
+                _, prompt = self._queue.popleft()
+                self.handed_out += 1
+                # Wake the claimer if this dropped the queue below low_water.
+                self._cond.notify_all()
+                return prompt
+        finally:
+            self._release(dropped, "expired")
+
+    def close(self, timeout_s: float = 30.0) -> int:
+        """Stop claiming and release every prompt still queued; returns how many were released."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            # Let an in-flight claim land so its rows are released too.
+            thread.join(timeout=timeout_s)
+        with self._cond:
+            leftover = [prompt for _, prompt in self._queue]
+            self._queue.clear()
+        return self._release(leftover, "unstarted")
@@ -0,0 +1,357 @@
+"""
+Re-extract answers/citations from saved conversation captures, in parallel.
+
+A capture root is a directory laid out like master.py's `screenshots/` folder:
+
+    conversation_streams/<request_id>.stream.txt
+    conversation_bodies/<request_id>.body.txt
+    conversation_requests/<request_id>.request.txt
+    conversation_events.jsonl            (optional, request_id -> url)
+
+Each request's stream and body files are memory-mapped and fed as bytes to the
+delta_encoding parser in a process pool; a file that yields nothing as SSE is
+read as a plain JSON body, like master's capture path does. A per-root index keyed on file
+size/mtime (plus an optional content hash) and the parser source version lets
+unchanged requests be skipped (editing a parser module re-parses everything),
+and one JSON line per request is written to the output file.
+
+    python reparse_captures.py screenshots
+    python reparse_captures.py archive/*/screenshots --out all.jsonl --workers 8
+    python reparse_captures.py screenshots --force        # ignore the index
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from delta_encoding import DeltaStreamParser
+from sse_stream import parse_json_text
+
+STREAM_DIR = "conversation_streams"
+BODY_DIR = "conversation_bodies"
+REQUEST_DIR = "conversation_requests"
+EVENT_LOG = "conversation_events.jsonl"
+INDEX_FILE = "reparse_index.json"
+
+PRIMARY_CONVERSATION_PATHS = (
+    "/backend-anon/f/conversation",
+    "/backend-api/f/conversation",
+)
+
+# Parser modules whose source defines the output; editing any of them
+# invalidates the index.
+PARSER_MODULES = ("sse_stream.py", "sse_decode.py", "delta_encoding.py")
+
+
+def parser_version() -> str:
+    h = hashlib.blake2b(digest_size=8)
+    here = Path(__file__).resolve().parent
+    for name in PARSER_MODULES:
+        try:
+            h.update((here / name).read_bytes())
+        except OSError:
+            h.update(name.encode())
+    return h.hexdigest()
+
+
+def _capture_root(path: Path) -> Path:
+    # Accept either the screenshots/ folder itself or its parent.
+    if not (path / STREAM_DIR).is_dir() and (path / "screenshots" / STREAM_DIR).is_dir():
+        return path / "screenshots"
+    return path
+
+
+def _request_ids(root: Path) -> List[str]:
+    ids = set()
+    for sub, suffix in ((STREAM_DIR, ".stream.txt"), (BODY_DIR, ".body.txt"), (REQUEST_DIR, ".request.txt")):
+        folder = root / sub
+        if not folder.is_dir():
+            continue
+        with os.scandir(folder) as it:
+            for entry in it:
+                if entry.name.endswith(suffix):
+                    ids.add(entry.name[: -len(suffix)])
+    return sorted(ids)
+
+
+def _files(root: Path, request_id: str) -> Dict[str, Path]:
+    return {
+        "stream": root / STREAM_DIR / f"{request_id}.stream.txt",
+        "body": root / BODY_DIR / f"{request_id}.body.txt",
+        "request": root / REQUEST_DIR / f"{request_id}.request.txt",
+    }
+
+
+def _stat(path: Path) -> Optional[List[int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _digest(path: Path) -> Optional[str]:
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with path.open("rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def _url_map(root: Path) -> Dict[str, str]:
+    urls: Dict[str, str] = {}
+    log = root / EVENT_LOG
+    if not log.exists():
+        return urls
+    with log.open("r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            # Cheap pre-filter: most rows in a big log have no url at all.
+            if '"url"' not in line:
+                continue
+            try:
+                row = json.loads(line)
+            except Exception:
+                continue
+            request_id = row.get("request_id")
+            url = row.get("url")
+            if request_id and url and str(request_id) not in urls:
+                urls[str(request_id)] = str(url)
+    return urls
+
+
+def _is_primary(url: Optional[str], suffix: str = "") -> bool:
+    if not url:
+        return False
+    path = url.split("?", 1)[0].rstrip("/")
+    return any(path.endswith(p + suffix) for p in PRIMARY_CONVERSATION_PATHS)
+
+
+# ------------------------------------------------------------------- workers
+
+
+def _parse_file(path: Path) -> Tuple[str, List[str]]:
+    parser = DeltaStreamParser()
+    try:
+        with path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return "", []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    parser.feed(view)
+                    parser.close()
+                finally:
+                    view.release()
+                if parser.answer or parser.citations:
+                    return parser.answer, parser.citations
+                # Not SSE: plain JSON body, as master._extract_answer_and_citations falls back to.
+                return parse_json_text(mm[:].decode("utf-8", errors="replace"))
+    except OSError:
+        return "", []
+
+
+def reparse_request(task: Tuple[str, str, Optional[str]]) -> Dict[str, Any]:
+    """Worker: parse one request's stream and body; mirrors finalize_conversation_summary."""
+    root_str, request_id, url = task
+    files = _files(Path(root_str), request_id)
+    answer_stream, citations_stream = _parse_file(files["stream"])
+    answer_body, citations_body = _parse_file(files["body"])
+    answer = answer_stream if len(answer_stream) >= len(answer_body) else answer_body
+
+    citations = []
+    seen = set()
+    for cite in citations_stream + citations_body:
+        if cite in seen:
+            continue
+        seen.add(cite)
+        citations.append(cite)
+
+    return {
+        "root": root_str,
+        "request_id": request_id,
+        "url": url,
+        "is_primary_conversation": _is_primary(url),
+        "is_prepare_conversation": _is_primary(url, "/prepare"),
+        "answer": answer,
+        "answer_chars": len(answer),
+        "citations": citations,
+        "citations_count": len(citations),
+        "stream_file": str(files["stream"]) if files["stream"].exists() else None,
+        "body_file": str(files["body"]) if files["body"].exists() else None,
+        "request_file": str(files["request"]) if files["request"].exists() else None,
+    }
+
+
+# --------------------------------------------------------------------- index
+
+
+def _load_index(path: Path, version: str) -> Dict[str, Any]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    if data.get("parser_version") != version:
+        return {}
+    return data.get("requests") or {}
+
+
+def _save_index(path: Path, version: str, requests: Dict[str, Any]) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps({"parser_version": version, "requests": requests}), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _is_current(entry: Optional[Dict[str, Any]], files: Dict[str, Path], use_hash: bool) -> Tuple[bool, Dict[str, Any]]:
+    """Compare stream/body fingerprints with the index entry; return (fresh, new_entry)."""
+    new = {}
+    fresh = entry is not None
+    for kind in ("stream", "body"):
+        stat = _stat(files[kind])
+        new[kind] = stat
+        old = (entry or {}).get(kind)
+        if stat == old:
+            if use_hash:
+                new[kind + "_hash"] = (entry or {}).get(kind + "_hash")
+            continue
+        if use_hash and stat is not None and entry is not None:
+            # Touched but possibly unchanged (copied archives): compare contents.
+            digest = _digest(files[kind])
+            new[kind + "_hash"] = digest
+            if digest is not None and digest == entry.get(kind + "_hash"):
+                continue
+        fresh = False
+    if use_hash:
+        for kind in ("stream", "body"):
+            if new.get(kind) is not None and not new.get(kind + "_hash"):
+                new[kind + "_hash"] = _digest(files[kind])
+    return fresh, new
+
+
+# ---------------------------------------------------------------------- main
+
+
+def _read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    if not path.exists():
+        return
+    with path.open("r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except Exception:
+                continue
+
+
+def _write_jsonl(path: Path, rows: Iterable[Dict[str, Any]]) -> int:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    count = 0
+    with tmp.open("w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    os.replace(tmp, path)
+    return count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Re-parse saved conversation captures in parallel")
+    parser.add_argument("roots", nargs="+", help="capture dirs (screenshots/ or its parent)")
+    parser.add_argument("--out", default=None, help="summary JSONL (default: <first root>/conversation_summaries.jsonl)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="ignore the index and re-parse everything")
+    parser.add_argument("--hash", action="store_true", help="also compare content hashes when mtime/size changed")
+    args = parser.parse_args()
+
+    roots = [_capture_root(Path(r)) for r in args.roots]
+    missing = [str(r) for r in roots if not r.is_dir()]
+    if missing:
+        print(f"[REPARSE] Missing capture dir(s): {', '.join(missing)}", file=sys.stderr)
+        return 2
+    out_path = Path(args.out) if args.out else roots[0] / "conversation_summaries.jsonl"
+    version = parser_version()
+
+    # Rows already in the output; an index hit only counts if its row survived.
+    written_keys = {(row.get("root"), row.get("request_id")) for row in _read_jsonl(out_path)}
+
+    tasks = []
+    pending_index: Dict[Path, Dict[str, Any]] = {}
+    live_keys = set()
+    for root in roots:
+        index = {} if args.force else _load_index(root / INDEX_FILE, version)
+        pending_index[root] = {}
+        stale = []
+        for request_id in _request_ids(root):
+            key = (str(root), request_id)
+            live_keys.add(key)
+            fresh, entry = _is_current(index.get(request_id), _files(root, request_id), args.hash)
+            pending_index[root][request_id] = entry
+            if not fresh or key not in written_keys:
+                stale.append(request_id)
+        urls = _url_map(root) if stale else {}
+        tasks.extend((str(root), request_id, urls.get(request_id)) for request_id in stale)
+        print(f"[REPARSE] {root}: {len(pending_index[root])} requests, {len(stale)} to parse")
+
+    start = time.perf_counter()
+    results: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    if tasks:
+        workers = max(1, min(args.workers, len(tasks)))
+        if workers == 1:
+            mapped = map(reparse_request, tasks)
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            mapped = pool.map(reparse_request, tasks, chunksize=max(1, len(tasks) // (workers * 8)))
+        try:
+            for done, row in enumerate(mapped, 1):
+                results[(row["root"], row["request_id"])] = row
+                if done % 200 == 0 or done == len(tasks):
+                    print(f"[REPARSE] parsed {done}/{len(tasks)}")
+        finally:
+            if workers > 1:
+                pool.shutdown()
+    elapsed = time.perf_counter() - start
+
+    # Keep previous rows for skipped requests, replace re-parsed ones, drop
+    # rows whose capture files are gone. Rows of other roots pass through.
+    root_names = {str(root) for root in roots}
+
+    def rows():
+        written = set()
+        for row in _read_jsonl(out_path):
+            key = (row.get("root"), row.get("request_id"))
+            if key in written or (key[0] in root_names and key not in live_keys):
+                continue
+            written.add(key)
+            yield results.pop(key, row)
+        for key, row in sorted(results.items()):
+            yield row
+
+    total = _write_jsonl(out_path, rows())
+    for root in roots:
+        _save_index(root / INDEX_FILE, version, pending_index[root])
+
+    rate = len(tasks) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"[REPARSE] {len(tasks)} parsed in {elapsed:.1f}s ({rate:.1f} req/s), "
+        f"{total} rows -> {out_path.resolve()}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,373 @@
+"""
+Memory governor for the browser worker.
+
+Containers run with --memory=900m --memory-swap=900m, so running out of memory
+means the kernel OOM-kills Chrome (or the worker) mid-answer and the in-flight
+prompt is lost. Until now Chrome was only restarted after a failure or at
+MAX_PROMPTS_PER_SESSION, whatever its footprint.
+
+ResourceGovernor.sample() runs after every prompt and reads:
+- the cgroup's working set and limit: memory.current minus the inactive_file
+  page cache from memory.stat, against memory.max (v1: usage_in_bytes minus
+  total_inactive_file). Raw usage also counts cache the kernel reclaims
+  before any OOM kill, which keeps growing from screenshots, logs, the
+  result spool and Chrome's disk cache, so a long-running container would
+  drift over the marks with no real pressure.
+- PSS of this worker's process tree (/proc/<pid>/smaps_rollup; the pids
+  from psutil when installed), split into Chrome and Python. Chrome's
+  processes share most of their pages, and summed RSS counts those once per
+  process. RSS is used where smaps_rollup cannot be read, which
+  overestimates.
+- The page's JS heap and DOM node count, from the CDP call
+  Performance.getMetrics.
+
+It returns a planned action, taken between prompts so nothing in flight is
+lost:
+
+- "fresh_chat": usage at MEMORY_SOFT_PCT (default 75) of the limit, or a JS
+  heap over JS_HEAP_SOFT_MB (default 300). Reopening the temporary chat drops
+  the conversation's DOM and heap.
+- "restart": usage at MEMORY_HARD_PCT (default 88) of the limit, or still at
+  the soft mark right after a fresh chat. test6 ends the session and starts a
+  new browser. A planned restart is not counted against
+  MAX_BROWSER_RESTARTS once the session answered MEMORY_RECYCLE_MIN_PROMPTS
+  (default 5) prompts; a quicker one is, so a browser that cannot get under
+  the marks is not recycled without bound.
+
+The limit is the cgroup's memory.max. Without one, MEMORY_BUDGET_MB (default
+900) is measured against the process tree's PSS.
+
+Each sample is one row in MEMORY_LOG (default screenshots/memory.jsonl), and
+summary() gives the session peaks. LEAN_FLAGS are memory-lean Chrome switches
+applied at launch (CHROME_LEAN=0 skips them). CHROME_LEAN=aggressive adds
+AGGRESSIVE_FLAGS, which are not safe by default (see below).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import psutil  # type: ignore
+except ImportError:  # pragma: no cover - /proc fallback
+    psutil = None
+
+MB = 1024 * 1024
+
+# Fewer background services and caches; no effect on what the page renders
+# or on how tabs and extensions run.
+LEAN_FLAGS = (
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disk-cache-size=33554432",
+)
+
+# Opt-in (CHROME_LEAN=aggressive), not yet measured in a 900 MB container:
+# - --process-per-site puts every CHAT_TABS page on one renderer, and
+#   max-old-space-size caps that renderer's shared V8 heap, so concurrent
+#   tabs serialize and risk renderer OOM crashes.
+# - --disable-extensions breaks an authenticated proxy, which SeleniumBase
+#   implements as a generated extension. It is left out whenever the proxy
+#   carries credentials.
+AGGRESSIVE_FLAGS = (
+    "--disable-extensions",
+    "--process-per-site",
+    "--js-flags=--max-old-space-size=384",
+)
+
+CHROME_NAMES = ("chrome", "chromium", "chromedriver", "uc_driver")
+
+
+def lean_chromium_args(base: str, proxy: Optional[str] = None) -> str:
+    """SeleniumBase chromium_arg string with LEAN_FLAGS appended (unless CHROME_LEAN=0)."""
+    mode = (os.getenv("CHROME_LEAN", "1") or "1").strip().lower()
+    if mode in ("0", "false", "off", "no"):
+        return base
+    flags = list(LEAN_FLAGS)
+    if mode == "aggressive":
+        flags += [f for f in AGGRESSIVE_FLAGS if not (f == "--disable-extensions" and proxy and "@" in proxy)]
+    return ",".join([base, *flags]) if base else ",".join(flags)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    if not value or value == "max":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+# -------------------------------------------------------------- sampling
+
+
+def _read_stat(path: str, key: str) -> int:
+    """One counter from a cgroup memory.stat file; 0 if missing."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                name, _, value = line.partition(" ")
+                if name == key:
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def cgroup_memory() -> Tuple[Optional[int], Optional[int]]:
+    """(working set, limit) bytes for this container; limit None when unlimited."""
+    usage = _read_int("/sys/fs/cgroup/memory.current")
+    if usage is not None:
+        inactive = _read_stat("/sys/fs/cgroup/memory.stat", "inactive_file")
+        return max(0, usage - inactive), _read_int("/sys/fs/cgroup/memory.max")
+    usage = _read_int("/sys/fs/cgroup/memory/memory.usage_in_bytes")
+    limit = _read_int("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    # v1 reports "no limit" as a huge page-aligned number.
+    if limit is not None and limit >= 1 << 60:
+        limit = None
+    if usage is not None:
+        usage = max(0, usage - _read_stat("/sys/fs/cgroup/memory/memory.stat", "total_inactive_file"))
+    return usage, limit
+
+
+def _proc_children() -> Dict[int, List[int]]:
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r", encoding="utf-8") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The comm field may contain spaces; ppid is the second field after ")".
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def _proc_pss(pid: int) -> Optional[int]:
+    """Proportional set size from smaps_rollup (Linux 4.14+); None if unreadable."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _proc_rss_name(pid: int) -> Tuple[int, str]:
+    rss = 0
+    name = ""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("Name:"):
+                    name = line.split(None, 1)[1].strip()
+                elif line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+    return rss, name
+
+
+def process_tree_memory(root_pid: Optional[int] = None) -> Dict[str, int]:
+    """
+    PSS bytes of root_pid and its descendants: {"chrome", "python", "other",
+    "procs", "rss_procs"}. A process whose smaps_rollup cannot be read counts
+    its RSS instead (counted in "rss_procs"), which overstates shared pages.
+    """
+    root_pid = root_pid or os.getpid()
+    out = {"chrome": 0, "python": 0, "other": 0, "procs": 0, "rss_procs": 0}
+    if psutil is not None:
+        try:
+            root = psutil.Process(root_pid)
+            procs = [root] + root.children(recursive=True)
+            tree = []
+            for p in procs:
+                try:
+                    tree.append((p.pid, p.memory_info().rss, p.name()))
+                except psutil.Error:
+                    continue
+        except psutil.Error:
+            tree = []
+    else:
+        try:
+            children = _proc_children()
+        except OSError:
+            return out
+        tree = []
+        stack = [root_pid]
+        while stack:
+            pid = stack.pop()
+            tree.append((pid, *_proc_rss_name(pid)))
+            stack.extend(children.get(pid, ()))
+    for pid, rss, name in tree:
+        pss = _proc_pss(pid)
+        if pss is None:
+            pss = rss
+            out["rss_procs"] += 1
+        lname = name.lower()
+        key = "chrome" if any(n in lname for n in CHROME_NAMES) else ("python" if "python" in lname else "other")
+        out[key] += pss
+        out["procs"] += 1
+    return out
+
+
+class PageMetrics:
+    """Performance.getMetrics over a CDP session kept open on the page."""
+
+    def __init__(self, page):
+        self.page = page
+        self.session = None
+
+    def read(self) -> Dict[str, float]:
+        try:
+            if self.session is None:
+                self.session = self.page.context.new_cdp_session(self.page)
+                self.session.send("Performance.enable")
+            result = self.session.send("Performance.getMetrics")
+        except Exception:
+            self.session = None
+            return {}
+        return {m["name"]: m["value"] for m in result.get("metrics", [])}
+
+    def close(self) -> None:
+        if self.session is not None:
+            try:
+                self.session.detach()
+            except Exception:
+                pass
+            self.session = None
+
+
+# -------------------------------------------------------------- governor
+
+
+class ResourceGovernor:
+    """sample(prompt_id) after each prompt -> None, "fresh_chat" or "restart"."""
+
+    def __init__(self, pages: Optional[List[Any]] = None, session: Optional[str] = None):
+        self.soft_pct = _env_float("MEMORY_SOFT_PCT", 75.0)
+        self.hard_pct = max(self.soft_pct, _env_float("MEMORY_HARD_PCT", 88.0))
+        self.js_heap_soft_mb = _env_float("JS_HEAP_SOFT_MB", 300.0)
+        self.budget_mb = _env_float("MEMORY_BUDGET_MB", 900.0)
+        log = os.getenv("MEMORY_LOG", "screenshots/memory.jsonl")
+        self.log_path = Path(log) if (log or "").strip().lower() not in ("", "0", "false", "off", "none") else None
+        self.pages = [PageMetrics(p) for p in (pages or [])]
+        self.session = session
+        self.samples = 0
+        self.peaks: Dict[str, float] = {}
+        self.actions: Dict[str, int] = {}
+        self._fresh_since_sample = False
+        # Latest sample row (session_policy reads heap / DOM nodes from it).
+        self.last: Dict[str, Any] = {}
+
+    def add_page(self, page) -> None:
+        self.pages.append(PageMetrics(page))
+
+    def fresh_chat_done(self) -> None:
+        """Called after a fresh chat; if the next sample is still soft, escalate to a restart."""
+        self._fresh_since_sample = True
+
+    def sample(self, prompt_id: Any = None, **extra: Any) -> Optional[str]:
+        usage, limit = cgroup_memory()
+        tree = process_tree_memory()
+        heap_used = heap_total = nodes = 0.0
+        for pm in self.pages:
+            metrics = pm.read()
+            heap_used += metrics.get("JSHeapUsedSize", 0.0)
+            heap_total += metrics.get("JSHeapTotalSize", 0.0)
+            nodes += metrics.get("Nodes", 0.0)
+
+        tree_total = tree["chrome"] + tree["python"] + tree["other"]
+        if usage is not None and limit:
+            used_mb, limit_mb, basis = usage / MB, limit / MB, "cgroup"
+        else:
+            used_mb, limit_mb, basis = tree_total / MB, self.budget_mb, "pss" if not tree["rss_procs"] else "rss"
+        pct = 100.0 * used_mb / limit_mb if limit_mb else 0.0
+        heap_mb = heap_used / MB
+
+        action = None
+        reason = None
+        if pct >= self.hard_pct:
+            action, reason = "restart", f"{basis} {pct:.0f}% >= {self.hard_pct:.0f}%"
+        elif pct >= self.soft_pct or (self.js_heap_soft_mb and heap_mb >= self.js_heap_soft_mb):
+            reason = (
+                f"{basis} {pct:.0f}% >= {self.soft_pct:.0f}%"
+                if pct >= self.soft_pct
+                else f"JS heap {heap_mb:.0f}MB >= {self.js_heap_soft_mb:.0f}MB"
+            )
+            # A fresh chat did not bring it down: only a new browser will.
+            action = "restart" if self._fresh_since_sample else "fresh_chat"
+        self._fresh_since_sample = False
+
+        row = {
+            "ts": time.time(),
+            "session": self.session,
+            "prompt_id": str(prompt_id) if prompt_id is not None else None,
+            "basis": basis,
+            "used_mb": round(used_mb, 1),
+            "limit_mb": round(limit_mb, 1),
+            "pct": round(pct, 1),
+            "chrome_mb": round(tree["chrome"] / MB, 1),
+            "python_mb": round(tree["python"] / MB, 1),
+            "other_mb": round(tree["other"] / MB, 1),
+            "procs": tree["procs"],
+            "rss_procs": tree["rss_procs"],
+            "js_heap_used_mb": round(heap_mb, 1),
+            "js_heap_total_mb": round(heap_total / MB, 1),
+            "dom_nodes": int(nodes),
+            "action": action,
+            "reason": reason,
+            **extra,
+        }
+        self.samples += 1
+        for key in ("used_mb", "chrome_mb", "python_mb", "js_heap_used_mb", "dom_nodes"):
+            self.peaks[key] = max(self.peaks.get(key, 0.0), row[key])
+        if action:
+            self.actions[action] = self.actions.get(action, 0) + 1
+            print(f"[MEMORY] {action}: {reason} (chrome {row['chrome_mb']}MB, python {row['python_mb']}MB)")
+        self.last = row
+        self._log(row)
+        return action
+
+    def _log(self, row: Dict[str, Any]) -> None:
+        if self.log_path is None:
+            return
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.log_path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(row) + "\n")
+        except Exception as e:
+            print(f"[MEMORY] Could not write {self.log_path}: {e}")
+
+    def summary(self) -> str:
+        peaks = " ".join(f"{k}={v:g}" for k, v in self.peaks.items())
+        actions = " ".join(f"{k}={v}" for k, v in self.actions.items()) or "none"
+        return f"samples={self.samples} peak {peaks or '-'} actions {actions}"
+
+    def close(self) -> None:
+        for pm in self.pages:
+            pm.close()
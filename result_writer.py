@@ -0,0 +1,474 @@
+"""
+Write-behind prompt result writer with a local durable spool.
+
+update_prompt_result() runs build_metrics, the UPDATE and the commit inside the
+browser loop, so a slow or briefly unreachable RDS stalls the next prompt (and
+test6 turned a failed update into lost work). ResultWriter.submit() instead
+appends the result to an append-only JSONL spool (flushed + fsynced) and
+returns; a background thread computes metrics and writes queued results as one
+multi-row UPDATE ... FROM (VALUES ...) per flush.
+
+- on a connection-level failure (OperationalError / PoolTimeout) the batch
+  stays queued and is retried with backoff; the spool keeps it across a crash
+- the spool is replayed in order on start, before any new result
+- a batch never holds the same prompt twice, so results for one prompt land in
+  submit order (the `status <> 'completed'` guard still wins)
+- a batch rejected for any other reason is retried row by row; rows the DB
+  still rejects go to `<spool>.rejected.jsonl` instead of blocking the queue
+- a written batch appends one `{"done": [seq, ...]}` line to the spool, which
+  replay skips. The spool is only rewritten (compacted) once its dead lines
+  reach RESULT_SPOOL_COMPACT (default 500) and outnumber the queued results,
+  so a flush costs O(batch), not O(queue), and the rewrite runs outside the
+  queue lock. An empty queue truncates it.
+
+RESULT_WRITE_BEHIND=0 makes submit() wait for its write (the old behaviour,
+but through the same code path).
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import db_pool
+import metrics
+from tracing import tracer
+
+Result = Dict[str, Any]
+
+DEFAULT_SPOOL = "screenshots/result_spool.jsonl"
+
+# (VALUES column, SQL cast, SET expression)
+COLUMNS: Tuple[Tuple[str, str, str], ...] = (
+    ("status", "text", "v.status"),
+    ("engine_account", "text", "COALESCE(v.engine_account, p.engine_account)"),
+    ("prompt_text", "text", "COALESCE(v.prompt_text, p.prompt_text)"),
+    ("response_text", "text", "COALESCE(v.response_text, p.response_text)"),
+    ("error_text", "text", "COALESCE(v.error_text, p.error_text)"),
+    ("appeared_links", "jsonb", "COALESCE(v.appeared_links, p.appeared_links)"),
+    ("appeared_links_unique", "jsonb", "COALESCE(v.appeared_links_unique, p.appeared_links_unique)"),
+    ("my_citations", "jsonb", "COALESCE(v.my_citations, p.my_citations)"),
+    ("competitor_citations", "jsonb", "COALESCE(v.competitor_citations, p.competitor_citations)"),
+    ("total_citations_count", "integer", "COALESCE(v.total_citations_count, p.total_citations_count)"),
+    ("my_domain_citations_count", "integer", "COALESCE(v.my_domain_citations_count, p.my_domain_citations_count)"),
+    ("my_brand_mentions_count", "integer", "COALESCE(v.my_brand_mentions_count, p.my_brand_mentions_count)"),
+)
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    return raw.strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+
+def _to_jsonb(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        return json.dumps(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    try:
+        import psycopg  # type: ignore
+    except ImportError:
+        return False
+    return isinstance(error, psycopg.OperationalError)
+
+
+class ResultWriter:
+    """Background batch writer for prompt results; see the module docstring."""
+
+    def __init__(
+        self,
+        spool_path: Optional[str] = None,
+        build_metrics: Optional[Callable[..., Dict[str, Any]]] = None,
+        batch_size: int = 20,
+        flush_interval_s: float = 0.5,
+        max_backoff_s: float = 60.0,
+        write_behind: Optional[bool] = None,
+    ):
+        self.spool_path = Path(spool_path or os.getenv("RESULT_SPOOL", DEFAULT_SPOOL))
+        self.rejected_path = self.spool_path.with_suffix(".rejected.jsonl")
+        self._build_metrics = build_metrics
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval_s = max(0.0, float(flush_interval_s))
+        self.max_backoff_s = max(1.0, float(max_backoff_s))
+        self.write_behind = _env_flag("RESULT_WRITE_BEHIND", True) if write_behind is None else write_behind
+        self.written = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.failed_flushes = 0
+        self.compactions = 0
+        self.compact_after = max(1, _env_int("RESULT_SPOOL_COMPACT", 500))
+        # Spool lines replay no longer needs: written results and done markers.
+        self._spool_dead = 0
+        self._queue: Deque[Result] = deque()
+        self._in_flight = 0
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._spool_lock = threading.Lock()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------ spool
+
+    def _replay_spool(self) -> int:
+        if not self.spool_path.exists():
+            return 0
+        results: List[Result] = []
+        done = set()
+        with self.spool_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-append.
+                    print(f"[RESULTS] Skipping unreadable spool line: {line[:80]}")
+                    continue
+                if "done" in row:
+                    done.update(row["done"])
+                    self._spool_dead += 1
+                    continue
+                self._seq = max(self._seq, int(row.get("seq") or 0))
+                results.append(row)
+        replayed = 0
+        for result in results:
+            if result.get("seq") in done:
+                self._spool_dead += 1
+                continue
+            self._queue.append(result)
+            replayed += 1
+        if replayed:
+            print(f"[RESULTS] Replaying {replayed} spooled result(s) from {self.spool_path}")
+        return replayed
+
+    def _append_spool(self, result: Result) -> None:
+        line = json.dumps(result, ensure_ascii=False, default=str) + "\n"
+        with self._spool_lock:
+            self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.spool_path.open("a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _mark_done(self, batch: List[Result]) -> None:
+        """Record a written batch in the spool so replay skips it; compact when enough is dead."""
+        line = json.dumps({"done": [r["seq"] for r in batch]}) + "\n"
+        with self._spool_lock:
+            with self.spool_path.open("a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        self._spool_dead += len(batch) + 1
+        with self._cond:
+            if not self._queue:
+                # Everything spooled is written: truncating is O(1).
+                with self._spool_lock, self.spool_path.open("w", encoding="utf-8"):
+                    pass
+                self._spool_dead = 0
+                return
+            if self._spool_dead < max(self.compact_after, len(self._queue)):
+                return
+            live = list(self._queue)
+            last_seq = self._seq
+        self._compact_spool(live, last_seq)
+
+    def _compact_spool(self, live: List[Result], last_seq: int) -> None:
+        """Rewrite the spool to just `live`, plus anything submitted while writing it."""
+        # Writer thread only, between batches: the queue can only grow at the
+        # tail meanwhile, so results past `last_seq` are all that can be missed.
+        tmp = self.spool_path.with_suffix(".tmp")
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                for result in live:
+                    f.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            with self._cond, self._spool_lock:
+                late = [r for r in self._queue if r["seq"] > last_seq]
+                if late:
+                    with tmp.open("a", encoding="utf-8") as f:
+                        for result in late:
+                            f.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                tmp.replace(self.spool_path)
+                self._spool_dead = 0
+        except OSError as e:
+            # The uncompacted spool is still correct; try again after the next batch.
+            print(f"[RESULTS] Could not compact {self.spool_path}: {e}")
+            return
+        self.compactions += 1
+
+    # -------------------------------------------------------------- lifecycle
+
+    def start(self) -> "ResultWriter":
+        with self._cond:
+            self._replay_spool()
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    def submit(
+        self,
+        prompt_id: Any,
+        status: str,
+        response_text: Optional[str] = None,
+        error_text: Optional[str] = None,
+        prompt_text: Optional[str] = None,
+        source_links: Optional[List[str]] = None,
+        website: Any = None,
+        competitor_websites: Any = None,
+        engine_account: Optional[str] = "github actions",
+    ) -> int:
+        """Spool one result for update_prompt_result-style writing; returns its sequence number."""
+        with self._cond:
+            self._seq += 1
+            result = {
+                "seq": self._seq,
+                "id": str(prompt_id),
+                "status": status,
+                "response_text": response_text,
+                "error_text": error_text,
+                "prompt_text": prompt_text,
+                "source_links": list(source_links) if source_links is not None else None,
+                "website": website,
+                "competitor_websites": competitor_websites,
+                "engine_account": engine_account,
+                "submitted_at": time.time(),
+            }
+            # Spool under the queue lock so the file stays in submit order.
+            self._append_spool(result)
+            self._queue.append(result)
+            self._cond.notify_all()
+        if not self.write_behind:
+            self.flush()
+        return result["seq"]
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue) + self._in_flight
+
+    def flush(self, timeout_s: Optional[float] = None) -> bool:
+        """Wait until everything submitted so far is written; False on timeout."""
+        deadline = None if timeout_s is None else time.monotonic() + timeout_s
+        with self._cond:
+            self._cond.notify_all()
+            while self._queue or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout_s: float = 30.0) -> int:
+        """Try to drain the queue, then stop; returns how many results stay spooled."""
+        if self._thread is None:
+            return self.pending()
+        self.flush(timeout_s)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=5.0)
+        left = self.pending()
+        if left:
+            print(f"[RESULTS] {left} result(s) left in {self.spool_path}; replayed on next start")
+        return left
+
+    def summary(self) -> str:
+        return (
+            f"written={self.written} skipped={self.skipped} rejected={self.rejected} "
+            f"pending={self.pending()} failed_flushes={self.failed_flushes} compactions={self.compactions}"
+        )
+
+    # ---------------------------------------------------------------- writing
+
+    def _take_batch(self) -> List[Result]:
+        # Caller holds self._cond. Stops at a repeated prompt id so each prompt's
+        # results land in submit order.
+        batch: List[Result] = []
+        ids = set()
+        while self._queue and len(batch) < self.batch_size:
+            if self._queue[0]["id"] in ids:
+                break
+            result = self._queue.popleft()
+            ids.add(result["id"])
+            batch.append(result)
+        self._in_flight = len(batch)
+        return batch
+
+    def _run(self) -> None:
+        backoff_s = 1.0
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            if self.flush_interval_s and self.write_behind:
+                # Let results that finish close together share a statement.
+                time.sleep(self.flush_interval_s)
+            with self._cond:
+                batch = self._take_batch()
+            try:
+                self._write_batch(batch)
+                error = None
+            except Exception as e:
+                error = e
+            if error is None:
+                self._mark_done(batch)
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+                backoff_s = 1.0
+                continue
+
+            self.failed_flushes += 1
+            with self._cond:
+                # Back to the front, in order; the spool still has them.
+                self._queue.extendleft(reversed(batch))
+                self._in_flight = 0
+                self._cond.notify_all()
+            print(
+                f"[RESULTS] Flush of {len(batch)} result(s) failed ({type(error).__name__}: {error}); "
+                f"retrying in {backoff_s:.0f}s, {self.pending()} pending"
+            )
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(backoff_s)
+            backoff_s = min(backoff_s * 2, self.max_backoff_s)
+
+    def _write_batch(self, batch: List[Result]) -> None:
+        try:
+            self._update(batch)
+            return
+        except Exception as e:
+            if _is_connection_error(e):
+                raise
+            if len(batch) == 1:
+                self._reject(batch[0], e)
+                return
+            # Something in the batch was refused: isolate it.
+            print(f"[RESULTS] Batch of {len(batch)} rejected ({type(e).__name__}: {e}); writing row by row")
+        for result in batch:
+            try:
+                self._update([result])
+            except Exception as row_error:
+                if _is_connection_error(row_error):
+                    raise
+                self._reject(result, row_error)
+
+    def _reject(self, result: Result, error: BaseException) -> None:
+        self.rejected += 1
+        print(f"[RESULTS] Prompt {result['id']} result rejected: {type(error).__name__}: {error}")
+        try:
+            with self.rejected_path.open("a", encoding="utf-8") as f:
+                row = {**result, "error": f"{type(error).__name__}: {error}"}
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"[RESULTS] Could not write {self.rejected_path}: {e}")
+
+    def _metrics(self, result: Result) -> Optional[Dict[str, Any]]:
+        if result["status"] != "completed":
+            return None
+        build_metrics = self._build_metrics or metrics.build_metrics
+        with tracer.span("metrics", prompt_id=result["id"]):
+            return build_metrics(
+                response_text=result.get("response_text"),
+                source_links=result.get("source_links") or [],
+                website=result.get("website"),
+                competitor_websites=result.get("competitor_websites"),
+            )
+
+    def _update(self, batch: List[Result]) -> None:
+        # VALUES columns default to text; cast ids to the real column type.
+        id_type = db_pool.column_type("public.prompts", "id")
+        row_sql = "(" + ", ".join([f"%s::{id_type}"] + [f"%s::{cast}" for _, cast, _ in COLUMNS]) + ")"
+        params: List[Any] = []
+        for result in batch:
+            row_metrics = self._metrics(result)
+            completed = result["status"] == "completed"
+            params.extend(
+                [
+                    result["id"],
+                    result["status"],
+                    result.get("engine_account"),
+                    result.get("prompt_text"),
+                    result.get("response_text"),
+                    result.get("error_text"),
+                    _to_jsonb(result.get("source_links") if completed else None),
+                    _to_jsonb(row_metrics["appeared_links_unique"]) if row_metrics else None,
+                    _to_jsonb(row_metrics["my_citations"]) if row_metrics else None,
+                    _to_jsonb(row_metrics["competitor_citations"]) if row_metrics else None,
+                    row_metrics["total_citations_count"] if row_metrics else None,
+                    row_metrics["my_domain_citations_count"] if row_metrics else None,
+                    row_metrics["my_brand_mentions_count"] if row_metrics else None,
+                ]
+            )
+        names = ", ".join(["id"] + [name for name, _, _ in COLUMNS])
+        assignments = ",\n            ".join(f"{name} = {expr}" for name, _, expr in COLUMNS)
+        sql = f"""
+        UPDATE public.prompts AS p
+        SET {assignments},
+            finished_at = CASE
+                WHEN v.status IN ('completed', 'failed') THEN NOW()
+                ELSE p.finished_at
+            END
+        FROM (VALUES {", ".join([row_sql] * len(batch))}) AS v({names})
+        WHERE p.id = v.id AND p.status <> 'completed'
+        RETURNING p.id, p.status;
+        """
+        start = time.time()
+        ok = False
+        try:
+            rows = db_pool.execute(sql, params, fetch="all", label="update_batch")
+            ok = True
+        finally:
+            # One span per prompt: the batch UPDATE is its DB write.
+            elapsed = time.time() - start
+            for result in batch:
+                tracer.record("db_write", elapsed, start=start, prompt_id=result["id"], ok=ok, batch=len(batch))
+        updated = {str(row[0]) for row in rows}
+        for result in batch:
+            if result["id"] in updated:
+                self.written += 1
+            else:
+                self.skipped += 1
+                print(f"[PROMPTS][SKIP] Prompt {result['id']} not updated (missing/already completed).")
+        lag_s = time.time() - min(float(r.get("submitted_at") or time.time()) for r in batch)
+        print(f"[RESULTS] Wrote {len(updated)}/{len(batch)} result(s) in one UPDATE (lag {lag_s:.1f}s)")
+
+
+_writer: Optional[ResultWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(**kwargs: Any) -> ResultWriter:
+    """The process-wide writer, started (and its spool replayed) on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ResultWriter(**kwargs).start()
+    return _writer
@@ -0,0 +1,271 @@
+"""
+Adaptive refresh / recycle policy for a browser session.
+
+test6 used to refresh the page every 50 prompts, whatever the page's state,
+and restart the browser after any zero-citation or no-answer prompt.
+SessionPolicy decides from what it sees instead. It is called once per
+finished prompt and returns one of:
+
+- "refresh": sb.refresh_page() + activate_search_mode. Triggered by:
+  - DOM nodes per page over POLICY_DOM_NODES (default 15000);
+  - JS heap up by POLICY_HEAP_GROWTH_MB (default 120) since the last
+    refresh;
+  - answer latency drifting up: the EWMA of send -> answer time over
+    POLICY_LATENCY_RATIO (1.6) x the median of the first
+    POLICY_BASELINE_PROMPTS (5) answers after the last refresh.
+- "fresh_chat": from ResourceGovernor (memory soft mark).
+- "restart": from ResourceGovernor (hard mark). A failed prompt triggers it
+  once POLICY_MAX_ERRORS (2) of the last POLICY_ERROR_WINDOW (10) prompts
+  failed, or on an exception. The first zero-citation / no-answer failure
+  only refreshes.
+- None: carry on.
+
+DOM nodes and heap come from the governor's sample, so the policy costs
+nothing beyond it.
+
+SESSION_POLICY=fixed keeps the old rule: refresh every 50 prompts, restart on
+every failure.
+
+Every action taken is timed and appended to POLICY_LOG (default
+screenshots/session_policy.jsonl). A row holds the action, the trigger, its
+wall-time cost, the prompts since the previous action and the signals at
+that point. test6 also logs a "restart" row (cost = session teardown) and a
+"session_start" row for each browser (cost = time to ready-to-type), so the
+full price of a restart sits in the same file as the refreshes it competes
+with.
+
+    python session_policy.py                  # cost and interval per action
+    python session_policy.py workers/*/screenshots/session_policy.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+DEFAULT_LOG = "screenshots/session_policy.jsonl"
+
+FIXED_REFRESH_EVERY = 50
+
+# Failures the page itself can cause; anything else restarts right away.
+SOFT_FAILURES = ("zero_citations", "no_answer_captured")
+
+Decision = Tuple[Optional[str], Optional[str]]
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+
+class SessionPolicy:
+    """after_prompt(...) / after_failure(...) -> (action, reason); recycled(...) after acting."""
+
+    def __init__(self, governor=None, session: Optional[str] = None, mode: Optional[str] = None):
+        self.governor = governor
+        self.session = session
+        self.mode = (mode or os.getenv("SESSION_POLICY", "adaptive") or "adaptive").strip().lower()
+        self.dom_nodes = _env_float("POLICY_DOM_NODES", 15000)
+        self.heap_growth_mb = _env_float("POLICY_HEAP_GROWTH_MB", 120.0)
+        self.latency_ratio = _env_float("POLICY_LATENCY_RATIO", 1.6)
+        self.baseline_prompts = max(1, _env_int("POLICY_BASELINE_PROMPTS", 5))
+        self.max_errors = max(1, _env_int("POLICY_MAX_ERRORS", 2))
+        self.outcomes: Deque[bool] = deque(maxlen=max(1, _env_int("POLICY_ERROR_WINDOW", 10)))
+        log = os.getenv("POLICY_LOG", DEFAULT_LOG)
+        self.log_path = Path(log) if (log or "").strip().lower() not in ("", "0", "false", "off", "none") else None
+        self.prompts = 0
+        self.actions: Dict[str, int] = defaultdict(int)
+        self.cost_s: Dict[str, float] = defaultdict(float)
+        self._reset_baselines()
+
+    @property
+    def fixed(self) -> bool:
+        return self.mode == "fixed"
+
+    def _reset_baselines(self) -> None:
+        self.since_action = 0
+        self.heap_base_mb: Optional[float] = None
+        self.latencies: List[float] = []
+        self.latency_ewma: Optional[float] = None
+        self.last_signals: Dict[str, Any] = {}
+
+    # -------------------------------------------------------------- deciding
+
+    def _sample(self, prompt_id: Any, **extra: Any) -> Decision:
+        if self.governor is None:
+            return None, None
+        action = self.governor.sample(prompt_id, **extra)
+        return action, (self.governor.last.get("reason") if action else None)
+
+    def after_prompt(self, prompt_id: Any = None, latency_s: Optional[float] = None, **extra: Any) -> Decision:
+        """A prompt completed; `latency_s` is send click -> answer captured."""
+        self.prompts += 1
+        self.since_action += 1
+        self.outcomes.append(True)
+        action, reason = self._sample(prompt_id, **extra)
+        row = self.governor.last if self.governor is not None else {}
+        heap_mb = row.get("js_heap_used_mb")
+        # Summed over CHAT_TABS pages by the governor; the threshold is per page.
+        nodes = row.get("dom_nodes")
+        if nodes and self.governor.pages:
+            nodes = int(nodes / len(self.governor.pages))
+
+        if latency_s is not None:
+            self.latencies.append(latency_s)
+            if len(self.latencies) > self.baseline_prompts:
+                alpha = 0.3
+                self.latency_ewma = (
+                    latency_s if self.latency_ewma is None else alpha * latency_s + (1 - alpha) * self.latency_ewma
+                )
+        if self.heap_base_mb is None and heap_mb:
+            self.heap_base_mb = heap_mb
+        baseline = statistics.median(self.latencies[: self.baseline_prompts]) if self.latencies else None
+        self.last_signals = {
+            "dom_nodes": nodes,
+            "heap_mb": heap_mb,
+            "heap_growth_mb": round(heap_mb - self.heap_base_mb, 1) if heap_mb and self.heap_base_mb else None,
+            "latency_s": round(latency_s, 2) if latency_s is not None else None,
+            "latency_ewma_s": round(self.latency_ewma, 2) if self.latency_ewma is not None else None,
+            "latency_baseline_s": round(baseline, 2) if baseline is not None else None,
+            "error_rate": round(1 - sum(self.outcomes) / len(self.outcomes), 2),
+        }
+        if action:
+            return action, reason
+
+        if self.fixed:
+            if self.since_action >= FIXED_REFRESH_EVERY:
+                return "refresh", f"every {FIXED_REFRESH_EVERY} prompts"
+            return None, None
+        if nodes and self.dom_nodes and nodes >= self.dom_nodes:
+            return "refresh", f"DOM nodes {nodes} >= {self.dom_nodes:.0f}"
+        growth = self.last_signals["heap_growth_mb"]
+        if growth is not None and self.heap_growth_mb and growth >= self.heap_growth_mb:
+            return "refresh", f"JS heap +{growth:.0f}MB since last refresh"
+        if (
+            self.latency_ewma is not None
+            and baseline
+            and self.latency_ratio
+            and self.latency_ewma >= baseline * self.latency_ratio
+        ):
+            return "refresh", f"latency EWMA {self.latency_ewma:.1f}s >= {self.latency_ratio:g} x baseline {baseline:.1f}s"
+        return None, None
+
+    def after_failure(self, prompt_id: Any = None, reason: str = "exception") -> Decision:
+        """A prompt failed with restart_reason key `reason`; "refresh" or "restart"."""
+        self.prompts += 1
+        self.since_action += 1
+        self.outcomes.append(False)
+        errors = len(self.outcomes) - sum(self.outcomes)
+        self.last_signals = {"error_rate": round(errors / len(self.outcomes), 2), "failure": reason}
+        if self.fixed or reason not in SOFT_FAILURES:
+            return "restart", reason
+        if errors >= self.max_errors:
+            return "restart", f"{reason}: {errors}/{len(self.outcomes)} recent prompts failed"
+        return "refresh", f"{reason}: {errors}/{len(self.outcomes)} recent prompts failed"
+
+    # ---------------------------------------------------------------- costs
+
+    def recycled(self, action: str, cost_s: float, reason: Optional[str] = None, **extra: Any) -> None:
+        """Record an action taken (refresh / fresh_chat / restart / session_start) and its wall-time cost."""
+        self.actions[action] += 1
+        self.cost_s[action] += cost_s
+        self._log(
+            {
+                "ts": time.time(),
+                "session": self.session,
+                "mode": self.mode,
+                "action": action,
+                "reason": reason,
+                "cost_s": round(cost_s, 3),
+                "prompts_since": self.since_action,
+                "session_prompts": self.prompts,
+                **self.last_signals,
+                **extra,
+            }
+        )
+        print(f"[POLICY] {action} ({reason or '-'}) cost {cost_s:.1f}s after {self.since_action} prompt(s)")
+        if action in ("refresh", "fresh_chat"):
+            if self.governor is not None:
+                self.governor.fresh_chat_done()
+            self._reset_baselines()
+
+    def _log(self, row: Dict[str, Any]) -> None:
+        if self.log_path is None:
+            return
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.log_path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(row) + "\n")
+        except Exception as e:
+            print(f"[POLICY] Could not write {self.log_path}: {e}")
+
+    def summary(self) -> str:
+        if not self.actions:
+            return f"mode={self.mode} prompts={self.prompts} actions none"
+        parts = " ".join(f"{a}={n} ({self.cost_s[a]:.0f}s)" for a, n in sorted(self.actions.items()))
+        return f"mode={self.mode} prompts={self.prompts} {parts}"
+
+
+# ------------------------------------------------------------------ summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cost and interval per refresh / recycle action")
+    parser.add_argument("paths", nargs="*", help=f"policy logs or globs (default: POLICY_LOG or {DEFAULT_LOG})")
+    parser.add_argument("--since-hours", type=float, default=None)
+    args = parser.parse_args()
+
+    patterns = args.paths or [os.getenv("POLICY_LOG", DEFAULT_LOG)]
+    paths = sorted({p for pattern in patterns for p in (glob.glob(pattern) or [pattern])})
+    since = time.time() - args.since_hours * 3600.0 if args.since_hours else None
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+    for path in paths:
+        try:
+            lines = Path(path).read_text(encoding="utf-8").splitlines()
+        except OSError as e:
+            print(f"[POLICY] {path}: {e}")
+            continue
+        for line in lines:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if since is not None and float(row.get("ts") or 0) < since:
+                continue
+            groups[(row.get("mode") or "-", row.get("action") or "-")].append(row)
+    if not groups:
+        print("[POLICY] No rows found")
+        return 1
+
+    print(f"{'mode':<9} {'action':<14} {'n':>5} {'cost p50':>9} {'cost mean':>10} {'prompts/act':>12} {'s/prompt':>9}")
+    for (mode, action), rows in sorted(groups.items()):
+        costs = sorted(float(r.get("cost_s") or 0.0) for r in rows)
+        intervals = [int(r.get("prompts_since") or 0) for r in rows]
+        prompts = sum(intervals)
+        # Amortized: what this action adds to every prompt it covers.
+        per_prompt = f"{sum(costs) / prompts:.2f}s" if prompts else "-"
+        print(
+            f"{mode:<9} {action:<14} {len(rows):>5} {statistics.median(costs):>8.1f}s {statistics.fmean(costs):>9.1f}s "
+            f"{statistics.fmean(intervals):>12.1f} {per_prompt:>9}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+"""
+Warm-session snapshot for browser restarts.
+
+A cold test6 start pays for:
+- navigating to the temporary-chat URL
+- the 20 s is_popups_visible sweep, which is_chat_ui_visible repeats
+- the textarea wait
+- activate_search_mode
+
+A restart after a zero-citation or no-answer prompt pays for all of it
+again, even though ChatGPT already knows this browser: the onboarding and
+"stay logged out" choices live in cookies and localStorage.
+
+After the first prompt of a session completes, SessionSnapshot.capture()
+saves the chatgpt.com cookies and localStorage to SESSION_SNAPSHOT (default
+screenshots/session_snapshot.json). The supervisor gives every worker its own
+cwd, so each worker gets its own file. A fresh browser calls restore() before
+its first navigation:
+- cookies go in through context.add_cookies
+- localStorage is written by an init script, once per tab, before the app's
+  own scripts run
+
+The popups therefore do not come back, and test6 takes the fast path: one
+short popup pass, then the textarea wait. If the textarea does not show up,
+test6 discards the snapshot and runs the full setup.
+
+Both paths log how long it took to be ready to type. Each setup also appends a
+row ({"mode": "cold"|"restored"|"fallback", "ready_s", ...}) to SESSION_SETUP_LOG
+(default screenshots/session_setup.jsonl).
+
+SESSION_SNAPSHOT=0 disables capture and restore. Snapshots older than
+SESSION_SNAPSHOT_MAX_AGE_S (default 12 h) are ignored.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+DEFAULT_PATH = "screenshots/session_snapshot.json"
+DEFAULT_SETUP_LOG = "screenshots/session_setup.jsonl"
+DEFAULT_MAX_AGE_S = 12 * 3600.0
+
+ORIGIN = "https://chatgpt.com"
+
+# Cookie domains worth carrying over (the chatgpt.com app and the auth host).
+COOKIE_DOMAINS = ("chatgpt.com", "openai.com")
+
+_READ_STORAGE_JS = "() => Object.fromEntries(Object.entries(window.localStorage))"
+
+# Runs before the app's scripts on every navigation in the context; the
+# sessionStorage marker makes it write only once per tab, so a reload does not
+# overwrite what the app changed since.
+_RESTORE_STORAGE_JS = """
+(() => {
+  try {
+    if (location.origin !== %(origin)s) return;
+    if (sessionStorage.getItem("__snapshotRestored")) return;
+    const items = %(items)s;
+    for (const [k, v] of Object.entries(items)) localStorage.setItem(k, v);
+    sessionStorage.setItem("__snapshotRestored", "1");
+  } catch (e) {}
+})();
+"""
+
+
+def _env_path(name: str, default: str) -> Optional[Path]:
+    value = os.getenv(name, default)
+    if (value or "").strip().lower() in ("", "0", "false", "off", "none"):
+        return None
+    return Path(value)
+
+
+class SessionSnapshot:
+    """capture(context, page) after a good prompt; restore(context) before the first navigation."""
+
+    def __init__(self, path: Optional[str] = None, max_age_s: Optional[float] = None):
+        self.path = Path(path) if path else _env_path("SESSION_SNAPSHOT", DEFAULT_PATH)
+        if max_age_s is None:
+            try:
+                max_age_s = float(os.getenv("SESSION_SNAPSHOT_MAX_AGE_S", "") or DEFAULT_MAX_AGE_S)
+            except ValueError:
+                max_age_s = DEFAULT_MAX_AGE_S
+        self.max_age_s = max_age_s
+        self.setup_log = _env_path("SESSION_SETUP_LOG", DEFAULT_SETUP_LOG)
+        self.restored = False
+        self.captured = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    # ----------------------------------------------------------------- saving
+
+    def capture(self, context, page) -> bool:
+        """Save cookies + localStorage; False (and a log line) if it could not be read."""
+        if not self.enabled:
+            return False
+        # Once per browser session, successful or not: a page that cannot be
+        # read now is not retried (and logged) after every prompt.
+        self.captured = True
+        try:
+            cookies = [
+                c for c in context.cookies()
+                if any(str(c.get("domain") or "").lstrip(".").endswith(d) for d in COOKIE_DOMAINS)
+            ]
+            storage: Dict[str, str] = page.evaluate(_READ_STORAGE_JS) if page.url.startswith(ORIGIN) else {}
+            data = {"saved_at": time.time(), "origin": ORIGIN, "cookies": cookies, "local_storage": storage}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"[SNAPSHOT] Capture failed: {type(e).__name__}: {e}")
+            return False
+        print(f"[SNAPSHOT] Saved {len(cookies)} cookie(s), {len(storage)} localStorage key(s) to {self.path}")
+        return True
+
+    def discard(self) -> None:
+        if self.path is not None:
+            try:
+                self.path.unlink()
+                print(f"[SNAPSHOT] Discarded {self.path}")
+            except OSError:
+                pass
+
+    # -------------------------------------------------------------- restoring
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        age = time.time() - float(data.get("saved_at") or 0)
+        if age > self.max_age_s:
+            print(f"[SNAPSHOT] Ignoring snapshot from {age / 3600:.1f}h ago (SESSION_SNAPSHOT_MAX_AGE_S)")
+            return None
+        return data
+
+    def restore(self, context) -> bool:
+        """Load the snapshot into a fresh context; call before the first navigation."""
+        if not self.enabled:
+            return False
+        data = self._load()
+        if not data:
+            return False
+        cookies: List[Dict[str, Any]] = data.get("cookies") or []
+        storage: Dict[str, str] = data.get("local_storage") or {}
+        try:
+            if cookies:
+                context.add_cookies(cookies)
+            if storage:
+                # Context-wide so CHAT_TABS pages opened later get it too.
+                context.add_init_script(
+                    _RESTORE_STORAGE_JS
+                    % {"origin": json.dumps(data.get("origin") or ORIGIN), "items": json.dumps(storage)}
+                )
+        except Exception as e:
+            print(f"[SNAPSHOT] Restore failed, doing a full setup: {type(e).__name__}: {e}")
+            return False
+        self.restored = True
+        print(f"[SNAPSHOT] Restored {len(cookies)} cookie(s), {len(storage)} localStorage key(s)")
+        return True
+
+    # ---------------------------------------------------------------- logging
+
+    def log_setup(self, mode: str, ready_s: float, **extra: Any) -> None:
+        print(f"[SNAPSHOT] Ready to type after {ready_s:.1f}s ({mode} setup)")
+        if self.setup_log is None:
+            return
+        row = {"ts": time.time(), "mode": mode, "ready_s": round(ready_s, 3), **extra}
+        try:
+            self.setup_log.parent.mkdir(parents=True, exist_ok=True)
+            with self.setup_log.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(row) + "\n")
+        except Exception as e:
+            print(f"[SNAPSHOT] Could not write setup log: {e}")
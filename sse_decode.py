@@ -0,0 +1,137 @@
+"""
+Fast decode path for conversation stream payloads.
+
+The backend is picked once at import time: msgspec if installed, then orjson,
+then the stdlib json module. SSE_DECODER=json|orjson|msgspec forces one.
+
+decode_event() turns a delta payload straight into a DeltaEvent (p, o, v, c,
+type) so the reconstructor reads attributes instead of walking .get() chains.
+Payloads may be str, bytes or memoryview slices. Non-object payloads (e.g. the
+`"v1"` delta_encoding marker) come back as the decoded value; undecodable
+payloads come back as None.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Callable, Optional
+
+try:
+    import msgspec
+except Exception:
+    msgspec = None
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+BACKENDS = ("msgspec", "orjson", "json")
+
+
+if msgspec is not None:
+
+    class DeltaEvent(msgspec.Struct, omit_defaults=True):
+        """One decoded stream event. Unknown keys are dropped."""
+
+        p: Optional[str] = None
+        o: Optional[str] = None
+        v: Any = None
+        c: Optional[int] = None
+        type: Optional[str] = None
+
+else:
+
+    class DeltaEvent:  # type: ignore[no-redef]
+        """One decoded stream event. Unknown keys are dropped."""
+
+        __slots__ = ("p", "o", "v", "c", "type")
+
+        def __init__(self, p=None, o=None, v=None, c=None, type=None):
+            self.p = p
+            self.o = o
+            self.v = v
+            self.c = c
+            self.type = type
+
+        def __repr__(self):
+            return f"DeltaEvent(p={self.p!r}, o={self.o!r}, v={self.v!r}, c={self.c!r}, type={self.type!r})"
+
+
+def available_backends():
+    out = []
+    if msgspec is not None:
+        out.append("msgspec")
+    if orjson is not None:
+        out.append("orjson")
+    out.append("json")
+    return out
+
+
+def _from_dict(obj):
+    if isinstance(obj, dict):
+        return DeltaEvent(obj.get("p"), obj.get("o"), obj.get("v"), obj.get("c"), obj.get("type"))
+    return obj
+
+
+def _json_loads(data):
+    # stdlib json takes str/bytes but not memoryview slices from the framer.
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def make_loads(backend: str) -> Callable[[Any], Any]:
+    """Plain JSON loads (dicts/lists) for the given backend."""
+    if backend == "msgspec" and msgspec is not None:
+        return msgspec.json.decode
+    if backend == "orjson" and orjson is not None:
+        return orjson.loads
+    return _json_loads
+
+
+def make_decoder(backend: str) -> Callable[[Any], Any]:
+    """decode_event implementation for the given backend."""
+    if backend == "msgspec" and msgspec is not None:
+        typed = msgspec.json.Decoder(DeltaEvent)
+        generic = msgspec.json.decode
+
+        def decode(payload):
+            try:
+                return typed.decode(payload)
+            except msgspec.ValidationError:
+                # Not an object (e.g. "v1"), or an event with odd field types.
+                try:
+                    return _from_dict(generic(payload))
+                except Exception:
+                    return None
+            except Exception:
+                return None
+
+        return decode
+
+    loads = make_loads(backend)
+
+    def decode(payload):
+        try:
+            obj = loads(payload)
+        except Exception:
+            return None
+        return _from_dict(obj)
+
+    return decode
+
+
+def _pick_backend() -> str:
+    forced = (os.getenv("SSE_DECODER") or "").strip().lower()
+    available = available_backends()
+    if forced in available:
+        return forced
+    return available[0]
+
+
+BACKEND = _pick_backend()
+loads = make_loads(BACKEND)
+decode_event = make_decoder(BACKEND)
+
@@ -0,0 +1,505 @@
+"""
+Incremental parser for ChatGPT's /f/conversation event stream.
+
+Chunks are fed as they arrive (bytes or str). Only the unterminated tail line
+is buffered between calls, and every event is decoded and walked exactly once,
+so total work is linear in the stream length.
+
+Byte chunks (bytes/bytearray/memoryview) are framed without decoding to str:
+newlines and "data:" prefixes are located on a memoryview and each payload
+slice goes straight to the JSON decoder, which reads UTF-8 itself.
+
+Answer/citation semantics match the whole-body parser that used to live in
+master._extract_answer_and_citations_from_sse (which now delegates here).
+Both raw SSE ("event:/data:" blocks) and the DevTools EventStream export
+("delta<TAB>{json}<TAB>05:59:33.776") are accepted.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import List, Optional, Union
+
+from sse_decode import loads
+
+ANSWER_PART_PATH = "/message/content/parts/0"
+TERMINAL_EVENT_TYPES = {"message_stream_complete"}
+
+_url_re = re.compile(r"https?://[^\s\"'<>]+")
+_devtools_ts_re = re.compile(r"^\d{2}:\d{2}:\d{2}\.\d{3}$")
+_newline_re = re.compile(rb"\n")
+_WHITESPACE = b" \t\r\n\x0b\x0c"
+
+
+def _find_newline(view, start):
+    # memoryview has no .find(); re scans the buffer in place.
+    m = _newline_re.search(view, start)
+    return m.start() if m else -1
+
+
+def _is_blank(line):
+    return not len(line) or (line[0] in _WHITESPACE and not bytes(line).strip())
+
+
+def _walk_urls(value, urls, search_urls):
+    """Single pass over a decoded event: regex URLs and search_result URLs."""
+    if isinstance(value, str):
+        urls.extend(_url_re.findall(value))
+    elif isinstance(value, dict):
+        if value.get("type") == "search_result" and isinstance(value.get("url"), str):
+            search_urls.append(value["url"])
+        for v in value.values():
+            _walk_urls(v, urls, search_urls)
+    elif isinstance(value, list):
+        for item in value:
+            _walk_urls(item, urls, search_urls)
+
+
+def _split_devtools_line(line):
+    if "\t" in line:
+        parts = [p for p in line.split("\t") if p]
+        if len(parts) >= 2:
+            return parts[0].strip(), parts[1].strip()
+        return None
+    s = line.strip()
+    if " " not in s:
+        return None
+    head, rest = s.split(" ", 1)
+    rest = rest.strip()
+    maybe = rest.rsplit(" ", 1)
+    if len(maybe) == 2 and _devtools_ts_re.match(maybe[1].strip()):
+        rest = maybe[0].strip()
+    return head.strip(), rest
+
+
+class SSEStreamParser:
+    """
+    Stateful, chunk-fed conversation stream parser.
+
+        parser = SSEStreamParser()
+        for chunk in chunks:
+            deltas = parser.feed(chunk)   # answer text appended by this chunk
+        parser.close()
+        parser.answer, parser.citations, parser.done
+    """
+
+    # Fastest available JSON backend (see sse_decode); subclasses may swap in
+    # a typed decoder.
+    _decode = staticmethod(loads)
+
+    def __init__(self):
+        self._pending: List[str] = []
+        self._buf = bytearray()
+        self._data_views: List[Union[bytes, memoryview]] = []
+        self._mode: Optional[str] = None
+        self._event_name: Optional[str] = None
+        self._data_lines: List[str] = []
+        self._deltas: List[str] = []
+
+        self._assistant_started = False
+        self._assistant_response_started = False
+        self._answer_parts: List[str] = []
+        self._citations: List[str] = []
+        self._seen_citations = set()
+        self._answer_cache = (-1, "")
+        self._answer_urls_cache = (-1, [])
+
+        self.done = False
+        self.closed = False
+        self.event_count = 0
+        self.bytes_fed = 0
+
+    # ---------------------------------------------------------------- input
+
+    def feed(self, chunk: Union[bytes, bytearray, memoryview, str]) -> List[str]:
+        """Consume one chunk; return the answer deltas it produced.
+
+        Feed either str or bytes-like chunks for a given stream, not a mix.
+        """
+        if self.closed or not len(chunk):
+            return []
+        self._deltas = []
+        if isinstance(chunk, str):
+            self.bytes_fed += len(chunk)
+            self._feed_text(chunk)
+        else:
+            self._feed_bytes(chunk)
+        return self._deltas
+
+    def close(self) -> List[str]:
+        """Flush the trailing partial line/event (stream ended)."""
+        if self.closed:
+            return []
+        self._deltas = []
+        if self._buf:
+            line, self._buf = self._buf, bytearray()
+            self._handle_byte_line(memoryview(line))
+        if self._pending:
+            line = "".join(self._pending)
+            self._pending = []
+            self._handle_line(line)
+        self._flush_sse_event()
+        self.closed = True
+        return self._deltas
+
+    def _feed_text(self, text):
+        start = 0
+        while True:
+            nl = text.find("\n", start)
+            if nl < 0:
+                break
+            piece = text[start:nl]
+            if self._pending:
+                self._pending.append(piece)
+                piece = "".join(self._pending)
+                self._pending = []
+            self._handle_line(piece)
+            start = nl + 1
+        if start < len(text):
+            self._pending.append(text[start:])
+
+    def _feed_bytes(self, chunk):
+        view = memoryview(chunk)
+        if view.format != "B" or view.ndim != 1:
+            view = view.cast("B")
+        self.bytes_fed += len(view)
+        # bytes/bytearray can be searched directly; other buffers go through re.
+        find = chunk.find if isinstance(chunk, (bytes, bytearray)) else (lambda sub, pos: _find_newline(view, pos))
+        start = 0
+        if self._buf:
+            nl = find(b"\n", 0)
+            if nl < 0:
+                self._buf += view
+                return
+            # Only the line that straddles the chunk boundary is copied.
+            line, self._buf = self._buf, bytearray()
+            line += view[:nl]
+            self._handle_byte_line(memoryview(line))
+            start = nl + 1
+        while True:
+            nl = find(b"\n", start)
+            if nl < 0:
+                break
+            self._handle_byte_line(view[start:nl])
+            start = nl + 1
+        if start < len(view):
+            self._buf = bytearray(view[start:])
+        if self._data_views:
+            # An event is still open; detach it from the caller's buffer.
+            self._data_views = [bytes(v) for v in self._data_views]
+
+    def _handle_byte_line(self, line):
+        n = len(line)
+        if n and line[n - 1] == 13:
+            line = line[: n - 1]
+            n -= 1
+        if self._mode is None:
+            if _is_blank(line) or line[0] == 58:
+                return
+            if line[:6] == b"event:" or line[:5] == b"data:":
+                self._mode = "sse"
+            else:
+                self._mode = "devtools"
+
+        if self._mode == "devtools":
+            # DevTools exports are tab-separated text; decode just this line.
+            self._handle_line(str(line, "utf-8", "replace"))
+            return
+
+        if _is_blank(line):
+            self._flush_sse_event()
+            return
+        if line[0] == 58:
+            return
+        if line[:5] == b"data:":
+            i = 5
+            while i < n and line[i] in _WHITESPACE:
+                i += 1
+            self._data_views.append(line[i:])
+        elif line[:6] == b"event:":
+            self._event_name = str(line[6:], "utf-8", "replace").strip()
+
+    def _handle_line(self, line):
+        if line.endswith("\r"):
+            line = line[:-1]
+        if self._mode is None:
+            if not line.strip() or line.startswith(":"):
+                return
+            if line.startswith("event:") or line.startswith("data:"):
+                self._mode = "sse"
+            else:
+                self._mode = "devtools"
+
+        if self._mode == "devtools":
+            if not line.strip():
+                return
+            pieces = _split_devtools_line(line)
+            if pieces and pieces[0] and pieces[1] is not None:
+                self._handle_payload(pieces[1])
+            return
+
+        if not line.strip():
+            self._flush_sse_event()
+            return
+        if line.startswith(":"):
+            return
+        if line.startswith("event:"):
+            self._event_name = line[6:].strip()
+            return
+        if line.startswith("data:"):
+            self._data_lines.append(line[5:].lstrip())
+
+    def _flush_sse_event(self):
+        if self._data_views:
+            views = self._data_views
+            self._event_name = None
+            self._data_views = []
+            self._handle_payload_bytes(views[0] if len(views) == 1 else b"\n".join(views))
+            return
+        if self._event_name is None and not self._data_lines:
+            return
+        payload = "\n".join(self._data_lines)
+        self._event_name = None
+        self._data_lines = []
+        self._handle_payload(payload)
+
+    # ---------------------------------------------------------------- events
+
+    def _handle_payload(self, payload):
+        self.event_count += 1
+        payload = (payload or "").strip()
+        if not payload:
+            return
+        if payload == "[DONE]":
+            self.done = True
+            return
+        try:
+            obj = self._decode(payload)
+        except Exception:
+            return
+        self._handle_decoded(obj)
+
+    def _handle_payload_bytes(self, payload):
+        self.event_count += 1
+        lo, hi = 0, len(payload)
+        while lo < hi and payload[lo] in _WHITESPACE:
+            lo += 1
+        while hi > lo and payload[hi - 1] in _WHITESPACE:
+            hi -= 1
+        if lo == hi:
+            return
+        if lo or hi != len(payload):
+            payload = payload[lo:hi]
+        if payload == b"[DONE]":
+            self.done = True
+            return
+        try:
+            obj = self._decode(payload)
+        except Exception:
+            return
+        self._handle_decoded(obj)
+
+    def _handle_decoded(self, obj):
+        # Subclasses hook here to consume decoded payloads differently.
+        if not isinstance(obj, dict):
+            return
+        if obj.get("type") in TERMINAL_EVENT_TYPES:
+            self.done = True
+        self._handle_object(obj)
+
+    def _add_citations(self, urls):
+        for url in urls:
+            clean = str(url).strip().rstrip(".,);]")
+            low = clean.lower()
+            if "chatgpt.com/backend" in low or "persistent.oaistatic.com" in low:
+                continue
+            if not clean or clean in self._seen_citations:
+                continue
+            self._seen_citations.add(clean)
+            self._citations.append(clean)
+
+    def _append_answer(self, text):
+        self._answer_parts.append(text)
+        self._deltas.append(text)
+
+    def _handle_object(self, obj):
+        # Citations can arrive anywhere (message metadata, patch ops on
+        # content_references/search_result_groups), so every event is walked once.
+        urls = []
+        search_urls = []
+        _walk_urls(obj, urls, search_urls)
+        self._add_citations(urls)
+        self._add_citations(search_urls)
+
+        value = obj.get("v")
+        if isinstance(value, list):
+            for op in value:
+                if not isinstance(op, dict):
+                    continue
+                op_value = op.get("v")
+                if (
+                    str(op.get("p") or "") == ANSWER_PART_PATH
+                    and str(op.get("o") or "") in {"append", "replace"}
+                    and isinstance(op_value, str)
+                    and op_value
+                ):
+                    self._assistant_started = True
+                    self._assistant_response_started = True
+                    self._append_answer(op_value)
+
+        message_obj = None
+        if isinstance(value, dict) and isinstance(value.get("message"), dict):
+            message_obj = value["message"]
+        elif isinstance(obj.get("message"), dict):
+            message_obj = obj["message"]
+        if message_obj:
+            role = (((message_obj.get("author") or {}).get("role")) or "").lower()
+            if role == "assistant":
+                self._assistant_started = True
+                recipient = str(message_obj.get("recipient") or "").lower()
+                content = message_obj.get("content") or {}
+                content_type = str(content.get("content_type") or "").lower() if isinstance(content, dict) else ""
+                if recipient in {"", "all"} and content_type != "code":
+                    self._assistant_response_started = True
+                parts = content.get("parts") if isinstance(content, dict) else None
+                if isinstance(parts, list):
+                    for part in parts:
+                        if isinstance(part, str) and part:
+                            self._append_answer(part)
+                if isinstance(content, dict):
+                    text_field = content.get("text")
+                    if isinstance(text_field, str) and text_field.strip() and content_type != "code":
+                        self._append_answer(text_field.strip())
+
+        op_action = obj.get("o")
+        if obj.get("p") == ANSWER_PART_PATH and op_action in {"append", "replace"}:
+            if isinstance(value, str) and value:
+                self._assistant_started = True
+                self._assistant_response_started = True
+                self._append_answer(value)
+        elif self._assistant_started and op_action in {None, "append"} and isinstance(value, str):
+            # Streaming text chunks usually arrive as {"v": "..."}.
+            if value:
+                self._append_answer(value)
+                self._assistant_response_started = True
+
+        if op_action == "patch" and isinstance(value, list):
+            for patch_op in value:
+                if not isinstance(patch_op, dict):
+                    continue
+                patch_value = patch_op.get("v")
+                if (
+                    self._assistant_started
+                    and patch_op.get("p") == ANSWER_PART_PATH
+                    and patch_op.get("o") == "append"
+                    and isinstance(patch_value, str)
+                ):
+                    self._append_answer(patch_value)
+                    self._assistant_response_started = True
+
+    # ---------------------------------------------------------------- output
+
+    @property
+    def answer(self) -> str:
+        if not self._assistant_response_started:
+            return ""
+        count = len(self._answer_parts)
+        if self._answer_cache[0] != count:
+            self._answer_cache = (count, "".join(self._answer_parts).strip())
+        return self._answer_cache[1]
+
+    @property
+    def citations(self) -> List[str]:
+        # URLs embedded in the joined answer text are appended last, like the
+        # old whole-body parser did; the scan is cached per answer length.
+        answer = self.answer
+        count = len(self._answer_parts)
+        if self._answer_urls_cache[0] != count:
+            self._answer_urls_cache = (count, _url_re.findall(answer))
+        out = list(self._citations)
+        seen = set(self._seen_citations)
+        for url in self._answer_urls_cache[1]:
+            clean = str(url).strip().rstrip(".,);]")
+            low = clean.lower()
+            if "chatgpt.com/backend" in low or "persistent.oaistatic.com" in low:
+                continue
+            if not clean or clean in seen:
+                continue
+            seen.add(clean)
+            out.append(clean)
+        return out
+
+
+def parse_sse_text(raw_text):
+    """Whole-body convenience wrapper: returns (answer, citations)."""
+    parser = SSEStreamParser()
+    parser.feed(raw_text or "")
+    parser.close()
+    return parser.answer, parser.citations
+
+
+# ------------------------------------------------------- non-SSE JSON bodies
+
+
+def _iter_json_nodes(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _iter_json_nodes(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _iter_json_nodes(item)
+
+
+def _collect_urls(value, out_list):
+    if isinstance(value, str):
+        out_list.extend(_url_re.findall(value))
+        return
+    if isinstance(value, dict):
+        for v in value.values():
+            _collect_urls(v, out_list)
+        return
+    if isinstance(value, list):
+        for item in value:
+            _collect_urls(item, out_list)
+
+
+def _dedupe_urls(urls):
+    result = []
+    seen = set()
+    for url in urls:
+        clean = str(url).strip().rstrip(".,);]")
+        low = clean.lower()
+        if "chatgpt.com/backend" in low or "persistent.oaistatic.com" in low:
+            continue
+        if not clean or clean in seen:
+            continue
+        seen.add(clean)
+        result.append(clean)
+    return result
+
+
+def parse_json_text(raw_text):
+    """Fallback for bodies that are plain JSON rather than SSE: returns (answer, citations)."""
+    try:
+        obj = json.loads((raw_text or "").strip())
+    except Exception:
+        obj = None
+    if not obj:
+        return "", []
+    text_candidates = []
+    citation_urls = []
+
+    for item in _iter_json_nodes(obj):
+        for key, value in item.items():
+            key_l = str(key).lower()
+            if isinstance(value, str):
+                cleaned = value.strip()
+                if cleaned and key_l in {"text", "output_text", "answer", "final", "completion"}:
+                    text_candidates.append(cleaned)
+            if any(t in key_l for t in ("citation", "source", "url", "reference", "link")):
+                _collect_urls(value, citation_urls)
+
+    answer = max(text_candidates, key=len) if text_candidates else ""
+    return answer, _dedupe_urls(citation_urls)
@@ -0,0 +1,499 @@
+"""
+Live capture of ChatGPT /f/conversation streams from a Playwright page.
+
+Two sources feed the same per-request DeltaStreamParser records:
+
+- ConversationStreamTap opens a CDP session on the page, switches each
+  conversation response to streaming (Network.streamResourceContent) and
+  feeds every Network.dataReceived chunk.
+- FetchTee injects a window.fetch wrapper that tees the conversation
+  ReadableStream inside the page and pushes each decoded chunk to Python
+  through page.expose_binding, tagged with a per-request id and the browser
+  timestamp. It does not depend on CDP body streaming at all.
+
+The prompt loop can stop waiting as soon as the parser sees a terminal marker
+([DONE], message_stream_complete, or the assistant turn reporting end_turn)
+instead of sleeping and blocking in response.body() until the socket closes.
+
+Playwright's sync API only dispatches events while the main thread is inside
+a Playwright call, so wait_for_terminal() pumps with page.wait_for_timeout().
+
+Each finished stream appends a timing row to SSE_TIMING_LOG (JSONL): time to
+first answer token, terminal/close offsets and the wall time saved versus the
+legacy sleep_dbg(5, 8) + response.body() wait.
+
+PromptCompletion replaces enter_prompt's fixed sleeps and stop-button poll:
+it returns when the conversation request finishes (Playwright
+requestfinished/requestfailed) or a tap reports a terminal marker, then tops
+the wait up to a randomized minimum dwell measured from the send click.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import os
+import random
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from delta_encoding import DeltaStreamParser
+
+CONVERSATION_PATHS = ("/backend-anon/f/conversation", "/backend-api/f/conversation")
+
+# Lower bound of the fixed sleep the body() path used after enter_prompt.
+LEGACY_SLEEP_MIN_S = 5.0
+
+# Records (and their parsed documents) kept for late close events.
+MAX_RECORDS = 8
+
+FETCH_TEE_BINDING = "__convTeePush"
+
+# Minimum send -> next action dwell; the default matches the legacy floor of
+# enter_prompt (3s + 3s) plus the 5..8s sleep the prompt loop added after it.
+PROMPT_DWELL_MIN_S = 11.0
+PROMPT_DWELL_MAX_S = 14.0
+
+
+def is_conversation_stream_url(url: str) -> bool:
+    return any(p in (url or "") for p in CONVERSATION_PATHS) and "/prepare" not in (url or "")
+
+
+class StreamRecord:
+    """One conversation response seen by a tap."""
+
+    def __init__(self, request_id: str, url: str, started_at: Optional[float] = None):
+        self.request_id = request_id
+        self.url = url
+        self.parser = DeltaStreamParser()
+        self.started_at = started_at if started_at is not None else time.time()
+        self.sent_at: Optional[float] = None
+        self.first_chunk_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.terminal_at: Optional[float] = None
+        self.closed_at: Optional[float] = None
+        self.released_at: Optional[float] = None
+        self.submitted_at: Optional[float] = None
+        self.streaming = False
+        self.failed: Optional[str] = None
+        self.logged = False
+        # CPU time spent in parser.feed/close (tracing "parse" phase).
+        self.parse_s = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.terminal_at is not None
+
+    def timing(self) -> Dict[str, Any]:
+        origin = self.sent_at if self.sent_at is not None else self.started_at
+
+        def rel(ts):
+            return round(ts - origin, 3) if ts is not None else None
+
+        saved = None
+        if self.released_at is not None and self.closed_at is not None:
+            legacy_ready = self.closed_at
+            if self.submitted_at is not None:
+                legacy_ready = max(legacy_ready, self.submitted_at + LEGACY_SLEEP_MIN_S)
+            saved = round(legacy_ready - self.released_at, 3)
+        return {
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "headers_s": rel(self.started_at),
+            "first_chunk_s": rel(self.first_chunk_at),
+            "first_token_s": rel(self.first_token_at),
+            "terminal_s": rel(self.terminal_at),
+            "released_s": rel(self.released_at),
+            "closed_s": rel(self.closed_at),
+            "saved_s": saved,
+            "bytes": self.parser.bytes_fed,
+            "events": self.parser.event_count,
+            "answer_chars": len(self.parser.answer),
+            "citations": len(self.parser.citations),
+            "failed": self.failed,
+        }
+
+
+class _StreamTap:
+    """Record bookkeeping, waiting and timing log shared by the capture sources."""
+
+    tag = "[STREAM]"
+
+    def __init__(
+        self,
+        page,
+        timing_log: Optional[str] = None,
+        on_record: Optional[Callable[[StreamRecord], None]] = None,
+        on_delta: Optional[Callable[[StreamRecord, List[str]], None]] = None,
+    ):
+        self.page = page
+        self.records: Dict[str, StreamRecord] = {}
+        self.order: List[str] = []
+        self.on_record = on_record
+        self.on_delta = on_delta
+        log = timing_log if timing_log is not None else os.getenv("SSE_TIMING_LOG", "screenshots/stream_timing.jsonl")
+        self.timing_log = Path(log) if log else None
+        self.total_saved_s = 0.0
+
+    def _add_record(self, record: StreamRecord) -> StreamRecord:
+        self.records[record.request_id] = record
+        self.order.append(record.request_id)
+        while len(self.order) > MAX_RECORDS:
+            self.records.pop(self.order.pop(0), None)
+        return record
+
+    def _feed(self, record: StreamRecord, chunk: Union[bytes, str], ts: Optional[float] = None) -> None:
+        if record.released_at is not None and record.done:
+            return
+        now = ts if ts is not None else time.time()
+        if record.first_chunk_at is None:
+            record.first_chunk_at = now
+        t0 = time.perf_counter()
+        deltas = record.parser.feed(chunk)
+        record.parse_s += time.perf_counter() - t0
+        if deltas:
+            if record.first_token_at is None:
+                record.first_token_at = now
+            if self.on_delta is not None:
+                self.on_delta(record, deltas)
+        if record.terminal_at is None and record.parser.done:
+            record.terminal_at = now
+
+    def _close(self, record: StreamRecord, ts: Optional[float] = None, error: Optional[str] = None) -> None:
+        record.closed_at = ts if ts is not None else time.time()
+        if error:
+            record.failed = record.failed or error
+        else:
+            t0 = time.perf_counter()
+            record.parser.close()
+            record.parse_s += time.perf_counter() - t0
+            if record.terminal_at is None and record.parser.done:
+                record.terminal_at = record.closed_at
+        self._maybe_log(record)
+
+    # ------------------------------------------------------------------ wait
+
+    def latest(self, since: float = 0.0) -> Optional[StreamRecord]:
+        for request_id in reversed(self.order):
+            record = self.records[request_id]
+            if record.started_at >= since:
+                return record
+        return None
+
+    def wait_for_terminal(self, since: float, timeout_s: float, submitted_at: Optional[float] = None, poll_ms: int = 50) -> Optional[StreamRecord]:
+        """
+        Pump Playwright events until the newest conversation stream started
+        after `since` hits a terminal marker (or closes). Returns None if no
+        streamable response showed up, so the caller can fall back to body().
+        On timeout the partial record is returned; check .done / .closed_at.
+        """
+        deadline = time.time() + max(0.0, timeout_s)
+        record = None
+        while True:
+            record = self.latest(since)
+            if record is not None and (record.done or record.closed_at is not None):
+                break
+            if record is not None and not record.streaming:
+                return None
+            if time.time() >= deadline:
+                break
+            self.page.wait_for_timeout(poll_ms)
+        if record is None or not record.streaming:
+            return None
+        record.released_at = time.time()
+        record.submitted_at = submitted_at
+        if record.closed_at is None:
+            # Not closed yet: the close is logged later, when the socket ends.
+            record.parser.close()
+        self._maybe_log(record)
+        return record
+
+    # --------------------------------------------------------------- logging
+
+    def _maybe_log(self, record: StreamRecord) -> None:
+        if record.logged or record.released_at is None or record.closed_at is None:
+            return
+        record.logged = True
+        row = record.timing()
+        if row["saved_s"] is not None:
+            self.total_saved_s += row["saved_s"]
+        print(
+            f"{self.tag} {record.request_id}: first token at {row['first_token_s']}s, terminal at "
+            f"{row['terminal_s']}s, closed at {row['closed_s']}s, saved {row['saved_s']}s vs body() wait "
+            f"(total {self.total_saved_s:.1f}s)"
+        )
+        if self.on_record is not None:
+            self.on_record(record)
+        if self.timing_log is None:
+            return
+        try:
+            self.timing_log.parent.mkdir(parents=True, exist_ok=True)
+            with self.timing_log.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(row) + "\n")
+        except Exception as e:
+            print(f"{self.tag} Could not write timing log: {e}")
+
+
+class ConversationStreamTap(_StreamTap):
+    """CDP-session tap that parses conversation streams chunk by chunk."""
+
+    def __init__(self, page, **kwargs):
+        super().__init__(page, **kwargs)
+        self.session = None
+
+    def start(self) -> "ConversationStreamTap":
+        self.session = self.page.context.new_cdp_session(self.page)
+        self.session.on("Network.responseReceived", self._on_response)
+        self.session.on("Network.dataReceived", self._on_data)
+        self.session.on("Network.loadingFinished", self._on_finished)
+        self.session.on("Network.loadingFailed", self._on_failed)
+        self.session.send("Network.enable")
+        return self
+
+    def stop(self) -> None:
+        if self.session is None:
+            return
+        try:
+            self.session.detach()
+        except Exception:
+            pass
+        self.session = None
+
+    def _on_response(self, params):
+        response = params.get("response") or {}
+        url = response.get("url") or ""
+        request_id = params.get("requestId")
+        if not request_id or not is_conversation_stream_url(url):
+            return
+        record = self._add_record(StreamRecord(request_id, url))
+        try:
+            result = self.session.send("Network.streamResourceContent", {"requestId": request_id})
+            record.streaming = True
+            buffered = (result or {}).get("bufferedData")
+            if buffered:
+                self._feed(record, base64.b64decode(buffered))
+        except Exception as e:
+            # Too late (already finished) or not streamable; caller falls back.
+            record.failed = f"streamResourceContent: {e}"
+        print(f"{self.tag} Conversation response: {url} (streaming={record.streaming})")
+
+    def _on_data(self, params):
+        record = self.records.get(params.get("requestId"))
+        data = params.get("data")
+        if record is None or not data:
+            return
+        self._feed(record, base64.b64decode(data))
+
+    def _on_finished(self, params):
+        record = self.records.get(params.get("requestId"))
+        if record is not None:
+            self._close(record)
+
+    def _on_failed(self, params):
+        record = self.records.get(params.get("requestId"))
+        if record is not None:
+            self._close(record, error=str(params.get("errorText") or "loadingFailed"))
+
+
+# Installed on every document (add_init_script) and on the current one.
+# Wraps window.fetch, tees conversation bodies, and pushes decoded chunks to
+# Python; the page keeps reading its own branch untouched.
+_FETCH_TEE_JS = r"""
+(() => {
+  if (window.__convTeeInstalled) return;
+  window.__convTeeInstalled = true;
+  const PATHS = %(paths)s;
+  const BINDING = %(binding)s;
+  const origFetch = window.fetch;
+  let seq = 0;
+  const push = (msg) => { try { window[BINDING](msg); } catch (e) {} };
+  window.fetch = async function (input, init) {
+    const url = typeof input === "string" ? input : (input && input.url) || String(input);
+    const watched = PATHS.some((p) => url.includes(p)) && !url.includes("/prepare");
+    const sent = Date.now();
+    const response = await origFetch.apply(this, arguments);
+    if (!watched || !response.body) return response;
+    let branches;
+    try { branches = response.body.tee(); } catch (e) { return response; }
+    const id = `${sent}-${++seq}`;
+    push({ id, kind: "start", url, status: response.status, sent, ts: Date.now() });
+    (async () => {
+      const reader = branches[1].getReader();
+      const decoder = new TextDecoder();
+      try {
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          const text = decoder.decode(value, { stream: true });
+          if (text) push({ id, kind: "chunk", data: text, ts: Date.now() });
+        }
+        const tail = decoder.decode();
+        if (tail) push({ id, kind: "chunk", data: tail, ts: Date.now() });
+        push({ id, kind: "end", ts: Date.now() });
+      } catch (e) {
+        push({ id, kind: "error", error: String(e), ts: Date.now() });
+      }
+    })();
+    const teed = new Response(branches[0], {
+      status: response.status,
+      statusText: response.statusText,
+      headers: response.headers,
+    });
+    try { Object.defineProperty(teed, "url", { value: response.url }); } catch (e) {}
+    return teed;
+  };
+})();
+"""
+
+
+class FetchTee(_StreamTap):
+    """In-page fetch tee: conversation chunks arrive via page.expose_binding."""
+
+    tag = "[TEE]"
+
+    def __init__(self, page, binding: str = FETCH_TEE_BINDING, **kwargs):
+        super().__init__(page, **kwargs)
+        self.binding = binding
+        self.script = _FETCH_TEE_JS % {"paths": json.dumps(list(CONVERSATION_PATHS)), "binding": json.dumps(binding)}
+
+    def start(self) -> "FetchTee":
+        self.page.expose_binding(self.binding, self._on_message)
+        self.page.add_init_script(self.script)
+        try:
+            self.page.evaluate(self.script)
+        except Exception:
+            pass
+        return self
+
+    def stop(self) -> None:
+        # Bindings and init scripts live as long as the page; nothing to undo.
+        pass
+
+    def _on_message(self, source, msg):
+        if not isinstance(msg, dict):
+            return
+        request_id = str(msg.get("id") or "")
+        ts = msg.get("ts")
+        ts = ts / 1000.0 if isinstance(ts, (int, float)) else None
+        kind = msg.get("kind")
+        if kind == "start":
+            record = self._add_record(StreamRecord(request_id, str(msg.get("url") or ""), started_at=ts))
+            sent = msg.get("sent")
+            record.sent_at = sent / 1000.0 if isinstance(sent, (int, float)) else None
+            record.streaming = True
+            print(f"{self.tag} Conversation response: {record.url} (status={msg.get('status')})")
+            return
+        record = self.records.get(request_id)
+        if record is None:
+            return
+        if kind == "chunk":
+            data = msg.get("data")
+            if isinstance(data, str) and data:
+                self._feed(record, data, ts)
+        elif kind == "end":
+            self._close(record, ts)
+        elif kind == "error":
+            self._close(record, ts, error=str(msg.get("error") or "stream error"))
+
+
+class PromptCompletion:
+    """
+    Network-driven prompt completion for enter_prompt(wait_for_completion=...).
+
+    Calling it with the send-click timestamp pumps Playwright events until the
+    conversation request started after it has finished (or the tap's record
+    hit a terminal marker), then sleeps only whatever is left of a random
+    dwell in [min_dwell_s, max_dwell_s] counted from the send click, so time
+    already spent waiting on the network is not slept again.
+    """
+
+    tag = "[PROMPT]"
+
+    def __init__(
+        self,
+        page,
+        tap: Optional[_StreamTap] = None,
+        min_dwell_s: Optional[float] = None,
+        max_dwell_s: Optional[float] = None,
+        poll_ms: int = 100,
+    ):
+        self.page = page
+        self.tap = tap
+        self.min_dwell_s = min_dwell_s if min_dwell_s is not None else _env_float("PROMPT_DWELL_MIN_S", PROMPT_DWELL_MIN_S)
+        self.max_dwell_s = max_dwell_s if max_dwell_s is not None else _env_float("PROMPT_DWELL_MAX_S", PROMPT_DWELL_MAX_S)
+        self.max_dwell_s = max(self.min_dwell_s, self.max_dwell_s)
+        self.poll_ms = poll_ms
+        # (finished_at, failed) of recent conversation requests.
+        self.finished: List[Tuple[float, bool]] = []
+        self.started: List[float] = []
+
+    def start(self) -> "PromptCompletion":
+        self.page.on("request", self._on_request)
+        self.page.on("requestfinished", self._on_finished)
+        self.page.on("requestfailed", self._on_failed)
+        return self
+
+    def _on_request(self, request):
+        if is_conversation_stream_url(request.url):
+            self.started.append(time.time())
+            del self.started[:-MAX_RECORDS]
+
+    def _on_finished(self, request):
+        if is_conversation_stream_url(request.url):
+            self.finished.append((time.time(), False))
+            del self.finished[:-MAX_RECORDS]
+
+    def _on_failed(self, request):
+        if is_conversation_stream_url(request.url):
+            self.finished.append((time.time(), True))
+            del self.finished[:-MAX_RECORDS]
+
+    def _completed_at(self, since: float) -> Optional[float]:
+        if self.tap is not None:
+            record = self.tap.latest(since)
+            if record is not None and record.streaming:
+                if record.terminal_at is not None:
+                    return record.terminal_at
+                if record.closed_at is not None:
+                    return record.closed_at
+        # requestfinished only counts once a conversation request was sent after
+        # the click; a late finish of the previous prompt's request must not.
+        if not any(ts >= since for ts in self.started):
+            return None
+        for ts, _failed in reversed(self.finished):
+            if ts >= since:
+                return ts
+        return None
+
+    def __call__(self, sent_at: float, timeout_s: float) -> bool:
+        """Wait for the prompt sent at `sent_at`; False if nothing finished within timeout_s."""
+        # Small margin for clock skew between the browser-side tap timestamps
+        # and this process.
+        since = sent_at - 1.0
+        deadline = time.time() + max(0.0, timeout_s)
+        completed_at = self._completed_at(since)
+        while completed_at is None and time.time() < deadline:
+            self.page.wait_for_timeout(self.poll_ms)
+            completed_at = self._completed_at(since)
+
+        dwell = random.uniform(self.min_dwell_s, self.max_dwell_s)
+        remaining = dwell - (time.time() - sent_at)
+        if completed_at is None:
+            print(f"{self.tag} No completion signal within {timeout_s:.0f}s")
+        else:
+            print(
+                f"{self.tag} Response complete at {completed_at - sent_at:.1f}s, "
+                f"dwell {dwell:.1f}s (+{max(0.0, remaining):.1f}s)"
+            )
+        if remaining > 0:
+            # Keep pumping events while dwelling so taps stay current.
+            self.page.wait_for_timeout(int(remaining * 1000))
+        return completed_at is not None
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        return default
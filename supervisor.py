@@ -0,0 +1,359 @@
+"""
+Multi-process browser worker supervisor.
+
+test6's __main__ drives exactly one SB/Chrome per host. This launches N copies
+of it as separate processes that share the DB claim queue (FOR UPDATE SKIP
+LOCKED keeps them off each other's prompts):
+
+- each worker runs in its own directory (workers/w<i>/), so its screenshots/,
+  result spool, timing logs and worker.log never collide
+- each worker gets its own proxy session: CHATGPT_PROXY is rendered from
+  --proxy-template with {worker} and {port} (--proxy-base-port + worker)
+- workers write a heartbeat file (WORKER_HEARTBEAT); a worker that exits
+  non-zero, or whose heartbeat is older than --hang-timeout, is stopped
+  (whole process group, so Chrome goes too) and restarted after an
+  exponential backoff with jitter; a worker that ran for --stable-after
+  seconds starts its backoff from scratch
+- with --metrics-port N, worker i serves Prometheus /metrics on port N + i
+  (live_metrics)
+- a worker that exits 0 (queue drained) is not restarted; the supervisor
+  exits when every worker has
+- every --report-every seconds the per-worker and total throughput (from the
+  heartbeat counters, summed across restarts) is printed and written to
+  workers/supervisor.json
+
+N defaults to what the container allows: the CPU quota (cgroup cpu.max or the
+affinity mask) divided by --cpus-per-worker, capped by the memory limit
+(cgroup memory.max or MemAvailable) minus --reserve-mb, divided by
+--worker-mb. In the 900 MB / 2 CPU container that is one worker.
+
+    python supervisor.py                      # N from cores/memory
+    python supervisor.py --workers 3 --proxy-template 'user:pass@disp.oxylabs.io:{port}'
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from contextlib import suppress
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+HERE = Path(__file__).resolve().parent
+DEFAULT_SCRIPT = HERE / "test6.py"
+
+
+# ----------------------------------------------------------------- heartbeat
+
+
+class Heartbeat:
+    """Worker side: counters + state written atomically to WORKER_HEARTBEAT (no-op when unset)."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = Path(path) if path else None
+        self.started_at = time.time()
+        self.counters: Dict[str, int] = {}
+
+    def add(self, key: str, n: int = 1) -> None:
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def beat(self, state: str = "running") -> None:
+        if self.path is None:
+            return
+        data = {
+            "ts": time.time(),
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "state": state,
+            "counters": dict(self.counters),
+        }
+        try:
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[WORKER] Heartbeat write failed: {e}")
+
+
+heartbeat = Heartbeat(os.getenv("WORKER_HEARTBEAT"))
+
+
+def _read_heartbeat(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+# -------------------------------------------------------------------- sizing
+
+
+def _read_first(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def available_cpus() -> float:
+    quota = _read_first("/sys/fs/cgroup/cpu.max")  # cgroup v2: "<quota> <period>" or "max <period>"
+    if quota and not quota.startswith("max"):
+        limit, period = quota.split()[:2]
+        return int(limit) / int(period)
+    limit, period = _read_first("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), _read_first("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if limit and period and int(limit) > 0:
+        return int(limit) / int(period)
+    try:
+        return float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return float(os.cpu_count() or 1)
+
+
+def available_memory_mb() -> Optional[float]:
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        raw = _read_first(path)
+        # v1 reports "no limit" as a huge number.
+        if raw and raw != "max" and int(raw) < 1 << 50:
+            return int(raw) / (1024 * 1024)
+    meminfo = _read_first("/proc/meminfo")
+    for line in (meminfo or "").splitlines():
+        if line.startswith("MemAvailable:"):
+            return int(line.split()[1]) / 1024
+    return None
+
+
+def default_workers(cpus_per_worker: float, worker_mb: float, reserve_mb: float) -> int:
+    by_cpu = int(available_cpus() // max(cpus_per_worker, 0.1))
+    memory = available_memory_mb()
+    by_memory = int((memory - reserve_mb) // max(worker_mb, 1.0)) if memory is not None else by_cpu
+    return max(1, min(by_cpu, by_memory))
+
+
+# ------------------------------------------------------------------- workers
+
+
+class Worker:
+    def __init__(self, index: int, root: Path, args: argparse.Namespace):
+        self.index = index
+        self.dir = root / f"w{index}"
+        self.heartbeat_path = self.dir / "heartbeat.json"
+        self.args = args
+        self.proc: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.failures = 0  # consecutive, for backoff
+        self.next_start = 0.0
+        self.done = False
+        self.base_counters: Dict[str, int] = {}
+        self.last_counters: Dict[str, int] = {}
+        self.last_exit: Optional[str] = None
+
+    def env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        env["WORKER_ID"] = str(self.index)
+        env["WORKER_HEARTBEAT"] = str(self.heartbeat_path)
+        env["PYTHONUNBUFFERED"] = "1"
+        if self.args.proxy_template:
+            env["CHATGPT_PROXY"] = self.args.proxy_template.format(
+                worker=self.index, port=self.args.proxy_base_port + self.index
+            )
+        if self.args.metrics_port:
+            env["METRICS_PORT"] = str(self.args.metrics_port + self.index)
+        return env
+
+    def start(self) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with suppress(OSError):
+            self.heartbeat_path.unlink()
+        log = open(self.dir / "worker.log", "ab")
+        try:
+            # Own session/process group: stop() takes chromedriver and Chrome with it.
+            self.proc = subprocess.Popen(
+                [sys.executable, str(self.args.script)],
+                cwd=str(self.dir),
+                env=self.env(),
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        finally:
+            log.close()
+        self.started_at = time.monotonic()
+        print(f"[SUPERVISOR] w{self.index} started (pid {self.proc.pid})")
+
+    def stop(self, grace_s: float = 20.0) -> None:
+        proc = self.proc
+        if proc is None or proc.poll() is not None:
+            return
+        # SIGTERM first: the worker releases unstarted claims and flushes results.
+        for sig, wait_s in ((signal.SIGTERM, grace_s), (signal.SIGKILL, 5.0)):
+            try:
+                os.killpg(proc.pid, sig)
+            except ProcessLookupError:
+                return
+            try:
+                proc.wait(timeout=wait_s)
+                return
+            except subprocess.TimeoutExpired:
+                continue
+
+    def heartbeat_age(self) -> float:
+        data = _read_heartbeat(self.heartbeat_path)
+        if data is not None:
+            self.last_counters = data.get("counters") or {}
+        # Before the first beat, time since spawn counts.
+        last = data.get("ts") if data else None
+        if last is None:
+            return time.monotonic() - self.started_at
+        return max(0.0, time.time() - float(last))
+
+    def counters(self) -> Dict[str, int]:
+        keys = set(self.base_counters) | set(self.last_counters)
+        return {k: self.base_counters.get(k, 0) + self.last_counters.get(k, 0) for k in keys}
+
+    def finished(self, reason: str) -> None:
+        """Fold this run's counters in and schedule a restart with backoff + jitter."""
+        self.base_counters = self.counters()
+        self.last_counters = {}
+        self.last_exit = reason
+        self.proc = None
+        ran_s = time.monotonic() - self.started_at
+        self.failures = 1 if ran_s >= self.args.stable_after else self.failures + 1
+        delay = min(self.args.max_backoff, self.args.backoff * (2 ** (self.failures - 1)))
+        delay *= random.uniform(0.5, 1.5)
+        self.next_start = time.monotonic() + delay
+        self.restarts += 1
+        print(f"[SUPERVISOR] w{self.index} {reason} after {ran_s:.0f}s; restarting in {delay:.0f}s")
+
+
+# ---------------------------------------------------------------- supervisor
+
+
+def _report(workers: List[Worker], started_at: float, root: Path) -> None:
+    elapsed_min = max((time.monotonic() - started_at) / 60.0, 1e-9)
+    rows = []
+    total = 0
+    for w in workers:
+        counters = w.counters()
+        done = counters.get("completed", 0) + counters.get("failed", 0)
+        total += done
+        state = "done" if w.done else ("running" if w.proc is not None else "backoff")
+        rows.append(
+            {
+                "worker": w.index,
+                "state": state,
+                "pid": w.proc.pid if w.proc is not None else None,
+                "restarts": w.restarts,
+                "last_exit": w.last_exit,
+                "prompts": done,
+                "per_min": round(done / elapsed_min, 2),
+                **counters,
+            }
+        )
+        print(
+            f"[SUPERVISOR] w{w.index} {state:<7} prompts={done} "
+            f"({done / elapsed_min:.2f}/min) completed={counters.get('completed', 0)} "
+            f"failed={counters.get('failed', 0)} restarts={w.restarts}"
+        )
+    print(f"[SUPERVISOR] total prompts={total} ({total / elapsed_min:.2f}/min) across {len(workers)} worker(s)")
+    summary = {"ts": time.time(), "elapsed_s": round(elapsed_min * 60.0, 1), "prompts": total, "workers": rows}
+    with suppress(OSError):
+        (root / "supervisor.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+
+def supervise(args: argparse.Namespace) -> int:
+    root = Path(args.root).resolve()
+    root.mkdir(parents=True, exist_ok=True)
+    workers = [Worker(i, root, args) for i in range(args.workers)]
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    started_at = time.monotonic()
+    last_report = started_at
+    for w in workers:
+        # Stagger launches so N Chromes do not cold-start at the same instant.
+        w.next_start = started_at + w.index * args.stagger
+    try:
+        while not stopping:
+            now = time.monotonic()
+            for w in workers:
+                if w.done:
+                    continue
+                if w.proc is None:
+                    if now >= w.next_start:
+                        w.start()
+                    continue
+                code = w.proc.poll()
+                if code is None:
+                    age = w.heartbeat_age()
+                    if age > args.hang_timeout:
+                        print(f"[SUPERVISOR] w{w.index} heartbeat {age:.0f}s old; killing")
+                        w.stop()
+                        w.finished(f"hung ({age:.0f}s without heartbeat)")
+                    continue
+                w.heartbeat_age()  # pick up the final counters
+                if code == 0:
+                    w.done = True
+                    w.base_counters = w.counters()
+                    w.last_counters = {}
+                    w.proc = None
+                    print(f"[SUPERVISOR] w{w.index} finished cleanly")
+                else:
+                    w.finished(f"exited with {code}")
+            if all(w.done for w in workers):
+                break
+            if now - last_report >= args.report_every:
+                last_report = now
+                _report(workers, started_at, root)
+            time.sleep(1.0)
+    finally:
+        for w in workers:
+            w.stop()
+        _report(workers, started_at, root)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run N browser workers over the shared prompt queue")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SUPERVISOR_WORKERS", "0") or 0), help="0 = derive from cores/memory")
+    parser.add_argument("--script", default=str(DEFAULT_SCRIPT), help="worker entry point")
+    parser.add_argument("--root", default="workers", help="parent of the per-worker directories")
+    parser.add_argument("--proxy-template", default=os.getenv("SUPERVISOR_PROXY_TEMPLATE"), help="CHATGPT_PROXY per worker; {worker} and {port} are filled in")
+    parser.add_argument("--proxy-base-port", type=int, default=8001)
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("SUPERVISOR_METRICS_PORT", "0") or 0), help="worker i serves /metrics on this port + i (0 = off)")
+    parser.add_argument("--cpus-per-worker", type=float, default=1.0)
+    parser.add_argument("--worker-mb", type=float, default=700.0, help="memory budget per browser worker")
+    parser.add_argument("--reserve-mb", type=float, default=150.0, help="memory kept for the supervisor and the OS")
+    parser.add_argument("--hang-timeout", type=float, default=600.0, help="seconds without a heartbeat before a worker is killed")
+    parser.add_argument("--backoff", type=float, default=5.0, help="first restart delay (doubles per consecutive failure)")
+    parser.add_argument("--max-backoff", type=float, default=300.0)
+    parser.add_argument("--stable-after", type=float, default=300.0, help="a run this long resets the backoff")
+    parser.add_argument("--stagger", type=float, default=10.0, help="seconds between initial worker launches")
+    parser.add_argument("--report-every", type=float, default=60.0)
+    args = parser.parse_args()
+
+    if args.workers <= 0:
+        args.workers = default_workers(args.cpus_per_worker, args.worker_mb, args.reserve_mb)
+        memory = available_memory_mb()
+        print(
+            f"[SUPERVISOR] {available_cpus():g} CPU(s), "
+            f"{'unknown' if memory is None else f'{memory:.0f} MB'} memory -> {args.workers} worker(s)"
+        )
+    return supervise(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -6,6 +6,7 @@ import os
 import re
 import time
 import random
+import signal
 from pathlib import Path
 from threading import Lock
 from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
@@ -24,15 +25,32 @@ from is_pages.is_chat_ui import *
 from boomlify_codes import *
 from activate_search_mode import *
 from birthday_helpers import fill_birthday
+import db_pool
 import mycdp.network as cdp_network
-# SSE answer + citation parser.
-from master import _extract_answer_and_citations_from_sse
+# SSE answer + citation parser (delta_encoding v1 reconstruction).
+from delta_encoding import DeltaStreamParser
+from stream_capture import ConversationStreamTap, FetchTee, PromptCompletion
+from prompt_prefetch import PromptPrefetcher
+from prompt_notify import PromptNotifier
+from prompt_claim import build_claim_query, check_claim_plan, processing_stale_s
+from supervisor import heartbeat
+from result_writer import get_writer
 from master import enter_prompt
+from chat_tabs import ChatTabs, chromium_args, tab_count
+from session_snapshot import SessionSnapshot
+from tracing import tracer
+import live_metrics
+from resource_governor import ResourceGovernor, lean_chromium_args
+from session_policy import SessionPolicy
+from chat_reset import ChatReset, per_prompt_enabled
 
 
 RUN_RESULT_DONE = "done"
 RUN_RESULT_RESTART = "restart"
 RUN_RESULT_NO_PROMPTS = "no_prompts"
+# Planned restart (resource governor): not counted against MAX_BROWSER_RESTARTS
+# once the session answered MEMORY_RECYCLE_MIN_PROMPTS prompts.
+RUN_RESULT_RECYCLE = "recycle"
 
 # Total prompts processed across browser restarts within one script run.
 global_prompts = 1
@@ -51,119 +69,8 @@ def pick_prompt(website_filter=None, batch_size=None):
     if not database_url:
         raise RuntimeError("Missing DATABASE_URL in environment/.env")
 
-    if batch_size is None:
-        try:
-            batch_size = int(os.getenv("PROMPT_BATCH_SIZE", "1"))
-        except ValueError:
-            batch_size = 1
-    else:
-        try:
-            batch_size = int(batch_size)
-        except (TypeError, ValueError):
-            batch_size = 1
-    batch_size = max(1, batch_size)
-
-    prompt_engine = os.getenv("PROMPT_ENGINE", "chatgpt").strip() or "chatgpt"
-    engine_account = (
-        os.getenv("PROMPT_ENGINE_ACCOUNT", "github actions").strip()
-        or "github actions"
-    )
-    pending_status = os.getenv("PROMPT_PENDING_STATUS", "pending").strip() or "pending"
-    failed_status = os.getenv("PROMPT_FAILED_STATUS", "failed").strip() or "failed"
-    processing_status = os.getenv("PROMPT_PROCESSING_STATUS", "processing").strip() or "processing"
-
-    only_today_raw = os.getenv("PROMPT_ONLY_TODAY")
-    # Default: only process prompts created "today" (CURRENT_DATE in DB timezone).
-    # Set PROMPT_ONLY_TODAY=0/false/no to disable this filter.
-    if only_today_raw is None or not only_today_raw.strip():
-        only_today = True
-    else:
-        only_today = only_today_raw.strip().lower() in {"1", "true", "yes", "y"}
-    today_clause = ""
-    if only_today:
-        # Uses the DB session timezone for CURRENT_DATE.
-        today_clause = "AND created_at >= CURRENT_DATE AND created_at < (CURRENT_DATE + INTERVAL '1 day')"
-
-    website_filter_json = None
-    if website_filter is not None:
-        if isinstance(website_filter, (dict, list)):
-            website_filter_json = json.dumps(website_filter)
-        elif isinstance(website_filter, str):
-            text = website_filter.strip()
-            if not text or text.lower() in {"none", "null"}:
-                website_filter_json = None
-            elif text:
-                # Validate JSON text before sending it to Postgres jsonb operator.
-                try:
-                    json.loads(text)
-                    website_filter_json = text
-                except Exception:
-                    print(f"[WARN] Invalid WEBSITE_FILTER JSON, ignoring: {text}")
-                    website_filter_json = None
-        else:
-            raise ValueError("website_filter must be dict/list/JSON-string/None")
-
-    website_filter_clause = ""
-    if website_filter_json is not None:
-        website_filter_clause = "AND website @> %s::jsonb"
-
-    claim_sql = f"""
-        WITH picked AS (
-            SELECT id
-            FROM public.prompts
-            WHERE status IN (%s, %s, %s)
-              AND engine = %s
-              {website_filter_clause}
-              {today_clause}
-              AND prompt_text IS NOT NULL
-              AND BTRIM(prompt_text) <> ''
-            ORDER BY
-                CASE status
-                    WHEN %s THEN 1
-                    WHEN %s THEN 2
-                    WHEN %s THEN 3
-                    ELSE 99
-                END,
-                created_at ASC,
-                prompt_id ASC
-            FOR UPDATE SKIP LOCKED
-            LIMIT %s
-        )
-        UPDATE public.prompts AS p
-        SET status = %s,
-            engine_account = %s,
-            started_at = COALESCE(p.started_at, NOW()),
-            attempts = COALESCE(p.attempts, 0) + 1
-        FROM picked
-        WHERE p.id = picked.id
-        RETURNING
-            p.id,
-            p.prompt_id,
-            p.prompt_text,
-            p.status,
-            p.created_at,
-            p.website,
-            p.competitor_websites;
-    """
-
-    query_params = [
-        pending_status,
-        failed_status,
-        processing_status,
-        prompt_engine,
-    ]
-    if website_filter_json is not None:
-        query_params.append(website_filter_json)
-    query_params.extend(
-        [
-            pending_status,
-            failed_status,
-            processing_status,
-            batch_size,
-            processing_status,
-            engine_account,
-        ]
-    )
+    claim_sql, query_params, only_today, statuses = build_claim_query(website_filter, batch_size)
+    pending_status, failed_status, processing_status = statuses
 
     rows = []
     query_attempted = False
@@ -172,14 +79,8 @@ def pick_prompt(website_filter=None, batch_size=None):
         import psycopg  # type: ignore
 
         query_attempted = True
-        with psycopg.connect(database_url, connect_timeout=8) as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    claim_sql,
-                    tuple(query_params),
-                )
-                rows = cur.fetchall()
-            conn.commit()
+        # Pooled connection (db_pool): no TCP/TLS handshake per claim.
+        rows = db_pool.execute(claim_sql, query_params, fetch="all", label="claim")
 
     if not query_attempted:
         with suppress(ImportError):
@@ -224,6 +125,9 @@ def pick_prompt(website_filter=None, batch_size=None):
                 "created_at": str(row[4]) if row[4] is not None else None,
                 "website": row[5],
                 "competitor_websites": row[6],
+                # Pre-claim status and claim time, for release_prompts.
+                "claimed_from": row[7],
+                "claimed_at": row[8],
             }
         )
 
@@ -284,30 +188,27 @@ def update_prompt_result(
         RETURNING id, status;
     """
 
-    import psycopg
-    with psycopg.connect(database_url, connect_timeout=8) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                sql,
-                (
-                    status,
-                    engine_account,
-                    prompt_text,
-                    response_text,
-                    error_text,
-                    _to_jsonb(source_links if status == "completed" else None),
-                    _to_jsonb(metrics["appeared_links_unique"]) if metrics else None,
-                    _to_jsonb(metrics["my_citations"]) if metrics else None,
-                    _to_jsonb(metrics["competitor_citations"]) if metrics else None,
-                    metrics["total_citations_count"] if metrics else None,
-                    metrics["my_domain_citations_count"] if metrics else None,
-                    metrics["my_brand_mentions_count"] if metrics else None,
-                    status,
-                    prompt_id,
-                ),
-            )
-            row = cur.fetchone()
-        conn.commit()
+    row = db_pool.execute(
+        sql,
+        (
+            status,
+            engine_account,
+            prompt_text,
+            response_text,
+            error_text,
+            _to_jsonb(source_links if status == "completed" else None),
+            _to_jsonb(metrics["appeared_links_unique"]) if metrics else None,
+            _to_jsonb(metrics["my_citations"]) if metrics else None,
+            _to_jsonb(metrics["competitor_citations"]) if metrics else None,
+            metrics["total_citations_count"] if metrics else None,
+            metrics["my_domain_citations_count"] if metrics else None,
+            metrics["my_brand_mentions_count"] if metrics else None,
+            status,
+            prompt_id,
+        ),
+        fetch="one",
+        label="update",
+    )
 
     if not row:
         if skip_if_missing:
@@ -320,6 +221,43 @@ def update_prompt_result(
     return {"id": str(row[0]), "status": row[1], "updated": True}
 
 
+def release_prompts(prompts):
+    """
+    Give claimed-but-unstarted prompts back: restore the status each was
+    claimed from (pending / failed / processing) and undo the claim's attempts
+    bump. A row is only touched while it still carries this claim's
+    started_at, so a prompt another worker has re-claimed since is left alone.
+    """
+    pending_status = os.getenv("PROMPT_PENDING_STATUS", "pending").strip() or "pending"
+    processing_status = os.getenv("PROMPT_PROCESSING_STATUS", "processing").strip() or "processing"
+
+    by_status = {}
+    for prompt in prompts or []:
+        by_status.setdefault(prompt.get("claimed_from") or pending_status, []).append(prompt)
+
+    released = 0
+    for status, group in by_status.items():
+        # One placeholder pair per row so each compares against the column types (and the index).
+        placeholders = ", ".join(["(%s, %s)"] * len(group))
+        # A stale processing row goes back claimable at once, as it was before this claim.
+        lease = "started_at = NULL," if status == processing_status else ""
+        sql = f"""
+            UPDATE public.prompts
+            SET status = %s,
+                {lease}
+                attempts = GREATEST(COALESCE(attempts, 1) - 1, 0)
+            WHERE (id, started_at) IN ({placeholders}) AND status = %s
+            RETURNING id;
+        """
+        params = [status]
+        for prompt in group:
+            params.extend([prompt["id"], prompt.get("claimed_at")])
+        params.append(processing_status)
+        rows = db_pool.execute(sql, params, fetch="all", label="release")
+        released += len(rows)
+    return released
+
+
 
 proxy = (os.getenv("CHATGPT_PROXY") or "").strip() or None
 t0 = time.perf_counter()
@@ -393,6 +331,7 @@ def create_chatgpt_account(sb):
     global global_prompts
     t0 = time.perf_counter()  # Start timer
     print("Systems green, standing by.")
+    heartbeat.beat("browser_start")
     print("\n")
 
     url = "https://chatgpt.com/?temporary-chat=true"
@@ -403,14 +342,16 @@ def create_chatgpt_account(sb):
     # https://chatgpt.com/
 
     # sb.uc_open_with_reconnect(url, 4)
-    sb.activate_cdp_mode("about:blank")
+    with tracer.span("activate_cdp_mode"):
+        sb.activate_cdp_mode("about:blank")
     # apply_bandwidth_saver(sb)
     # Start capture BEFORE navigation so we don't miss early /f/conversation requests.
     endpoint_url=sb.cdp.get_endpoint_url()
 
     with sync_playwright() as p:
 
-        browser=p.chromium.connect_over_cdp(endpoint_url)
+        with tracer.span("connect_over_cdp"):
+            browser=p.chromium.connect_over_cdp(endpoint_url)
         context=browser.contexts[0]
         page=context.pages[0]
 
@@ -433,27 +374,71 @@ def create_chatgpt_account(sb):
 
         page.on('response', _on_pw_response)
 
+        # SSE_CAPTURE_MODE=early parses the stream live over CDP, =fetch tees it
+        # inside the page (window.fetch wrapper + expose_binding); both finish the
+        # prompt on the first terminal marker. "body" keeps sleep + resp.body().
+        capture_mode = (os.getenv("SSE_CAPTURE_MODE", "body") or "body").strip().lower()
+        stream_tap = None
+        if capture_mode in ("early", "fetch"):
+            try:
+                tap_cls = FetchTee if capture_mode == "fetch" else ConversationStreamTap
+                stream_tap = tap_cls(page).start()
+                print(f"[STREAM] Early-finish capture enabled ({capture_mode})")
+            except Exception as e:
+                print(f"[STREAM] Live capture unavailable, using resp.body(): {e}")
+
+        # PROMPT_COMPLETION=network (default) ends enter_prompt when the
+        # conversation request finishes or the tap sees a terminal marker, padded
+        # to PROMPT_DWELL_MIN_S..PROMPT_DWELL_MAX_S after send; "sleep" keeps the
+        # fixed sleeps + stop-button poll.
+        prompt_completion = None
+        if (os.getenv("PROMPT_COMPLETION", "network") or "network").strip().lower() == "network":
+            prompt_completion = PromptCompletion(page, tap=stream_tap).start()
+
+        # Cookies/localStorage saved after an earlier good session (SESSION_SNAPSHOT)
+        # keep the popups dismissed, so a restored browser skips the popup sweeps.
+        snapshot = SessionSnapshot()
+        restored = snapshot.restore(context)
+
         # page.goto("https://chatgpt.com/?temporary-chat=true")
-        sb.cdp.open(url)
+        with tracer.span("url_open"):
+            sb.cdp.open(url)
         print("\n" * 3)
         save_ss(sb)
         print("### [START] POP UPS and CHAT UI ###")
 
-        popups_appeared=is_popups_visible(sb)
-        print("\n")
-        print(f"Popups appeared TRY 4 : {popups_appeared}")
-        print("\n")
-
-
-        if is_chat_ui_visible(sb)==True:
-            dt = time.perf_counter() - t0
-            h = int(dt // 3600)
-            m = int((dt % 3600) // 60)
-            s = dt % 60
-            print(f"Runtime: {h}h {m}m {s:.2f}s")
+        ui_ready = False
+        if restored:
+            with tracer.span("is_popups_visible", restored=True):
+                is_popups_visible(sb, timeout=3)
+            ui_ready = wait_for_textarea(sb, timeout=12) is not None
+            if not ui_ready:
+                print("[SNAPSHOT] Chat UI not ready after restore; running the full setup")
+                snapshot.discard()
+
+        if not ui_ready:
+            with tracer.span("is_popups_visible"):
+                popups_appeared=is_popups_visible(sb)
+            print("\n")
+            print(f"Popups appeared TRY 4 : {popups_appeared}")
+            print("\n")
+
+
+            with tracer.span("is_chat_ui_visible"):
+                chat_ui_visible = is_chat_ui_visible(sb)
+            if chat_ui_visible==True:
+                dt = time.perf_counter() - t0
+                h = int(dt // 3600)
+                m = int((dt % 3600) // 60)
+                s = dt % 60
+                print(f"Runtime: {h}h {m}m {s:.2f}s")
         
         
-        activate_search_mode(sb)
+        with tracer.span("activate_search_mode"):
+            activate_search_mode(sb)
+        setup_mode = "restored" if ui_ready else ("fallback" if restored else "cold")
+        setup_s = time.perf_counter() - t0
+        snapshot.log_setup(setup_mode, setup_s)
 
         # --- Fetch prompts from database ---
         website_filter = os.getenv("WEBSITE_FILTER")
@@ -466,7 +451,9 @@ def create_chatgpt_account(sb):
 
         prompt_number=1
         
-        # Iterate through prompts one-by-one (claim 1 row at a time).
+        # Prompts are claimed in batches on a background thread and handed out
+        # one at a time (PROMPT_PREFETCH_BATCH, refilled below
+        # PROMPT_PREFETCH_LOW_WATER); unstarted ones go back to pending on exit.
         cdp = _get_cdp(sb)
         needs_restart = False
         restart_reason = None
@@ -479,6 +466,42 @@ def create_chatgpt_account(sb):
             max_prompts_per_session = 0
         max_prompts_per_session = max(0, max_prompts_per_session)
 
+        try:
+            prefetch_batch = int(os.getenv("PROMPT_PREFETCH_BATCH", "5"))
+        except ValueError:
+            prefetch_batch = 5
+        try:
+            prefetch_low_water = int(os.getenv("PROMPT_PREFETCH_LOW_WATER", "2"))
+        except ValueError:
+            prefetch_low_water = 2
+        # Results are spooled locally and written to RDS by a background thread
+        # (result_writer); a DB outage no longer stalls or loses a prompt.
+        results = get_writer(build_metrics=build_metrics)
+        # Idle mode: when the table runs dry keep this browser warm and wait on
+        # LISTEN (prompt_notify) / a long poll for up to PROMPT_IDLE_TTL_S.
+        try:
+            idle_ttl_s = float(os.getenv("PROMPT_IDLE_TTL_S", "0"))
+        except ValueError:
+            idle_ttl_s = 0.0
+        try:
+            idle_poll_s = float(os.getenv("PROMPT_IDLE_POLL_S", "60"))
+        except ValueError:
+            idle_poll_s = 60.0
+        notifier = PromptNotifier() if idle_ttl_s > 0 else None
+        prefetcher = PromptPrefetcher(
+            claim=lambda n: pick_prompt(website_filter=website_filter, batch_size=n),
+            release=release_prompts,
+            batch_size=prefetch_batch,
+            low_water=prefetch_low_water,
+            limit=max_prompts_per_session,
+            # Beat while idling so the supervisor does not take a warm wait for a hang.
+            wait_for_work=(lambda t: heartbeat.beat("idle") or notifier.wait(t)) if notifier is not None else None,
+            idle_ttl_s=idle_ttl_s,
+            poll_s=idle_poll_s,
+            # Hand out only prompts whose processing lease has time left to answer them.
+            max_hold_s=processing_stale_s() / 2,
+        ).start()
+
         def _get_response_body_with_timeout(resp, timeout_s):
             # Playwright's sync API can't be called from other threads (greenlet-based),
             # so implement a timeout by wrapping the underlying coroutine with asyncio.wait_for.
@@ -494,26 +517,246 @@ def create_chatgpt_account(sb):
 
         sse_body_timeout_s = int(os.getenv("SSE_BODY_TIMEOUT_S", "240"))
 
-        while True:
+        def _record_result(answer, citations, prompt_id, prompt, **row):
+            _all_results.append({
+                'prompt_number': prompt_number - 1,
+                'prompt_id': prompt_id,
+                'prompt': prompt,
+                'answer': answer,
+                'answer_chars': len(answer),
+                'citations': citations,
+                'citations_count': len(citations),
+                **row,
+            })
+            print(f"[PW] Answer: {len(answer)} chars | Citations: {len(citations)}")
+            if answer:
+                print(f"[PW] Preview: {answer[:200]}...")
+
+        # Memory sampled after every prompt (resource_governor): a fresh chat or a
+        # planned browser restart before the container's OOM killer steps in.
+        governor = ResourceGovernor(pages=[page], session=tracer.session)
+        planned_recycle = False
+        # Refresh / recycle decisions from the governor's sample, answer latency
+        # and recent failures (session_policy); every action's cost is logged.
+        policy = SessionPolicy(governor, session=tracer.session)
+        # NEW_CHAT_PER_PROMPT=1: an empty temporary chat (in-app, no reload)
+        # before every prompt, so the DOM does not grow with the session.
+        new_chat = ChatReset() if per_prompt_enabled() else None
+        policy.recycled("session_start", setup_s, setup_mode, new_chat=new_chat.method if new_chat else "off")
+
+        def _refresh_page(action, reason):
+            """Refresh (or reopen) the temporary chat between prompts; False if that failed."""
+            recycle_t0 = time.perf_counter()
+            try:
+                _pw_responses.clear()  # Discard stale responses before refresh
+                if action == "fresh_chat":
+                    sb.cdp.open(url)
+                else:
+                    sb.refresh_page()
+                print(f"[PAGE REFRESHED] {reason}")
+                sleep_dbg(sb,3,10)
+                activate_search_mode(sb)
+                save_ss(sb)
+            except Exception as e:
+                print(f"[POLICY] {action} failed: {type(e).__name__}: {e}")
+                return False
+            policy.recycled(action, time.perf_counter() - recycle_t0, reason)
+            return True
+
+        # CHAT_TABS=K > 1: K temporary-chat tabs in this browser with one prompt
+        # in flight per tab (chat_tabs.ChatTabs); CHAT_TABS=1 keeps the loop below.
+        tabs = None
+        if tab_count() > 1:
+            try:
+                tabs = ChatTabs(
+                    context,
+                    page,
+                    tap=stream_tap,
+                    capture_mode="early" if capture_mode == "early" else "fetch",
+                    prompt_timeout_s=sse_body_timeout_s,
+                    refresh_every=0,  # the policy decides when a tab is reopened
+                    new_chat=new_chat,
+                ).open(tab_count())
+                for tab in tabs.tabs[1:]:
+                    governor.add_page(tab.page)
+            except Exception as e:
+                print(f"[TABS] Multi-tab mode unavailable, using one tab: {type(e).__name__}: {e}")
+
+        if tabs is not None:
+            exhausted = False
+            prompt_numbers = {}
+            while True:
+                tab = None if exhausted or needs_restart else tabs.free_tab()
+                # Claim only when next() cannot block while other tabs are streaming.
+                if tab is not None and (prefetcher.ready() or not tabs.busy()):
+                    if max_prompts_per_session and total_claimed >= max_prompts_per_session:
+                        print(f"[PROMPTS] Reached MAX_PROMPTS_PER_SESSION={max_prompts_per_session}.")
+                        exhausted = True
+                        continue
+                    claim_t0 = time.perf_counter()
+                    try:
+                        prompt_obj = prefetcher.next()
+                    except Exception as e:
+                        print(f"[DB] Prompt claim failed: {type(e).__name__}: {e}")
+                        needs_restart = True
+                        restart_reason = f"claim_failed err={e}"
+                        continue
+                    if prompt_obj is None:
+                        exhausted = True
+                        continue
+                    tracer.record("claim", time.perf_counter() - claim_t0, prompt_id=prompt_obj["id"])
+                    total_claimed += 1
+                    global_prompts = global_prompts + 1
+                    heartbeat.beat("prompt")
+                    prompt_numbers[prompt_obj["id"]] = prompt_number
+                    print(f"[DB] Processing prompt #{prompt_number} on tab {tab.index}: {prompt_obj['prompt_text'][:100]}...")
+                    prompt_number = prompt_number + 1
+                    try:
+                        tabs.submit(tab, prompt_obj)
+                    except Exception as e:
+                        error_msg = f"{type(e).__name__}: {str(e)}"
+                        print(f"[ERROR] Prompt {prompt_obj['id']} failed on tab {tab.index}: {error_msg}")
+                        try:
+                            results.submit(
+                                prompt_id=prompt_obj["id"],
+                                status="failed",
+                                error_text=error_msg,
+                                engine_account=engine_account,
+                            )
+                            heartbeat.add("failed")
+                            live_metrics.prompt_finished("failed", reason="exception")
+                        except Exception as db_err:
+                            print(f"[DB] Failed to mark prompt {prompt_obj['id']} as failed: {db_err}")
+                        needs_restart = True
+                        restart_reason = f"exception prompt_id={prompt_obj['id']} err={error_msg}"
+                    continue
+
+                if not tabs.busy() and (exhausted or needs_restart):
+                    if exhausted and not needs_restart and total_claimed == 0:
+                        prefetcher.close()
+                        if notifier is not None:
+                            notifier.close()
+                        tabs.close()
+                        print("[DB] No prompts to process. Exiting.")
+                        return RUN_RESULT_NO_PROMPTS
+                    if exhausted:
+                        print("[DB] No more prompts to process. Exiting.")
+                    break
+
+                # In-flight tabs finish even after a restart was requested.
+                for tab, prompt_obj, record, error in tabs.poll(1.0):
+                    prompt_id = prompt_obj["id"]
+                    tracer.stream(record, tab.sent_at, prompt_id=prompt_id, tab=tab.index)
+                    answer, citations = ("", []) if record is None else (record.parser.answer, record.parser.citations)
+                    if answer:
+                        _record_result(
+                            answer,
+                            citations,
+                            prompt_number=prompt_numbers.pop(prompt_id, None),
+                            prompt_id=prompt_id,
+                            prompt=prompt_obj["prompt_text"],
+                            tab=tab.index,
+                        )
+                    if answer and citations:
+                        error_text = None
+                    elif answer:
+                        print(f"[CRITICAL] Zero citations detected for prompt {prompt_id} on tab {tab.index}!")
+                        error_text = "Zero citations returned"
+                    else:
+                        print(f"[DB] WARNING: No answer captured for prompt {prompt_id} on tab {tab.index}")
+                        error_text = f"No answer captured from stream capture ({error or 'no stream'})"
+                    try:
+                        if error_text is None:
+                            results.submit(
+                                prompt_id=prompt_id,
+                                status="completed",
+                                response_text=answer,
+                                source_links=citations,
+                                website=prompt_obj.get("website"),
+                                competitor_websites=prompt_obj.get("competitor_websites"),
+                                engine_account=engine_account,
+                            )
+                            heartbeat.add("completed")
+                            live_metrics.prompt_finished("completed", answer=answer, citations=citations)
+                            if not snapshot.captured:
+                                snapshot.capture(context, page)
+                        else:
+                            results.submit(
+                                prompt_id=prompt_id,
+                                status="failed",
+                                error_text=error_text,
+                                engine_account=engine_account,
+                            )
+                            heartbeat.add("failed")
+                            live_metrics.prompt_finished("failed", reason="zero_citations" if answer else "no_answer_captured", answer=answer, citations=citations)
+                        print(f"[DB] Queued prompt {prompt_id} as {'completed' if error_text is None else 'failed'}")
+                    except Exception as e:
+                        print(f"[DB] Failed to queue prompt {prompt_id}: {e}")
+                        needs_restart = True
+                        restart_reason = f"result_spool_failed prompt_id={prompt_id}"
+                    action = reason = None
+                    if error_text is not None:
+                        failure = "zero_citations" if answer else "no_answer_captured"
+                        action, reason = policy.after_failure(prompt_id, failure)
+                        if action == "restart":
+                            needs_restart = True
+                            restart_reason = f"{failure} prompt_id={prompt_id}"
+                    elif not needs_restart:
+                        action, reason = policy.after_prompt(prompt_id, time.time() - tab.sent_at, tab=tab.index)
+                        if action == "restart":
+                            needs_restart = planned_recycle = True
+                            restart_reason = f"memory_recycle prompt_id={prompt_id}"
+                    # A refresh of this tab is a fresh temporary chat in it.
+                    if action in ("refresh", "fresh_chat") and not needs_restart:
+                        recycle_t0 = time.perf_counter()
+                        try:
+                            tabs.fresh_chat(tab)
+                        except Exception as e:
+                            print(f"[POLICY] {action} failed on tab {tab.index}: {type(e).__name__}: {e}")
+                            needs_restart = True
+                            restart_reason = f"refresh_failed prompt_id={prompt_id} err={e}"
+                        else:
+                            policy.recycled(action, time.perf_counter() - recycle_t0, reason, tab=tab.index)
+                _pw_responses.clear()
+
+            tabs.close()
+
+        # Single-tab loop (CHAT_TABS=1); skipped when the tab loop above ran.
+        while tabs is None:
             if max_prompts_per_session and total_claimed >= max_prompts_per_session:
                 print(f"[PROMPTS] Reached MAX_PROMPTS_PER_SESSION={max_prompts_per_session}.")
                 break
 
-            db_prompts = pick_prompt(website_filter=website_filter, batch_size=1)
-            if not db_prompts:
+            claim_t0 = time.perf_counter()
+            try:
+                prompt_obj = prefetcher.next()
+            except Exception as e:
+                print(f"[DB] Prompt claim failed: {type(e).__name__}: {e}")
+                needs_restart = True
+                restart_reason = f"claim_failed err={e}"
+                break
+            if prompt_obj is None:
                 if total_claimed == 0:
+                    prefetcher.close()
+                    if notifier is not None:
+                        notifier.close()
                     print("[DB] No prompts to process. Exiting.")
                     return RUN_RESULT_NO_PROMPTS
+                if notifier is not None:
+                    print(f"[DB] Idle for PROMPT_IDLE_TTL_S={idle_ttl_s:.0f}s. Exiting.")
                 print("[DB] No more prompts to process. Exiting.")
                 break
 
-            prompt_obj = db_prompts[0]
             total_claimed += 1
+            heartbeat.beat("prompt")
             # Extract metadata from database prompt object
             current_prompt_id = prompt_obj["id"]
             current_prompt_text = prompt_obj["prompt_text"]
             current_website = prompt_obj.get("website")
             current_competitor_websites = prompt_obj.get("competitor_websites")
+            # Spans until the next claim belong to this prompt.
+            tracer.prompt_id = current_prompt_id
+            tracer.record("claim", time.perf_counter() - claim_t0)
             try:
                 for sel in LIST_OF_POPUPS:
                     # visible() and click() are SeleniumBase builtins
@@ -525,13 +768,6 @@ def create_chatgpt_account(sb):
                         sb.sleep(random.uniform(2, 4))  # Pause after closing to allow follow-up popups
                         break
                 print(f"[DB] Processing prompt #{prompt_number}: {current_prompt_text[:100]}...")
-                if prompt_number%50==0:
-                    _pw_responses.clear()  # Discard stale responses before refresh
-                    sb.refresh_page()
-                    print("[PAGE REFRESHED]")
-                    sleep_dbg(sb,3,10)
-                    activate_search_mode(sb)
-                    save_ss(sb)
                 print("\n" * 3)
                 print(f"[GLOBAL PROMPTS]: {global_prompts}")
                 dt = time.perf_counter() - t0
@@ -544,13 +780,15 @@ def create_chatgpt_account(sb):
                 print(prompt_number)
                 print("\n" * 3)
                 
-                enter_prompt(sb, current_prompt_text)
-                if prompt_number%50==0:
-                    activate_search_mode(sb)
+                if new_chat is not None:
+                    new_chat.reset(page)
+                prompt_sent_at = time.time()
+                sent_at = enter_prompt(sb, current_prompt_text, wait_for_completion=prompt_completion) or prompt_sent_at
                 prompt_number=prompt_number+1
-                # Wait for the response/search to complete before the next one
-                # Adjust timing based on how long 'enter_prompt' waits intenally
-                sleep_dbg(sb, 5, 8)
+                if stream_tap is None and prompt_completion is None:
+                    # Wait for the response/search to complete before the next one
+                    # Adjust timing based on how long 'enter_prompt' waits intenally
+                    sleep_dbg(sb, 5, 8)
 
                 # --- Collect SSE response via Playwright ---
                 # Flush Playwright's pending event queue so response handlers fire.
@@ -561,54 +799,68 @@ def create_chatgpt_account(sb):
                 except Exception:
                     pass
 
+                stream_record = None
+                if stream_tap is not None:
+                    stream_record = stream_tap.wait_for_terminal(
+                        prompt_sent_at, sse_body_timeout_s, submitted_at=time.time()
+                    )
+                    if stream_record is not None and not (stream_record.done or stream_record.closed_at is not None):
+                        print("[STREAM] No terminal marker before timeout; falling back to resp.body()")
+                        stream_record = None
+                if stream_record is not None:
+                    tracer.stream(stream_record, sent_at)
+                    answer, citations = stream_record.parser.answer, stream_record.parser.citations
+                    _record_result(answer, citations, current_prompt_id, current_prompt_text)
+                    _pw_responses.clear()
+
                 for resp in list(_pw_responses):
                     try:
                         # .body() blocks until the full SSE stream is done, then
                         # returns the complete response body (all event: / data: lines).
                         body, body_err = _get_response_body_with_timeout(resp, sse_body_timeout_s)
+                        tracer.record("stream_end", time.time() - sent_at, start=sent_at, ok=body_err is None, capture="body")
                         if body_err is not None:
                             raise body_err
-                        text = (body or b"").decode('utf-8', errors='replace')
-                        if text and len(text) > 50:
-                            answer, citations = _extract_answer_and_citations_from_sse(text)
-                            _all_results.append({
-                                'prompt_number': prompt_number - 1,
-                                'prompt_id': current_prompt_id,
-                                'prompt': current_prompt_text,
-                                'answer': answer,
-                                'answer_chars': len(answer),
-                                'citations': citations,
-                                'citations_count': len(citations),
-                            })
-                            print(f"[PW] Answer: {len(answer)} chars | Citations: {len(citations)}")
-                            if answer:
-                                print(f"[PW] Preview: {answer[:200]}...")
+                        if body and len(body) > 50:
+                            # Feed raw bytes: no full-body decode/copy before parsing.
+                            with tracer.span("parse", bytes=len(body), capture="body"):
+                                parser = DeltaStreamParser()
+                                parser.feed(body)
+                                parser.close()
+                            answer, citations = parser.answer, parser.citations
+                            _record_result(answer, citations, current_prompt_id, current_prompt_text)
                     except Exception as e:
                         print(f"[PW] Body capture failed: {e}")
                 _pw_responses.clear()
+                answer_latency_s = time.time() - sent_at
 
-                # --- Validate citations (zero = browser issue, restart required) ---
+                # --- Validate citations (zero = browser issue; session_policy refreshes or restarts) ---
                 if answer and len(citations) == 0:
                     print(f"[CRITICAL] Zero citations detected for prompt {current_prompt_id}!")
                     print(f"[CRITICAL] This indicates a browser/network issue. Marking as failed and restarting browser...")
                     try:
-                        update_prompt_result(
+                        results.submit(
                             prompt_id=current_prompt_id,
                             status="failed",
-                            error_text="Zero citations returned - browser restart required",
+                            error_text="Zero citations returned",
                             engine_account=engine_account,
                         )
-                        print(f"[DB] Marked prompt {current_prompt_id} as failed (zero citations)")
+                        print(f"[DB] Queued prompt {current_prompt_id} as failed (zero citations)")
+                        heartbeat.add("failed")
+                        live_metrics.prompt_finished("failed", reason="zero_citations", answer=answer, citations=citations)
                     except Exception as e:
                         print(f"[DB] Failed to mark prompt {current_prompt_id} as failed: {e}")
-                    needs_restart = True
-                    restart_reason = f"zero_citations prompt_id={current_prompt_id}"
-                    break
+                    action, reason = policy.after_failure(current_prompt_id, "zero_citations")
+                    if action == "restart" or not _refresh_page(action, reason):
+                        needs_restart = True
+                        restart_reason = f"zero_citations prompt_id={current_prompt_id}"
+                        break
+                    continue
 
                 # --- Update database with successful result ---
                 if answer:
                     try:
-                        update_prompt_result(
+                        results.submit(
                             prompt_id=current_prompt_id,
                             status="completed",
                             response_text=answer,
@@ -617,28 +869,38 @@ def create_chatgpt_account(sb):
                             competitor_websites=current_competitor_websites,
                             engine_account=engine_account,
                         )
-                        print(f"[DB] Marked prompt {current_prompt_id} as completed")
+                        print(f"[DB] Queued prompt {current_prompt_id} as completed")
+                        heartbeat.add("completed")
+                        live_metrics.prompt_finished("completed", answer=answer, citations=citations)
+                        if not snapshot.captured:
+                            snapshot.capture(context, page)
                     except Exception as e:
-                        print(f"[DB] Failed to update prompt {current_prompt_id}: {e}")
-                        update_prompt_result(..., status="failed", error_text="Failed to update prompt inside aws database even when answer and citations came up!")
-                        needs_restart = False
-                        restart_reason = f"db_update_failed prompt_id={current_prompt_id}"
-                        continue
+                        # Only a local spool write can fail here; the answer is still in _all_results.
+                        print(f"[DB] Failed to queue prompt {current_prompt_id}: {e}")
+                        # The prompt stays in processing; stop rather than keep dropping writes.
+                        needs_restart = True
+                        restart_reason = f"result_spool_failed prompt_id={current_prompt_id}"
+                        break
                 else:
                     print(f"[DB] WARNING: No answer captured for prompt {current_prompt_id}")
                     try:
-                        update_prompt_result(
+                        results.submit(
                             prompt_id=current_prompt_id,
                             status="failed",
                             error_text="No answer captured from Playwright network capture",
                             engine_account=engine_account,
                         )
-                        print(f"[DB] Marked prompt {current_prompt_id} as failed (no answer)")
+                        print(f"[DB] Queued prompt {current_prompt_id} as failed (no answer)")
+                        heartbeat.add("failed")
+                        live_metrics.prompt_finished("failed", reason="no_answer_captured")
                     except Exception as e:
                         print(f"[DB] Failed to mark prompt {current_prompt_id} as failed: {e}")
-                    needs_restart = True
-                    restart_reason = f"no_answer_captured prompt_id={current_prompt_id}"
-                    break
+                    action, reason = policy.after_failure(current_prompt_id, "no_answer_captured")
+                    if action == "restart" or not _refresh_page(action, reason):
+                        needs_restart = True
+                        restart_reason = f"no_answer_captured prompt_id={current_prompt_id}"
+                        break
+                    continue
 
                 dt = time.perf_counter() - t0
                 h = int(dt // 3600)
@@ -648,18 +910,32 @@ def create_chatgpt_account(sb):
                 print(f"[RUNTIME]: {h}h {m}m {s:.2f}s")
                 # (Printed once per prompt)
 
+                action, reason = policy.after_prompt(
+                    current_prompt_id, answer_latency_s, prompt_number=prompt_number - 1
+                )
+                if action == "restart":
+                    needs_restart = planned_recycle = True
+                    restart_reason = f"memory_recycle prompt_id={current_prompt_id}"
+                    break
+                if action and not _refresh_page(action, reason):
+                    needs_restart = True
+                    restart_reason = f"refresh_failed prompt_id={current_prompt_id}"
+                    break
+
             except Exception as e:
                 # --- Update database with failed result ---
                 error_msg = f"{type(e).__name__}: {str(e)}"
                 print(f"[ERROR] Prompt {current_prompt_id} failed: {error_msg}")
                 try:
-                    update_prompt_result(
+                    results.submit(
                         prompt_id=current_prompt_id,
                         status="failed",
                         error_text=error_msg,
                         engine_account=engine_account,
                     )
-                    print(f"[DB] Marked prompt {current_prompt_id} as failed")
+                    print(f"[DB] Queued prompt {current_prompt_id} as failed")
+                    heartbeat.add("failed")
+                    live_metrics.prompt_finished("failed", reason="exception")
                 except Exception as db_err:
                     print(f"[DB] Failed to mark prompt {current_prompt_id} as failed: {db_err}")
                 needs_restart = True
@@ -667,6 +943,35 @@ def create_chatgpt_account(sb):
                 break
 
         # print(f"Runtime: {h}h {m}m {s:.2f}s")
+        tracer.prompt_id = None
+        teardown_t0 = time.perf_counter()
+
+        # Claimed but never started -> back to pending before a restart/exit.
+        prefetcher.close()
+        if notifier is not None:
+            notifier.close()
+        if prefetcher.idle_s:
+            print(f"[PROMPTS] Waited warm for prompts: {prefetcher.idle_s:.0f}s")
+
+        if stream_tap is not None:
+            print(f"[STREAM] Wall time saved vs resp.body() wait: {stream_tap.total_saved_s:.1f}s")
+            stream_tap.stop()
+
+        # Give queued results a moment to land; anything left stays spooled and
+        # keeps flushing in the background (or is replayed on the next start).
+        results.flush(timeout_s=float(os.getenv("RESULT_FLUSH_TIMEOUT_S", "15")))
+        print(f"[RESULTS] {results.summary()}")
+
+        # Claim/update latency for this browser session (DB_LATENCY_LOG).
+        db_pool.report()
+        print(f"[MEMORY] {governor.summary()}")
+        governor.close()
+        if needs_restart:
+            # Teardown half of a restart; the next session_start row is the rest.
+            policy.recycled("restart", time.perf_counter() - teardown_t0, restart_reason.split()[0])
+        print(f"[POLICY] {policy.summary()}")
+        if new_chat is not None:
+            print(f"[NEW CHAT] {new_chat.summary()}")
 
         # --- Save all captured results ---
         if _all_results:
@@ -683,7 +988,18 @@ def create_chatgpt_account(sb):
 
         if needs_restart:
             print(f"[BROWSER] Restart requested: {restart_reason}")
+            live_metrics.browser_restart(restart_reason)
             save_ss(sb)
+            if planned_recycle and restart_reason.startswith("memory_recycle"):
+                # A browser that is over the marks again after a handful of
+                # prompts will not be fixed by recycling it: count that one.
+                recycle_min_prompts = int(os.getenv("MEMORY_RECYCLE_MIN_PROMPTS", "5") or "5")
+                if policy.prompts >= recycle_min_prompts:
+                    return RUN_RESULT_RECYCLE
+                print(
+                    f"[MEMORY] Recycle after {policy.prompts} prompt(s) (< {recycle_min_prompts}); "
+                    "counting it against MAX_BROWSER_RESTARTS"
+                )
             return RUN_RESULT_RESTART
         return RUN_RESULT_DONE
 
@@ -697,6 +1013,28 @@ if __name__ == "__main__":
     response=requests.get("https://ip.oxylabs.io/location", proxies=proxies)
 
     print(response.content)
+
+    # Startup self-check: warn when the claim query is not index-driven.
+    if (os.getenv("PROMPT_PLAN_CHECK", "1") or "1").strip().lower() not in {"0", "false", "no", "off"}:
+        try:
+            claim_sql, claim_params, _, _ = build_claim_query(os.getenv("WEBSITE_FILTER"), 1)
+            check_claim_plan(claim_sql, claim_params)
+        except Exception as e:
+            print(f"[DB][PLAN] Claim plan check skipped: {type(e).__name__}: {e}")
+
+    # Under supervisor.py: SIGTERM unwinds like Ctrl-C, so unstarted claims are
+    # released and queued results flushed (atexit) before the process exits.
+    def _on_sigterm(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _on_sigterm)
+    heartbeat.beat("starting")
+    # METRICS_PORT: Prometheus /metrics for this worker (live_metrics).
+    live_metrics.start()
+    # CHATGPT_PROXY: per-worker session
+    sb_proxy = proxy or "verseodin_yJ3Ta:a1CfsHJzt3~59=@disp.oxylabs.io:8001"
+
+    exit_code = 0
     restart_count = 0
     while restart_count < max_browser_restarts:
         print(f"\n{'='*60}")
@@ -704,6 +1042,9 @@ if __name__ == "__main__":
         print(f"{'='*60}\n")
 
         result = None
+        tracer.start_session()
+        launch_start = time.time()
+        launch_t0 = time.perf_counter()
         try:
             with SB(
                 uc=True,                  # Undetected Chromedriver - patches chromedriver binary
@@ -712,17 +1053,22 @@ if __name__ == "__main__":
                 test=True,
                 incognito=True,           # Clean session, no leftover cookies/history
                 locale="en",
-                proxy="verseodin_yJ3Ta:a1CfsHJzt3~59=@disp.oxylabs.io:8001",
-                chromium_arg="--disable-blink-features=AutomationControlled",  # Remove automation flag
+                proxy=sb_proxy,
+                # Remove automation flag (+ background-tab throttling off when CHAT_TABS > 1)
+                # and memory-lean switches (CHROME_LEAN=0 skips them).
+                chromium_arg=chromium_args(lean_chromium_args("--disable-blink-features=AutomationControlled", proxy=sb_proxy)),
             ) as sb:
+                tracer.record("sb_launch", time.perf_counter() - launch_t0, start=launch_start)
                 result = create_chatgpt_account(sb)
                 print(f"[RESULT] {result}")
         except KeyboardInterrupt:
             print("\n[BROWSER] Interrupted by user. Exiting.")
+            exit_code = 130
             break
         except Exception as e:
             # Errors starting SeleniumBase/Chrome itself should also trigger restart attempts.
             print(f"[BROWSER] Fatal error starting/running SB: {type(e).__name__}: {e}")
+            live_metrics.browser_restart("sb_error")
             result = RUN_RESULT_RESTART
 
         # SeleniumBase's SB context manager can suppress exceptions inside the `with` block.
@@ -737,10 +1083,16 @@ if __name__ == "__main__":
             print(f"{'='*60}\n")
             if restart_count >= max_browser_restarts:
                 print(f"[BROWSER] Max restarts ({max_browser_restarts}) reached. Exiting.")
+                exit_code = 1
                 break
             time.sleep(3)
             continue
 
+        if result == RUN_RESULT_RECYCLE:
+            print("[BROWSER] Planned recycle; starting a fresh browser")
+            time.sleep(3)
+            continue
+
         if result == RUN_RESULT_NO_PROMPTS:
             print("[BROWSER] No prompts claimed. Exiting.")
             break
@@ -755,3 +1107,5 @@ if __name__ == "__main__":
         continue
 
     print(f"\n[BROWSER] Session ended. Total restarts: {restart_count}")
+    heartbeat.beat("exited")
+    raise SystemExit(exit_code)
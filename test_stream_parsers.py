@@ -0,0 +1,118 @@
+"""
+Pin what SSEStreamParser and DeltaStreamParser return on the recorded streams.
+
+test6 stores DeltaStreamParser's answer and citations; master and
+reparse_captures still go through SSEStreamParser. The two differ on
+citations, by design: the delta parser reads content_references and
+search_result_groups from the rebuilt message, while the SSE parser scans
+every URL in every event. On sample_eventStream.jsonl that is 30 against 38.
+The extra 8 are utm-stripped copies of URLs the delta parser already has.
+On sample_response.jsonl the SSE parser also picks up images.openai.com
+thumbnails.
+
+Each check also feeds the same bytes in random chunks (splitting UTF-8
+sequences and lines) and expects the whole-body result.
+
+    python test_stream_parsers.py
+    python -m pytest -q test_stream_parsers.py
+"""
+
+from __future__ import annotations
+
+import hashlib
+import random
+from pathlib import Path
+from typing import List, Tuple
+
+from delta_encoding import DeltaStreamParser
+from sse_stream import SSEStreamParser
+
+HERE = Path(__file__).resolve().parent
+
+# file -> parser -> (answer chars, answer sha256[:16], citations, citations sha256[:16])
+EXPECTED = {
+    "sample_eventStream.jsonl": {
+        "sse": (1168, "efd21868b4870e19", 38, "8809ba903bc4d8d1"),
+        "delta": (1168, "efd21868b4870e19", 30, "468df6447450671e"),
+    },
+    "sample_response.jsonl": {
+        "sse": (2311, "e061da35dff1c282", 82, "ca95b54eb5cfd928"),
+        "delta": (2204, "5d280d5e1bfe3722", 78, "8dba6013d246f397"),
+    },
+}
+
+PARSERS = {"sse": SSEStreamParser, "delta": DeltaStreamParser}
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _parse(kind: str, body: bytes, chunk_max: int = 0, seed: int = 0) -> Tuple[str, List[str]]:
+    parser = PARSERS[kind]()
+    if chunk_max:
+        rng = random.Random(seed)
+        pos = 0
+        while pos < len(body):
+            step = rng.randint(1, chunk_max)
+            parser.feed(body[pos : pos + step])
+            pos += step
+    else:
+        parser.feed(body)
+    parser.close()
+    return parser.answer, parser.citations
+
+
+def _check(name: str, kind: str) -> None:
+    body = (HERE / name).read_bytes()
+    answer, citations = _parse(kind, body)
+    got = (len(answer), _digest(answer), len(citations), _digest("\n".join(citations)))
+    assert got == EXPECTED[name][kind], f"{name} {kind}: got {got}, expected {EXPECTED[name][kind]}"
+    assert len(set(citations)) == len(citations), f"{name} {kind}: duplicate citations"
+    for seed, chunk_max in ((1, 7), (2, 64), (3, 4096)):
+        assert _parse(kind, body, chunk_max, seed) == (answer, citations), (
+            f"{name} {kind}: chunks of up to {chunk_max} bytes changed the result"
+        )
+
+
+def test_event_stream_sse():
+    _check("sample_eventStream.jsonl", "sse")
+
+
+def test_event_stream_delta():
+    _check("sample_eventStream.jsonl", "delta")
+
+
+def test_response_sse():
+    _check("sample_response.jsonl", "sse")
+
+
+def test_response_delta():
+    _check("sample_response.jsonl", "delta")
+
+
+def test_delta_citations_are_a_subset():
+    for name in EXPECTED:
+        body = (HERE / name).read_bytes()
+        _, sse = _parse("sse", body)
+        _, delta = _parse("delta", body)
+        extra = [url for url in sse if url not in delta]
+        assert set(delta) <= set(sse), f"{name}: delta cites URLs the SSE scan does not see"
+        for url in extra:
+            # Either a thumbnail or the utm-stripped form of a URL already cited.
+            assert url.startswith("https://images.openai.com/") or any(
+                d.startswith(url) and "utm_source=chatgpt.com" in d for d in delta
+            ), f"{name}: unexpected SSE-only citation {url}"
+
+
+if __name__ == "__main__":
+    failed = 0
+    for fn in [v for k, v in sorted(globals().items()) if k.startswith("test_")]:
+        try:
+            fn()
+        except AssertionError as e:
+            failed += 1
+            print(f"[PARSERS] {fn.__name__} FAILED: {e}")
+        else:
+            print(f"[PARSERS] {fn.__name__} ok")
+    raise SystemExit(1 if failed else 0)
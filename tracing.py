@@ -0,0 +1,248 @@
+"""
+Per-phase latency spans for browser sessions and prompts.
+
+Each span is one JSONL row in TRACE_LOG (default screenshots/trace.jsonl;
+TRACE_LOG=0 turns tracing off):
+
+    {"ts": 1760000000.1, "pid": 123, "worker": "2", "session": "123-1760000000000",
+     "scope": "prompt", "prompt_id": "42", "phase": "first_byte", "dur_ms": 2310.4, "ok": true}
+
+Session phases (test6, once per browser start): sb_launch,
+activate_cdp_mode, connect_over_cdp, url_open, is_popups_visible,
+is_chat_ui_visible, activate_search_mode.
+
+Prompt phases:
+- claim: wait in PromptPrefetcher.next()
+- new_chat: empty temporary chat before the prompt (chat_reset, with
+  NEW_CHAT_PER_PROMPT=1)
+- typing, submit: enter_prompt / ChatTabs.submit
+- first_byte, stream_end: from the send click to the first stream chunk and
+  to the terminal marker (or the end of resp.body())
+- parse: DeltaStreamParser time
+- metrics, db_write: in the result writer
+
+The claim, db_write, first_byte and stream_end spans also feed the
+live_metrics histograms. That happens even with TRACE_LOG=0.
+
+Spans opened while `tracer.prompt_id` is set carry that prompt id. test6 sets
+it around each prompt. The result writer passes ids explicitly because it
+runs on its own thread.
+
+    python tracing.py                            # p50/p95/p99 per phase, all runs
+    python tracing.py workers/*/screenshots/trace.jsonl --since-hours 24
+    python tracing.py --by-worker
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import live_metrics
+
+DEFAULT_LOG = "screenshots/trace.jsonl"
+
+SESSION_PHASES = (
+    "sb_launch",
+    "activate_cdp_mode",
+    "connect_over_cdp",
+    "url_open",
+    "is_popups_visible",
+    "is_chat_ui_visible",
+    "activate_search_mode",
+)
+PROMPT_PHASES = ("claim", "new_chat", "typing", "submit", "first_byte", "stream_end", "parse", "metrics", "db_write")
+
+
+class Tracer:
+    """span(phase) context manager / record(phase, duration_s) -> one JSONL row each."""
+
+    def __init__(self, path: Optional[str] = None):
+        log = path if path is not None else os.getenv("TRACE_LOG", DEFAULT_LOG)
+        self.path = Path(log) if (log or "").strip().lower() not in ("", "0", "false", "off", "none") else None
+        self.worker = os.getenv("WORKER_ID")
+        self.session: Optional[str] = None
+        self.prompt_id: Optional[str] = None
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def start_session(self) -> str:
+        self.session = f"{os.getpid()}-{int(time.time() * 1000)}"
+        self.prompt_id = None
+        return self.session
+
+    def record(
+        self,
+        phase: str,
+        duration_s: Optional[float],
+        start: Optional[float] = None,
+        prompt_id: Any = None,
+        ok: bool = True,
+        **attrs: Any,
+    ) -> None:
+        """One span that already happened; durations of None (phase not observed) are dropped."""
+        if duration_s is None:
+            return
+        live_metrics.observe_phase(phase, duration_s)
+        if self.path is None:
+            return
+        prompt_id = prompt_id if prompt_id is not None else self.prompt_id
+        row = {
+            "ts": start if start is not None else time.time() - duration_s,
+            "pid": os.getpid(),
+            "worker": self.worker,
+            "session": self.session,
+            "scope": "prompt" if prompt_id is not None else "session",
+            "prompt_id": str(prompt_id) if prompt_id is not None else None,
+            "phase": phase,
+            "dur_ms": round(max(0.0, duration_s) * 1000.0, 1),
+            "ok": ok,
+            **attrs,
+        }
+        line = json.dumps(row, default=str) + "\n"
+        try:
+            with self._lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with self.path.open("a", encoding="utf-8") as f:
+                    f.write(line)
+        except Exception as e:
+            if not self._warned:
+                self._warned = True
+                print(f"[TRACE] Could not write {self.path}: {e}")
+
+    @contextmanager
+    def span(self, phase: str, prompt_id: Any = None, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        """Time the block; it is recorded with ok=False if it raises. Yields attrs for the block to extend."""
+        start = time.time()
+        t0 = time.perf_counter()
+        ok = True
+        try:
+            yield attrs
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            self.record(phase, time.perf_counter() - t0, start=start, prompt_id=prompt_id, ok=ok, **attrs)
+
+    def stream(self, record: Any, sent_at: Optional[float], prompt_id: Any = None, **attrs: Any) -> None:
+        """first_byte / stream_end / parse spans from a stream_capture.StreamRecord."""
+        if record is None:
+            return
+        origin = sent_at if sent_at is not None else (record.sent_at or record.started_at)
+        end_at = record.terminal_at if record.terminal_at is not None else record.closed_at
+        if record.first_chunk_at is not None:
+            self.record("first_byte", record.first_chunk_at - origin, start=origin, prompt_id=prompt_id, **attrs)
+        if end_at is not None:
+            self.record("stream_end", end_at - origin, start=origin, prompt_id=prompt_id, ok=record.done, **attrs)
+        self.record("parse", record.parse_s, prompt_id=prompt_id, bytes=record.parser.bytes_fed, **attrs)
+
+
+tracer = Tracer()
+
+
+# ------------------------------------------------------------------ summary
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _load(paths: List[str], since: Optional[float]) -> Iterator[Dict[str, Any]]:
+    for path in paths:
+        try:
+            f = open(path, encoding="utf-8")
+        except OSError as e:
+            print(f"[TRACE] {path}: {e}")
+            continue
+        with f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if since is not None and float(row.get("ts") or 0) < since:
+                    continue
+                yield row
+
+
+def summarize(rows: Iterator[Dict[str, Any]], by_worker: bool = False) -> List[Dict[str, Any]]:
+    groups: Dict[tuple, List[float]] = defaultdict(list)
+    failed: Dict[tuple, int] = defaultdict(int)
+    for row in rows:
+        key = (row.get("worker") if by_worker else None, row.get("scope"), row.get("phase"))
+        groups[key].append(float(row.get("dur_ms") or 0.0))
+        if row.get("ok") is False:
+            failed[key] += 1
+
+    order = {phase: i for i, phase in enumerate(SESSION_PHASES + PROMPT_PHASES)}
+    out = []
+    for key in sorted(groups, key=lambda k: (str(k[0]), k[1] != "session", order.get(k[2], len(order)), k[2])):
+        values = sorted(groups[key])
+        out.append(
+            {
+                "worker": key[0],
+                "scope": key[1],
+                "phase": key[2],
+                "n": len(values),
+                "failed": failed[key],
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+                "mean_ms": round(sum(values) / len(values), 1),
+                "max_ms": values[-1],
+            }
+        )
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="p50/p95/p99 per phase from trace JSONL files")
+    parser.add_argument("paths", nargs="*", help=f"trace files or globs (default: TRACE_LOG or {DEFAULT_LOG})")
+    parser.add_argument("--since-hours", type=float, default=None, help="only spans from the last N hours")
+    parser.add_argument("--by-worker", action="store_true", help="one table per WORKER_ID")
+    parser.add_argument("--json", action="store_true", help="print the summary rows as JSON")
+    args = parser.parse_args()
+
+    patterns = args.paths or [os.getenv("TRACE_LOG", DEFAULT_LOG)]
+    paths = sorted({p for pattern in patterns for p in (glob.glob(pattern) or [pattern])})
+    since = time.time() - args.since_hours * 3600.0 if args.since_hours else None
+    rows = summarize(_load(paths, since), by_worker=args.by_worker)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    if not rows:
+        print("[TRACE] No spans found")
+        return 1
+
+    def fmt(ms: float) -> str:
+        return f"{ms / 1000.0:.2f}s" if ms >= 1000 else f"{ms:.0f}ms"
+
+    header = f"{'scope':<8} {'phase':<22} {'n':>6} {'fail':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9} {'max':>9}"
+    worker = object()
+    for row in rows:
+        if row["worker"] != worker:
+            worker = row["worker"]
+            if args.by_worker:
+                print(f"\nworker {worker or '-'}")
+            print(header)
+        print(
+            f"{row['scope'] or '-':<8} {row['phase']:<22} {row['n']:>6} {row['failed']:>5} "
+            f"{fmt(row['p50_ms']):>9} {fmt(row['p95_ms']):>9} {fmt(row['p99_ms']):>9} "
+            f"{fmt(row['mean_ms']):>9} {fmt(row['max_ms']):>9}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())